@@ -1,3 +1,97 @@
+import io
+
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .models import Organization, UserProfile
 
 # Register your models here.
+
+
+class OrganizationImportUploadForm(forms.Form):
+    file = forms.FileField(label='Archivo CSV o NDJSON',
+                           help_text='Columnas: name, type, website, phone, nit, services')
+    owner = forms.CharField(label='Usuario dueño', max_length=150)
+
+    def clean_file(self):
+        from .uploads import OversizedUpload
+
+        upload = self.cleaned_data['file']
+        # Un archivo descartado por tamaño no tiene contenido que leer
+        if isinstance(upload, OversizedUpload) or upload.file is None:
+            raise forms.ValidationError('El archivo es demasiado grande o llegó incompleto; vuelva a subirlo.')
+        return upload
+
+    def clean_owner(self):
+        try:
+            return UserProfile.objects.get(user__username=self.cleaned_data['owner'])
+        except UserProfile.DoesNotExist:
+            raise forms.ValidationError('El usuario no existe o no tiene perfil.')
+
+
+@admin.register(Organization)
+class OrganizationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'type', 'nit', 'website', 'owner_username')
+    search_fields = ('name', 'nit')
+    change_list_template = 'admin/Empresa/organization/change_list.html'
+    # Las etiquetas se derivan del texto de ``services`` (ver save_related)
+    exclude = ('service_tags',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_owner_list()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Igual que OrganizationForm: service_tags y los conteos de facetas siguen al texto
+        form.instance.set_services(form.instance.services)
+
+    @admin.display(description='Dueño', ordering='owner__user__username')
+    def owner_username(self, obj):
+        return obj.owner.user.username
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='Empresa_organization_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Importación en bloque desde CSV o NDJSON (ver Apps/Empresa/importer.py)"""
+        # El importador (csv y los formularios de validación) se carga solo al usarlo
+        from .importer import detect_format, import_organizations
+
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = OrganizationImportUploadForm(request.POST or None, request.FILES or None,
+                                            initial={'owner': request.user.get_username()})
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            rejects = io.StringIO()
+            try:
+                result = import_organizations(stream, detect_format(upload.name), form.cleaned_data['owner'],
+                                              rejects=rejects)
+            except (ValueError, UnicodeDecodeError) as exc:
+                form.add_error('file', str(exc))
+            else:
+                self.message_user(request, '%d organizaciones importadas, %d filas rechazadas (%d por NIT repetido).' % (
+                    result.created, result.rejected, result.duplicates))
+                if result.rejected:
+                    # Se descarga el CSV de rechazos; el mensaje se ve al volver al admin
+                    response = HttpResponse(rejects.getvalue(), content_type='text/csv; charset=utf-8')
+                    response['Content-Disposition'] = 'attachment; filename="rechazos.csv"'
+                    return response
+                return redirect('admin:Empresa_organization_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar organizaciones',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/Empresa/organization/import.html', context)
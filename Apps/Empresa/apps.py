@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class EmpresaConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'Apps.Empresa'
+    label = 'Empresa'
+
+    def ready(self):
+        # Registra los receptores de señales (índice de búsqueda, etc.)
+        from . import signals  # noqa: F401
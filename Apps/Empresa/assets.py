@@ -0,0 +1,131 @@
+"""
+Pipeline de archivos estáticos.
+
+* ``CompressedManifestStaticFilesStorage``: ``collectstatic`` copia cada
+  archivo con el hash de su contenido en el nombre (``layout.3f2a9c1b7d4e.css``)
+  y además deja copias ``.gz`` y ``.br`` de los archivos de texto.
+* ``serve``: sirve ``STATIC_ROOT`` eligiendo la copia comprimida según
+  ``Accept-Encoding``. Los nombres con hash no cambian nunca de contenido, así
+  que se envían con ``Cache-Control: immutable`` y un año de vigencia. Se
+  activa con ``EMPRESA_SERVE_STATIC`` cuando no hay un servidor web delante.
+* ``read_static``: contenido de un estático para insertarlo en línea (CSS
+  crítico de los feeds, ver ``templatetags/empresa_static.py``).
+
+El comando ``benchmark_static`` mide los bytes transferidos por página.
+"""
+import functools
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# Extensiones que vale la pena comprimir; imágenes y fuentes ya lo están
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.xml', '.html')
+# Por debajo de este tamaño la copia comprimida no ahorra una ida y vuelta
+MIN_COMPRESS_SIZE = 256
+# (Accept-Encoding, sufijo del archivo) en orden de preferencia
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+
+def get_max_age():
+    return getattr(settings, 'EMPRESA_STATIC_MAX_AGE', 60 * 60 * 24 * 365)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        # Sin el paquete Brotli solo se generan las copias .gz
+        return None
+    return brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """``ManifestStaticFilesStorage`` que además comprime los archivos con hash"""
+
+    def stored_name(self, name):
+        # Sin collectstatic (desarrollo, tests) no hay manifiesto: se usa el nombre original
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if not dry_run:
+            self.compress_files(set(self.hashed_files.values()))
+
+    def compress_files(self, names):
+        brotli = _brotli()
+        for name in sorted(names):
+            if not name.endswith(COMPRESSED_EXTENSIONS):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            if len(content) < MIN_COMPRESS_SIZE:
+                continue
+            compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['.br'] = brotli.compress(content)
+            for suffix, data in compressed.items():
+                # Solo se guarda la copia si realmente es más chica
+                if len(data) < len(content) * 0.95:
+                    with open(self.path(name + suffix), 'wb') as target:
+                        target.write(data)
+
+
+def _pick_encoding(request, fullpath):
+    accepted = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return encoding, fullpath + suffix
+    return None, fullpath
+
+
+@require_safe
+def serve(request, path):
+    """Sirve un archivo de ``STATIC_ROOT`` comprimido y con cabeceras de caché"""
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if path.endswith(tuple(suffix for _, suffix in ENCODINGS)) or not os.path.isfile(fullpath):
+        raise Http404
+    encoding, chosen = _pick_encoding(request, fullpath)
+    stat = os.stat(chosen)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = FileResponse(open(chosen, 'rb'), content_type=content_type)
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    if HASHED_NAME_RE.search(path):
+        response['Cache-Control'] = 'public, max-age=%d, immutable' % get_max_age()
+    else:
+        # Sin hash el contenido puede cambiar en el próximo despliegue
+        response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+@functools.lru_cache(maxsize=None)
+def read_static(path):
+    """Contenido de un estático de las apps (para insertarlo en línea)"""
+    fullpath = finders.find(path)
+    if fullpath is None:
+        raise ValueError('No se encontró el estático %s' % path)
+    with open(fullpath, encoding='utf-8') as source:
+        return source.read()
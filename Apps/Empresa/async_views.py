@@ -0,0 +1,181 @@
+"""
+Versiones asíncronas de las vistas de lectura: ``dashboard``, ``public_feed``,
+``dashboard_feed`` y los fragmentos del scroll infinito.
+
+Se activan con ``EMPRESA_ASYNC_VIEWS = True`` (ver ``Apps/Empresa/urls.py``)
+cuando el proyecto corre bajo ASGI (``ProjectOpp/asgi.py``). Así la petición
+no pasa completa por el executor de hilos de ``sync_to_async``: las lecturas
+de caché y las consultas se esperan sin ocupar el event loop.
+
+Las consultas que no dependen entre sí (perfil y organización del usuario,
+recientes, página, total y facetas) corren a la vez con ``asyncio.gather``.
+El ORM async de Django 4.2 las ejecutaría todas en el único hilo de la
+petición (``thread_sensitive``), así que cada grupo corre con
+``routers.in_own_connection`` en un hilo del pool con su propia conexión: una
+petición puede usar varias conexiones a la vez (tenerlo en cuenta con
+``CONN_MAX_AGE`` y pgbouncer). Esas conexiones no verían una transacción sin
+confirmar del hilo de la petición; Django no permite ``ATOMIC_REQUESTS`` en
+vistas asíncronas. Bajo WSGI conviene mantener las vistas síncronas de
+``views.py``.
+
+Con Django 4.2 el usuario de la sesión todavía se resuelve de forma síncrona.
+Los templates se renderizan con ``sync_to_async`` y todos los datos ya
+cargados. El middleware de instrumentación es síncrono y solo cuenta las
+consultas del hilo de la petición: con ``EMPRESA_QUERY_INSTRUMENTATION``
+activo la pila deja de ser completamente asíncrona y los presupuestos no
+incluyen las consultas de los otros hilos.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from .caching import acached_feed_page, acard_context, aget_recent_organizations
+from .facets import facet_context, parse_facets
+from .models import OrganizationFeedEntry, UserProfile
+from .page_cache import anonymous_page_cache, feed_key
+from .routers import in_own_connection, use_replica
+from .pagination import apaginate_organizations, apaginate_search
+from .search import parse_query
+from .views import _feed_context
+
+
+def _resolve_user(request):
+    # request.user es perezoso: cargarlo lee la sesión y el usuario
+    request.user.is_authenticated
+    return request.user
+
+
+async def _get_user(request):
+    return await sync_to_async(_resolve_user)(request)
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def _cache_profile(user, profile):
+    # Los templates leen user.profile; se deja en caché (aunque sea None)
+    UserProfile.user.field.remote_field.set_cached_value(user, profile)
+
+
+async def _profile_and_organization(user):
+    """Perfil del usuario y su primera organización"""
+    profile_relation = UserProfile.user.field.remote_field
+    if profile_relation.is_cached(user):
+        # Apps.Empresa.auth.CachedModelBackend ya trajo el perfil con el usuario
+        profile = profile_relation.get_cached_value(user)
+        if profile is None:
+            return None, None
+        return profile, await OrganizationFeedEntry.objects.filter(owner=profile).afirst()
+    profile = await UserProfile.objects.filter(user=user).afirst()
+    return profile, await OrganizationFeedEntry.objects.filter(owner__user=user).afirst()
+
+
+async def _feed_page(request, user, fragment_url_name):
+    search_query = request.GET.get('search', '')
+    cursor = request.GET.get('cursor')
+    facets = parse_facets(request.GET)
+
+    async def build_page():
+        if parse_query(search_query):
+            return await apaginate_search(search_query, cursor, facets=facets)
+        return await apaginate_organizations(cursor, facets=facets)
+
+    if user.is_authenticated:
+        page = await build_page()
+    else:
+        page = await acached_feed_page(search_query, cursor, build_page, facets)
+
+    context = _feed_context(page, search_query, fragment_url_name, facets)
+    context.update(await acard_context(page.organizations))
+    return context
+
+
+async def dashboard(request):
+    user = await _get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    (user_profile, organization), recent_organizations = await asyncio.gather(
+        _profile_and_organization(user), aget_recent_organizations())
+    if user_profile is None:
+        # Si el usuario no tiene perfil, crear uno
+        user_profile = await UserProfile.objects.acreate(
+            user=user,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name
+        )
+        organization = None
+    _cache_profile(user, user_profile)
+
+    context = {
+        'user_profile': user_profile,
+        'organization': organization,
+        'recent_organizations': recent_organizations,
+    }
+    context.update(await acard_context(recent_organizations))
+    return await _render(request, 'dashboard.html', context)
+
+
+async def _public_facets(request):
+    return await in_own_connection(facet_context)(
+        parse_facets(request.GET), request.GET.get('search', ''), reverse('public_feed'))
+
+
+@use_replica
+@anonymous_page_cache(feed_key)
+async def public_feed(request):
+    user = await _get_user(request)
+    if not user.is_authenticated:
+        context, facets = await asyncio.gather(
+            _feed_page(request, user, 'public_feed_page'), _public_facets(request))
+        context.update(facets)
+        return await _render(request, 'organization/public_feed.html', context)
+
+    context, facets, (user_profile, organization) = await asyncio.gather(
+        _feed_page(request, user, 'public_feed_page'), _public_facets(request),
+        _profile_and_organization(user))
+    context.update(facets)
+    _cache_profile(user, user_profile)
+    if user_profile is not None:
+        context.update({
+            'user_profile': user_profile,
+            'organization': organization,
+        })
+    return await _render(request, 'organization/public_feed.html', context)
+
+
+@use_replica
+async def public_feed_page(request):
+    user = await _get_user(request)
+    context = await _feed_page(request, user, 'public_feed_page')
+    return await _render(request, 'organization/feed_cards.html', context)
+
+
+async def dashboard_feed(request):
+    user = await _get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    context, (user_profile, organization) = await asyncio.gather(
+        _feed_page(request, user, 'dashboard_feed_page'), _profile_and_organization(user))
+    if user_profile is None:
+        return redirect('dashboard')
+    _cache_profile(user, user_profile)
+    context.update({
+        'user_profile': user_profile,
+        'organization': organization,
+    })
+    return await _render(request, 'organization/dashboard_feed.html', context)
+
+
+async def dashboard_feed_page(request):
+    user = await _get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    context = await _feed_page(request, user, 'dashboard_feed_page')
+    return await _render(request, 'organization/feed_cards.html', context)
@@ -0,0 +1,77 @@
+"""
+Backend de autenticación que guarda en caché el usuario de la sesión junto
+con su perfil.
+
+``AuthenticationMiddleware`` llama a ``get_user()`` del backend en cada
+petición autenticada. Aquí el usuario sale de la caché o de una sola
+consulta ``User`` + ``UserProfile`` (``select_related('profile')``), así
+``request.user.profile`` en las vistas y en ``base.html`` no consulta la base.
+
+En la caché solo quedan los valores de las columnas sin la contraseña y el
+hash de sesión ya calculado: el usuario se arma con la contraseña diferida
+(``save()`` no la sobrescribe y ``check_password`` la consulta si hace falta)
+y Django verifica la sesión contra ese hash.
+
+Las señales de ``Apps/Empresa/signals.py`` y el procesamiento de imágenes
+invalidan la entrada al guardar o borrar el usuario o su perfil
+(``UserProfileForm.save()`` guarda ambos). Con una caché local cada worker
+solo ve sus propias invalidaciones: ``EMPRESA_USER_CACHE_TIMEOUT`` es corto
+para que un cambio hecho en otro proceso (una contraseña nueva, un usuario
+desactivado) se note en segundos.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import router
+
+from .caching import USER_KEY, user_timeout
+from .models import UserProfile
+
+UserModel = get_user_model()
+
+
+def _values(instance, exclude=()):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields
+            if field.attname not in exclude}
+
+
+def _build(model, values):
+    # Las columnas que faltan (la contraseña) quedan diferidas
+    return model.from_db(router.db_for_read(model), list(values), list(values.values()))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = USER_KEY % user_id
+        cached = cache.get(key)
+        if cached is None:
+            user = UserModel._default_manager.select_related('profile').filter(pk=user_id).first()
+            if user is None:
+                return None
+            profile = getattr(user, 'profile', None)
+            cached = {
+                'user': _values(user, exclude=('password',)),
+                'profile': _values(profile) if profile is not None else None,
+                'session_hash': user.get_session_auth_hash(),
+            }
+            cache.set(key, cached, user_timeout())
+        user = self.build_user(cached)
+        return user if self.user_can_authenticate(user) else None
+
+    def build_user(self, cached):
+        user = _build(UserModel, cached['user'])
+        # Sin perfil se guarda la ausencia, igual que con select_related
+        profile = _build(UserProfile, cached['profile']) if cached['profile'] is not None else None
+        user._state.fields_cache['profile'] = profile
+        if profile is not None:
+            profile._state.fields_cache['user'] = user
+        session_hash = cached['session_hash']
+
+        def get_session_auth_hash():
+            # Tras set_password() el hash se calcula con la contraseña nueva
+            if 'password' in user.get_deferred_fields():
+                return session_hash
+            return UserModel.get_session_auth_hash(user)
+
+        user.get_session_auth_hash = get_session_auth_hash
+        return user
@@ -0,0 +1,44 @@
+"""
+Utilidades comunes de los comandos de benchmark.
+"""
+import json
+import math
+import time
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano de una lista de valores"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """Resume una lista de latencias (en segundos) en milisegundos"""
+    total = sum(latencies)
+    return {
+        'samples': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else None,
+        'throughput_per_s': round(len(latencies) / total, 2) if total else None,
+    }
+
+
+def timed(function, *args, **kwargs):
+    """Ejecuta ``function`` y retorna ``(resultado, segundos)``"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def dump(report, stream, path=None):
+    """Escribe el reporte como JSON en ``stream`` y opcionalmente en ``path``"""
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    stream.write(text)
+    if path:
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(text)
@@ -0,0 +1,182 @@
+"""
+Caché de los feeds de organizaciones.
+
+* Tarjetas: el HTML de cada tarjeta se guarda (``Apps/Empresa/cards.py``)
+  usando como clave el id de la organización y su versión, un hash de lo que
+  muestra la tarjeta. Cualquier cambio de la fila cambia la versión en todos
+  los procesos, así la tarjeta anterior deja de usarse.
+* Organizaciones recientes: la consulta de las 6 más recientes del dashboard,
+  bajo la versión del directorio.
+* Feed público: las páginas del feed para visitantes anónimos por búsqueda
+  normalizada y cursor, bajo la versión del directorio.
+* Facetas: los tipos y servicios más frecuentes con su conteo, bajo la
+  versión del directorio.
+* Usuario de la sesión con su perfil (ver ``Apps/Empresa/auth.py``).
+
+La versión del directorio (``directory_version()``) es el último cambio de
+``OrganizationChange``: sale de la base de datos, así todos los procesos
+ven la misma aunque la caché sea local a cada uno. Cada proceso la recuerda
+``EMPRESA_DIRECTORY_VERSION_TTL`` segundos para no consultarla varias veces
+por petición; sus propios cambios la olvidan de inmediato.
+
+Las invalidaciones las disparan las señales de ``Apps/Empresa/signals.py``.
+"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import in_own_connection
+from .search import parse_query
+
+RECENT_KEY = 'empresa:recent-organizations:%s'
+COUNT_KEY = 'empresa:feed:count:%s'
+FACETS_KEY = 'empresa:facets:%s'
+USER_KEY = 'empresa:user:%s'
+
+RECENT_LIMIT = 6
+FACET_LIMIT = 12
+
+
+def card_timeout():
+    return getattr(settings, 'EMPRESA_CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def feed_timeout():
+    return getattr(settings, 'EMPRESA_FEED_CACHE_TIMEOUT', 300)
+
+
+def user_timeout():
+    return getattr(settings, 'EMPRESA_USER_CACHE_TIMEOUT', 30)
+
+
+def version_ttl():
+    return getattr(settings, 'EMPRESA_DIRECTORY_VERSION_TTL', 1)
+
+
+class DirectoryVersion(namedtuple('DirectoryVersion', 'sequence changed_at')):
+    """Secuencia y fecha del último cambio de organizaciones (``0`` y ``None`` sin cambios)"""
+
+    @property
+    def token(self):
+        # La fecha distingue una secuencia reutilizada (SQLite tras revertir o
+        # una base restaurada) de la original
+        if self.changed_at is None:
+            return '0'
+        return '%d.%d' % (self.sequence, self.changed_at.timestamp() * 10 ** 6)
+
+
+_version_lock = threading.Lock()
+_memo = {'expires': 0, 'version': None}
+
+
+def directory_version():
+    """Versión del directorio: cambia cada vez que se crea, edita o borra una organización"""
+    with _version_lock:
+        if _memo['version'] is not None and time.monotonic() < _memo['expires']:
+            return _memo['version']
+    from .models import OrganizationChange
+    latest = OrganizationChange.objects.newest_first().values_list('sequence', 'changed_at').first()
+    version = DirectoryVersion(*latest) if latest else DirectoryVersion(0, None)
+    with _version_lock:
+        _memo.update(expires=time.monotonic() + version_ttl(), version=version)
+    return version
+
+
+def forget_directory_version():
+    """Olvida la versión recordada: la siguiente lectura vuelve a consultarla"""
+    with _version_lock:
+        _memo.update(expires=0, version=None)
+
+
+def card_context(organizations):
+    """Agrega ``card_version`` a cada organización y retorna el contexto que
+    necesita ``organization/feed_cards.html``"""
+    from .cards import card_version
+    for organization in organizations:
+        organization.card_version = card_version(organization)
+    return {'card_cache_timeout': card_timeout()}
+
+
+def get_recent_organizations():
+    key = RECENT_KEY % directory_version().token
+    organizations = cache.get(key)
+    if organizations is None:
+        from .models import OrganizationFeedEntry
+        organizations = list(OrganizationFeedEntry.objects.order_by('-pk')[:RECENT_LIMIT])
+        cache.set(key, organizations, card_timeout())
+    return organizations
+
+
+def get_facet_counts():
+    """Tipos y servicios más frecuentes como tuplas ``(nombre, clave, conteo)``"""
+    key = FACETS_KEY % directory_version().token
+    counts = cache.get(key)
+    if counts is None:
+        from .models import Service, TypeFacet
+        fields = ('name', 'normalized_name', 'organization_count')
+        counts = {
+            'types': list(TypeFacet.objects.popular().values_list(*fields)[:FACET_LIMIT]),
+            'services': list(Service.objects.popular().values_list(*fields)[:FACET_LIMIT]),
+        }
+        cache.set(key, counts, feed_timeout())
+    return counts
+
+
+def _feed_page_key(search_query, cursor, facets=None):
+    raw = '%s|%s|%s' % (','.join(parse_query(search_query)), cursor or '', facets.key() if facets else '')
+    return 'empresa:feed:%s:%s' % (directory_version().token, hashlib.md5(raw.encode()).hexdigest())
+
+
+def cached_feed_page(search_query, cursor, build_page, facets=None):
+    """Retorna la página del feed desde caché o la construye con ``build_page``"""
+    key = _feed_page_key(search_query, cursor, facets)
+    page = cache.get(key)
+    if page is None:
+        page = build_page()
+        cache.set(key, page, feed_timeout())
+    return page
+
+
+# Versiones para las vistas asíncronas (Apps/Empresa/async_views.py)
+
+async def acard_context(organizations):
+    return card_context(organizations)
+
+
+async def aget_recent_organizations():
+    # Con su propia conexión: la vista la espera junto con las demás consultas
+    return await in_own_connection(get_recent_organizations)()
+
+
+async def acached_feed_page(search_query, cursor, build_page, facets=None):
+    """Como ``cached_feed_page`` pero ``build_page`` es una corrutina"""
+    key = await sync_to_async(_feed_page_key)(search_query, cursor, facets)
+    page = await cache.aget(key)
+    if page is None:
+        page = await build_page()
+        await cache.aset(key, page, feed_timeout())
+    return page
+
+
+def invalidate_organization(pk):
+    """Invalida lo que depende de la organización ``pk``: todo lo cacheado del
+    directorio cuelga de su versión, que este proceso vuelve a consultar"""
+    forget_directory_version()
+
+
+def invalidate_all():
+    """Invalida las facetas y el total tras cargas en bloque o reconstrucciones
+    (las páginas del feed y las recientes cambian de versión con cada cambio)"""
+    forget_directory_version()
+    token = directory_version().token
+    cache.delete_many([COUNT_KEY % token, FACETS_KEY % token])
+
+
+def invalidate_user(user_id):
+    """Invalida el usuario (y su perfil) en caché de ``Apps.Empresa.auth.CachedModelBackend``"""
+    cache.delete(USER_KEY % user_id)
@@ -0,0 +1,106 @@
+"""
+Cambios de organizaciones para consumidores incrementales (índices de
+búsqueda, cachés externas, socios que sincronizan el directorio).
+
+Cada alta, modificación o baja de una ``Organization`` agrega una fila a
+``OrganizationChange`` en la misma transacción que el cambio: si se
+revierte, el cambio tampoco queda registrado. ``sequence`` es el número de
+secuencia; el consumidor guarda el último que procesó y pide los
+siguientes en lotes con ``read_changes(since)``,
+``api/organizations/changes/?since=<n>&limit=<n>`` o
+``python manage.py organization_changes --since <n>``.
+
+* Cada cambio trae el estado actual de la organización (con el formato de
+  la exportación, ver Apps/Empresa/export.py) o ``null`` si ya no existe:
+  procesar un cambio dos veces da el mismo resultado.
+* Para empezar de cero: anote ``latest_sequence()`` (``latest`` en la
+  API), haga la exportación completa y siga desde ese número.
+* Las secuencias se confirman en orden: en Postgres las asigna un trigger
+  diferido al confirmar la transacción, bajo un lock que solo dura hasta el
+  fin de ese commit (migración 0016), así las escrituras concurrentes no se
+  esperan entre sí mientras duran sus transacciones; SQLite ya serializa las
+  escrituras. Si un consumidor ve la secuencia n, todas las anteriores ya
+  están confirmadas o revertidas y no aparecerán después.
+* Los cambios y las organizaciones se leen del primario: una réplica
+  atrasada entregaría un estado anterior al del cambio.
+* ``organization_changes --prune-days <n>`` borra los cambios viejos.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import router
+from django.utils import timezone
+
+from .export import serialize_organization
+from .models import Organization, OrganizationChange
+
+# Máximo de cambios por lote que acepta ?limit=
+MAX_LIMIT = 5000
+
+ChangeBatch = namedtuple('ChangeBatch', 'changes next has_more')
+
+
+def get_batch_size():
+    return getattr(settings, 'EMPRESA_CHANGES_BATCH_SIZE', 500)
+
+
+def parse_change_params(params):
+    """Retorna ``(since, limit)`` o lanza ``ValueError`` si son inválidos"""
+    since = int(params.get('since') or 0)
+    limit = int(params['limit']) if params.get('limit') else get_batch_size()
+    if since < 0 or not 1 <= limit <= MAX_LIMIT:
+        raise ValueError('since debe ser positivo y limit estar entre 1 y %d' % MAX_LIMIT)
+    return since, limit
+
+
+def _primary():
+    return router.db_for_write(OrganizationChange)
+
+
+def latest_sequence():
+    return OrganizationChange.objects.using(_primary()).newest_first().values_list('sequence', flat=True).first() or 0
+
+
+def serialize_change(change, organization):
+    return {
+        'sequence': change.sequence,
+        'id': change.organization_id,
+        'action': change.action,
+        'changed_at': change.changed_at.isoformat(),
+        'organization': serialize_organization(organization) if organization is not None else None,
+    }
+
+
+def read_changes(since=0, limit=None):
+    """Hasta ``limit`` cambios posteriores a ``since`` y la secuencia desde la que
+    seguir. Dos consultas por lote: los cambios y las organizaciones que siguen vivas"""
+    limit = limit or get_batch_size()
+    using = _primary()
+    # Uno de más para saber si quedan cambios sin consultar otra vez
+    changes = list(OrganizationChange.objects.using(using).after(since)[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    pks = {change.organization_id for change in changes if change.action != OrganizationChange.DELETED}
+    organizations = Organization.objects.using(using).for_export().in_bulk(pks) if pks else {}
+    return ChangeBatch(
+        [serialize_change(change, organizations.get(change.organization_id)) for change in changes],
+        changes[-1].sequence if changes else since,
+        has_more,
+    )
+
+
+def changed_since(sequence, limit=MAX_LIMIT):
+    """``(ids, última secuencia)`` de las organizaciones con cambios posteriores a
+    ``sequence``, o ``None`` si son más de ``limit`` (conviene recargar todo)"""
+    changes = list(OrganizationChange.objects.using(_primary()).after(sequence)
+                   .values_list('sequence', 'organization_id')[:limit + 1])
+    if len(changes) > limit:
+        return None
+    return {pk for _, pk in changes}, changes[-1][0] if changes else sequence
+
+
+def prune_changes(older_than):
+    """Borra los cambios anteriores a ``older_than`` (un ``timedelta``)"""
+    changes = OrganizationChange.objects.using(_primary())
+    deleted, _ = changes.filter(changed_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -0,0 +1,108 @@
+"""
+Exportación del directorio de organizaciones para sincronizar con terceros.
+
+La vista ``organization_export`` transmite las organizaciones como NDJSON
+(una por línea) o como un arreglo JSON con ``StreamingHttpResponse``. Las
+filas se leen con ``.iterator(chunk_size=...)`` (cursor del lado del
+servidor en Postgres) y ``.only()``, así la memoria no crece con el tamaño
+del directorio.
+
+Las filas salen ordenadas por id y ``?since_id=<id>`` retorna solo las
+posteriores a ese id: sirve para reanudar una exportación cortada o traer
+las altas nuevas, pero no trae las ediciones ni las bajas de organizaciones
+con id menor. Para sincronizar esos cambios se usa el registro de cambios
+(``Apps/Empresa/changes.py``): se anota su última secuencia, se exporta
+todo y se siguen los cambios desde esa secuencia.
+
+El ETag depende de la versión del directorio (``caching.directory_version``,
+el último cambio registrado, igual en todos los procesos) y de los
+parámetros, así un cliente sin cambios recibe 304 con ``If-None-Match``.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+from .caching import directory_version
+from .models import Organization
+from .routers import read_alias
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+# Filas por cada bloque que se escribe en la respuesta
+ROWS_PER_WRITE = 200
+
+
+def get_chunk_size():
+    return getattr(settings, 'EMPRESA_EXPORT_CHUNK_SIZE', 2000)
+
+
+def parse_export_params(params):
+    """Retorna ``(formato, since_id)`` o lanza ``ValueError`` si son inválidos"""
+    export_format = params.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        raise ValueError('Formato no soportado: %s' % export_format)
+    since_id = params.get('since_id')
+    if since_id in (None, ''):
+        return export_format, None
+    since_id = int(since_id)
+    if since_id < 0:
+        raise ValueError('since_id debe ser positivo')
+    return export_format, since_id
+
+
+def export_etag(params):
+    raw = '%s|%s|%s' % (directory_version().token, params.get('format', 'ndjson'), params.get('since_id', ''))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def export_queryset(since_id=None):
+    # La respuesta se transmite después de salir de la vista: la réplica se elige aquí
+    queryset = Organization.objects.using(read_alias()).for_export()
+    if since_id is not None:
+        queryset = queryset.filter(pk__gt=since_id)
+    return queryset
+
+
+def serialize_organization(organization):
+    return {
+        'id': organization.pk,
+        'name': organization.name,
+        'type': organization.type,
+        'website': organization.website,
+        'phone': organization.phone,
+        'nit': organization.nit,
+        'services': organization.get_services_list(),
+        'logo': organization.logo.url if organization.logo else None,
+    }
+
+
+def _dumps(organization):
+    return json.dumps(serialize_organization(organization), ensure_ascii=False, separators=(',', ':'))
+
+
+def _batched(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_ndjson(queryset, chunk_size=None):
+    rows = queryset.iterator(chunk_size=chunk_size or get_chunk_size())
+    yield from _batched(_dumps(organization) + '\n' for organization in rows)
+
+
+def stream_json(queryset, chunk_size=None):
+    rows = queryset.iterator(chunk_size=chunk_size or get_chunk_size())
+    yield '['
+    yield from _batched(('' if index == 0 else ',') + _dumps(organization)
+                        for index, organization in enumerate(rows))
+    yield ']\n'
@@ -0,0 +1,128 @@
+"""
+Filtros por facetas del directorio: tipo de organización y servicios.
+
+Los feeds aceptan ``?type=<tipo>`` y uno o más ``?service=<servicio>``; una
+organización debe cumplir todos los filtros. Los conteos que se muestran
+junto a cada filtro no se calculan con ``GROUP BY`` en cada petición:
+
+* servicios: ``Service.organization_count``, que mantienen las señales
+  ``m2m_changed`` de ``Organization.service_tags``.
+* tipos: ``TypeFacet.organization_count``, que las señales de
+  ``Organization`` ajustan al crear, cambiar de tipo o borrar.
+
+Ambos se reconstruyen desde cero con ``python manage.py rebuild_facets``.
+
+Las claves de tipo y de servicio pasan por ``normalize_service_name``
+(minúsculas y sin tildes, igual que el índice de búsqueda en memoria), así
+``?type=tecnologia`` y ``?type=Tecnología`` filtran lo mismo con cualquier
+motor de búsqueda.
+"""
+from collections import namedtuple
+
+from django.utils.http import urlencode
+
+from .caching import get_facet_counts
+from .models import Service, TypeFacet, normalize_service_name, split_services
+
+# Servicios que se aceptan a la vez en un filtro
+MAX_SERVICES = 5
+
+
+class Facets(namedtuple('Facets', ['type', 'services'])):
+    """Filtros activos, con los valores ya normalizados"""
+    __slots__ = ()
+
+    def __bool__(self):
+        return bool(self.type or self.services)
+
+    def key(self):
+        """Texto estable para las claves de caché"""
+        return '%s|%s' % (self.type, ','.join(self.services))
+
+    def params(self):
+        """Pares ``(nombre, valor)`` para reconstruir la URL"""
+        params = [('type', self.type)] if self.type else []
+        return params + [('service', service) for service in self.services]
+
+    def toggle_type(self, key):
+        return self._replace(type='' if key == self.type else key)
+
+    def toggle_service(self, key):
+        if key in self.services:
+            return self._replace(services=tuple(service for service in self.services if service != key))
+        return self._replace(services=tuple(sorted(self.services + (key,)))[:MAX_SERVICES])
+
+    def filter(self, queryset):
+        """Aplica los filtros a un queryset de ``OrganizationFeedEntry``"""
+        if self.type:
+            # Los formularios ya quitan los espacios de los extremos del tipo
+            queryset = queryset.of_type(self.type)
+        for service in self.services:
+            # Un join por servicio: la organización debe tener todos
+            queryset = queryset.offering(service)
+        return queryset
+
+    def matches(self, organization_type, services):
+        """Si una organización con ese tipo y texto de servicios cumple los filtros
+        (lo usa el índice en memoria de ``PythonSearchBackend``). Compara las
+        mismas claves que ``filter`` busca en ``type_key`` y ``normalized_name``"""
+        if self.type and normalize_service_name(organization_type or '') != self.type:
+            return False
+        if self.services:
+            offered = {normalize_service_name(service) for service in split_services(services)}
+            return offered.issuperset(self.services)
+        return True
+
+
+NO_FACETS = Facets('', ())
+
+
+def parse_facets(params):
+    """Retorna los ``Facets`` de un ``QueryDict`` (``request.GET``)"""
+    organization_type = normalize_service_name(params.get('type', ''))
+    services = sorted({normalize_service_name(service) for service in params.getlist('service')
+                       if service.strip()})
+    return Facets(organization_type, tuple(services[:MAX_SERVICES]))
+
+
+def precomputed_count(facets):
+    """Total de un filtro de una sola faceta desde las tablas de conteos, o
+    ``None`` si el filtro combina varias facetas"""
+    if facets.type and not facets.services:
+        model, key = TypeFacet, facets.type
+    elif len(facets.services) == 1 and not facets.type:
+        model, key = Service, facets.services[0]
+    else:
+        return None
+    count = model.objects.filter(normalized_name=key).values_list('organization_count', flat=True).first()
+    return count or 0
+
+
+def facet_context(facets, search_query, base_url):
+    """Opciones de filtro con su conteo y la URL que activa o desactiva cada una"""
+    counts = get_facet_counts()
+    types = list(counts['types'])
+    services = list(counts['services'])
+    # Un filtro activo se muestra aunque no esté entre los más frecuentes
+    if facets.type and facets.type not in {key for _, key, _ in types}:
+        types.insert(0, (facets.type, facets.type, None))
+    listed = {key for _, key, _ in services}
+    services[:0] = [(key, key, None) for key in facets.services if key not in listed]
+
+    def url(selected):
+        params = ([('search', search_query)] if search_query else []) + selected.params()
+        return '%s?%s' % (base_url, urlencode(params)) if params else base_url
+
+    return {
+        'facets': facets,
+        'type_facets': [
+            {'name': name, 'count': count, 'active': key == facets.type, 'url': url(facets.toggle_type(key))}
+            for name, key, count in types
+        ],
+        'service_facets': [
+            {'name': name, 'count': count, 'active': key in facets.services,
+             'url': url(facets.toggle_service(key))}
+            for name, key, count in services
+        ],
+        'clear_facets_url': url(NO_FACETS),
+    }
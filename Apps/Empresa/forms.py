@@ -1,18 +1,25 @@
 from django import forms
-from .models import Organization, UserProfile
+from .models import Organization, UserProfile, normalize_service_name, split_services
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
+from .uploads import ChunkedUploadFormMixin, LimitedImageField
+
+class OrganizationForm(ChunkedUploadFormMixin, forms.ModelForm):
+    # Logo subido por partes (api/uploads/) en vez de en el formulario
+    upload_attribute = 'logo'
 
-class OrganizationForm(forms.ModelForm):
     class Meta:
         model = Organization
         fields = ['name', 'type', 'website', 'phone', 'nit', 'logo', 'services']
+        # Límites de tamaño y dimensiones sin decodificar la imagen (ver uploads.py)
+        field_classes = {'logo': LimitedImageField}
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nombre de la organización'}),
             'type': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Tipo de organización'}),
             'website': forms.URLInput(attrs={'class': 'form-control', 'placeholder': 'https://www.ejemplo.com'}),
             'phone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Teléfono'}),
             'nit': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'NIT'}),
-            'logo': forms.FileInput(attrs={'class': 'form-control'}),
+            'logo': forms.FileInput(attrs={'class': 'form-control', 'data-upload-url': reverse_lazy('upload_start')}),
             'services': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Ej: Consultoría, Desarrollo Web, Marketing Digital',
@@ -29,7 +36,36 @@ class OrganizationForm(forms.ModelForm):
             'services': 'Servicios'
         }
 
-class UserProfileForm(forms.ModelForm):
+    def clean_services(self):
+        # Se sigue aceptando el texto separado por comas; se eliminan repetidos
+        services = {}
+        for service in split_services(self.cleaned_data.get('services')):
+            services.setdefault(normalize_service_name(service), service)
+        return ', '.join(services.values())
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        self.instance.set_services(self.cleaned_data.get('services'))
+        self.forget_uploads()
+
+class OrganizationImportForm(OrganizationForm):
+    """Valida las filas de una importación con las reglas de OrganizationForm (sin logo)"""
+    upload_attribute = None
+
+    class Meta(OrganizationForm.Meta):
+        fields = ['name', 'type', 'website', 'phone', 'nit', 'services']
+
+    def rebind(self, data):
+        # Reutiliza el formulario para otra fila sin volver a copiar los campos
+        self.data = data
+        self.is_bound = True
+        self._errors = None
+        self.instance = Organization()
+        return self
+
+class UserProfileForm(ChunkedUploadFormMixin, forms.ModelForm):
+    upload_attribute = 'image'
+
     first_name = forms.CharField(
         max_length=30,
         widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nombre'}),
@@ -44,9 +80,9 @@ class UserProfileForm(forms.ModelForm):
         widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'correo@ejemplo.com'}),
         label='Correo Electrónico'
     )
-    image = forms.ImageField(
+    image = LimitedImageField(
         required=False,
-        widget=forms.FileInput(attrs={'class': 'form-control'}),
+        widget=forms.FileInput(attrs={'class': 'form-control', 'data-upload-url': reverse_lazy('upload_start')}),
         label='Foto de Perfil'
     )
 
@@ -71,4 +107,5 @@ class UserProfileForm(forms.ModelForm):
         if commit:
             user.save()
             profile.save()
+            self.forget_uploads()
         return profile 
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Procesamiento de logos y fotos de perfil.
+
+Después de cada carga se generan miniaturas de tamaño fijo en WebP y en el
+formato original (JPEG o PNG si la imagen tiene transparencia) y se elimina
+el EXIF del original sin volver a comprimirlo (ver ``_strip_exif``). El trabajo corre en un pool de hilos para no bloquear
+la petición; con ``EMPRESA_IMAGE_WORKERS = 0`` se procesa en línea.
+
+Los modelos describen qué procesar con los métodos estáticos
+``getCropAttribute()`` (campo de imagen), ``getCropPath()`` (carpeta) y
+``getCropSizes()`` (lados de las miniaturas en píxeles). Las variantes
+generadas quedan en el JSON ``<campo>_variants`` del modelo.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_ROOT = 'uploaded/img/thumbs/'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+# Etiqueta EXIF de la orientación con la que se debe mostrar la imagen
+ORIENTATION_TAG = 0x0112
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ImageVariants:
+    """Acceso a las URLs de las variantes de una imagen desde los templates"""
+
+    def __init__(self, field_file, variants):
+        self.field_file = field_file
+        # Variantes generadas para otro archivo ya no sirven
+        if not field_file or (variants or {}).get('source') != field_file.name:
+            variants = {}
+        self.variants = variants
+
+    def __bool__(self):
+        return bool(self.field_file)
+
+    def _urls(self, kind):
+        storage = self.field_file.storage
+        return [(int(size), storage.url(name))
+                for size, name in sorted(self.variants.get(kind, {}).items(), key=lambda item: int(item[0]))]
+
+    def _srcset(self, kind):
+        return ', '.join('%s %sw' % (url, size) for size, url in self._urls(kind))
+
+    @property
+    def src(self):
+        urls = self._urls('fallback')
+        if urls:
+            return urls[0][1]
+        return self.field_file.url if self.field_file else None
+
+    @property
+    def srcset(self):
+        return self._srcset('fallback')
+
+    @property
+    def webp_srcset(self):
+        return self._srcset('webp')
+
+
+def _variant_name(model, source_name, size, extension):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return '%s%s%s-%d.%s' % (THUMBNAIL_ROOT, model.getCropPath(), stem, size, extension)
+
+
+def _encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def _without_exif(data, image_format):
+    """Quita el EXIF de un JPEG (segmentos APP1) o un WebP (chunk ``EXIF``) sin
+    decodificar la imagen; ``None`` para los demás formatos"""
+    if image_format == 'JPEG' and data[:2] == b'\xff\xd8':
+        parts, position = [data[:2]], 2
+        # Los segmentos van hasta SOS; desde ahí siguen los datos comprimidos
+        while position + 4 <= len(data) and data[position] == 0xFF and data[position + 1] != 0xDA:
+            end = position + 2 + int.from_bytes(data[position + 2:position + 4], 'big')
+            if not (data[position + 1] == 0xE1 and data[position + 4:position + 10] == b'Exif\x00\x00'):
+                parts.append(data[position:end])
+            position = end
+        parts.append(data[position:])
+        return b''.join(parts)
+    if image_format == 'WEBP' and data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        chunks, position = [], 12
+        while position + 8 <= len(data):
+            size = int.from_bytes(data[position + 4:position + 8], 'little')
+            end = position + 8 + size + (size & 1)
+            chunk = data[position:end]
+            if chunk[:4] == b'VP8X':
+                # Sin la marca de EXIF en las opciones del contenedor
+                chunk = chunk[:8] + bytes([chunk[8] & ~0x08]) + chunk[9:]
+            if chunk[:4] != b'EXIF':
+                chunks.append(chunk)
+            position = end
+        body = b'WEBP' + b''.join(chunks)
+        return b'RIFF' + len(body).to_bytes(4, 'little') + body
+    return None
+
+
+def _strip_exif(field_file, original, image):
+    """Retorna el original sin metadatos EXIF (ubicación, cámara, etc.) en su
+    formato. Sin rotación pendiente se quitan los bytes del EXIF sin volver a
+    comprimir; si hay que rotar, el JPEG conserva sus tablas de cuantización
+    y el PNG se reescribe sin pérdida"""
+    if original.getexif().get(ORIENTATION_TAG, 1) == 1:
+        field_file.seek(0)
+        data = _without_exif(field_file.read(), original.format)
+        if data is not None:
+            return ContentFile(data)
+    options = {}
+    if original.format == 'JPEG':
+        from PIL import JpegImagePlugin
+        options = {'qtables': original.quantization, 'subsampling': JpegImagePlugin.get_sampling(original)}
+        if image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+    elif original.format == 'WEBP':
+        options = {'quality': WEBP_QUALITY}
+    return _encode(image, original.format or 'PNG', **options)
+
+
+def delete_variants(storage, variants):
+    for kind in ('webp', 'fallback'):
+        for name in (variants or {}).get(kind, {}).values():
+            storage.delete(name)
+
+
+def process_image(model_label, pk):
+    """Genera las variantes de la imagen de la instancia ``model_label``/``pk``"""
+    from PIL import Image, ImageOps
+
+    model = apps.get_model(model_label)
+    attribute = model.getCropAttribute()
+    variants_attribute = '%s_variants' % attribute
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, attribute)
+    previous = getattr(instance, variants_attribute) or {}
+    storage = field_file.storage
+
+    if not field_file:
+        delete_variants(storage, previous)
+        _save_variants(instance, variants_attribute, {})
+        return {}
+    if previous.get('source') == field_file.name:
+        return previous
+
+    stripped = None
+    with field_file.open('rb'):
+        with Image.open(field_file) as original:
+            # Aplica la orientación del EXIF antes de descartarlo
+            image = ImageOps.exif_transpose(original)
+            if original.info.get('exif') or original.getexif():
+                stripped = _strip_exif(field_file, original, image)
+    replaced = None
+    if stripped is not None:
+        # Con otro nombre: el original se borra cuando la fila ya apunta al nuevo
+        replaced = field_file.name
+        field_file.name = storage.save(replaced, stripped, max_length=field_file.field.max_length)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback_format, fallback_extension = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    fallback_options = {'optimize': True}
+    if fallback_format == 'JPEG':
+        fallback_options['quality'] = JPEG_QUALITY
+
+    variants = {'source': field_file.name, 'webp': {}, 'fallback': {}}
+    for size in model.getCropSizes():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        for kind, extension, content in (
+            ('webp', 'webp', _encode(thumbnail, 'WEBP', quality=WEBP_QUALITY, method=4)),
+            ('fallback', fallback_extension, _encode(thumbnail, fallback_format, **fallback_options)),
+        ):
+            name = _variant_name(model, field_file.name, size, extension)
+            storage.delete(name)
+            variants[kind][str(size)] = storage.save(name, content)
+
+    # Solo se borran los archivos que no se van a reutilizar
+    current = set(variants['webp'].values()) | set(variants['fallback'].values())
+    delete_variants(storage, {kind: {size: name for size, name in names.items() if name not in current}
+                               for kind, names in previous.items() if kind in ('webp', 'fallback')})
+    saved = _save_variants(instance, variants_attribute, variants, replaced)
+    if replaced is not None and replaced != field_file.name:
+        # Si la imagen cambió mientras se procesaba, el que sobra es el nuevo
+        storage.delete(replaced if saved else field_file.name)
+    return variants
+
+
+def _save_variants(instance, variants_attribute, variants, replaced=None):
+    """Guarda las variantes con update(), que no vuelve a disparar post_save. En
+    las organizaciones además cambia ``updated_at``, copia las URLs nuevas al
+    feed y registra el cambio, todo en una transacción; en los perfiles
+    invalida el usuario en caché, que los trae con su perfil. Con ``replaced``
+    (el nombre de la imagen con EXIF) guarda también el nombre nuevo, solo si
+    la fila todavía apunta al anterior. Retorna si se actualizó la fila"""
+    from .caching import invalidate_organization, invalidate_user
+
+    model = type(instance)
+    attribute = model.getCropAttribute()
+    rows = model.objects.filter(pk=instance.pk)
+    values = {variants_attribute: variants}
+    if replaced is not None:
+        rows = rows.filter(**{attribute: replaced})
+        values[attribute] = getattr(instance, attribute).name
+    if model._meta.label != 'Empresa.Organization':
+        updated = rows.update(**values)
+        if model._meta.label == 'Empresa.UserProfile':
+            invalidate_user(instance.user_id)
+        return bool(updated)
+    from .models import OrganizationChange, OrganizationFeedEntry
+
+    with transaction.atomic():
+        updated = rows.update(updated_at=timezone.now(), **values)
+        if updated:
+            OrganizationFeedEntry.refresh([instance.pk])
+            OrganizationChange.record([instance], OrganizationChange.UPDATED)
+    invalidate_organization(instance.pk)
+    return bool(updated)
+
+
+def _run(model_label, pk):
+    try:
+        process_image(model_label, pk)
+    except Exception:
+        logger.exception('No se pudo procesar la imagen de %s %s', model_label, pk)
+    finally:
+        # Cada hilo del pool abre su propia conexión a la base de datos
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.EMPRESA_IMAGE_WORKERS,
+                    thread_name_prefix='empresa-images',
+                )
+    return _executor
+
+
+def schedule_processing(instance):
+    """Encola el procesamiento si la imagen cambió desde la última vez"""
+    attribute = instance.getCropAttribute()
+    field_file = getattr(instance, attribute)
+    variants = getattr(instance, '%s_variants' % attribute) or {}
+    if (field_file.name or None) == (variants.get('source') or None):
+        return
+    label = instance._meta.label
+    if getattr(settings, 'EMPRESA_IMAGE_WORKERS', 0) > 0:
+        get_executor().submit(_run, label, instance.pk)
+    else:
+        process_image(label, instance.pk)
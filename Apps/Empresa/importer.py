@@ -0,0 +1,151 @@
+"""
+Importación en bloque de organizaciones desde archivos CSV o NDJSON.
+
+Las filas se leen en streaming y se validan con ``OrganizationImportForm``
+(las mismas reglas de ``OrganizationForm``). Se descartan los NIT repetidos,
+tanto dentro del archivo como los ya registrados, y el resto se inserta con
+``Organization.bulk_insert`` por lotes, cada lote en su propia transacción.
+Las filas rechazadas se escriben en un CSV de rechazos con el número de línea
+y el motivo.
+
+Lo usan el comando ``import_organizations`` y la vista de importación del
+admin de organizaciones.
+"""
+import csv
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .forms import OrganizationImportForm
+from .models import Organization
+
+IMPORT_FIELDS = ('name', 'type', 'website', 'phone', 'nit', 'services')
+FORMATS = ('csv', 'ndjson')
+
+ImportResult = namedtuple('ImportResult', ['created', 'duplicates', 'rejected'])
+
+
+def get_batch_size():
+    return getattr(settings, 'EMPRESA_IMPORT_BATCH_SIZE', 1000)
+
+
+def detect_format(filename):
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def _clean_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        # En NDJSON los servicios pueden venir como lista
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
+def read_rows(stream, file_format):
+    """
+    Genera ``(línea, fila, error)`` desde un stream de texto. ``fila`` es un
+    diccionario con ``IMPORT_FIELDS``; ``error`` indica una línea ilegible.
+    """
+    if file_format == 'ndjson':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                yield number, {'name': line.strip()[:100]}, 'Línea JSON inválida'
+                continue
+            yield number, {field: _clean_value(row.get(field)) for field in IMPORT_FIELDS}, None
+    elif file_format == 'csv':
+        reader = csv.DictReader(stream)
+        missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError('Faltan columnas en el CSV: %s' % ', '.join(missing))
+        for row in reader:
+            yield reader.line_num, {field: _clean_value(row.get(field)) for field in IMPORT_FIELDS}, None
+    else:
+        raise ValueError('Formato no soportado: %s' % file_format)
+
+
+class OrganizationImporter:
+    """Importa filas de ``read_rows`` asignándolas a ``owner`` (un ``UserProfile``)"""
+
+    def __init__(self, owner, batch_size=None, rejects=None):
+        self.owner = owner
+        self.batch_size = batch_size or get_batch_size()
+        self.rejects = None
+        if rejects is not None:
+            self.rejects = csv.writer(rejects)
+            self.rejects.writerow(('line', 'errors') + IMPORT_FIELDS)
+        self.form = OrganizationImportForm()
+        self.seen_nits = set()
+        self.created = self.duplicates = self.rejected = 0
+
+    def reject(self, number, row, reason):
+        self.rejected += 1
+        if self.rejects is not None:
+            self.rejects.writerow((number, reason) + tuple(row.get(field, '') for field in IMPORT_FIELDS))
+
+    def validate(self, number, row):
+        """Retorna la organización sin guardar o ``None`` si la fila se rechazó"""
+        form = self.form.rebind(row)
+        if not form.is_valid():
+            errors = '; '.join('%s: %s' % (field, ' '.join(messages)) for field, messages in form.errors.items())
+            self.reject(number, row, errors)
+            return None
+        organization = form.instance
+        if organization.nit in self.seen_nits:
+            self.duplicates += 1
+            self.reject(number, row, 'NIT repetido en el archivo')
+            return None
+        self.seen_nits.add(organization.nit)
+        organization.owner = self.owner
+        return organization
+
+    def flush(self, pending):
+        existing = set(Organization.objects.filter(nit__in=[organization.nit for _, _, organization in pending])
+                       .values_list('nit', flat=True))
+        batch = []
+        for number, row, organization in pending:
+            if organization.nit in existing:
+                self.duplicates += 1
+                self.reject(number, row, 'NIT ya registrado')
+            else:
+                batch.append(organization)
+        if batch:
+            with transaction.atomic():
+                Organization.bulk_insert(batch)
+            self.created += len(batch)
+
+    def run(self, rows):
+        pending = []
+        try:
+            for number, row, error in rows:
+                if error:
+                    self.reject(number, row, error)
+                    continue
+                organization = self.validate(number, row)
+                if organization is None:
+                    continue
+                pending.append((number, row, organization))
+                if len(pending) >= self.batch_size:
+                    self.flush(pending)
+                    pending = []
+            if pending:
+                self.flush(pending)
+        finally:
+            # Lo ya insertado queda visible aunque la lectura falle a mitad
+            if self.created:
+                Organization.bulk_insert_done()
+        return ImportResult(self.created, self.duplicates, self.rejected)
+
+
+def import_organizations(stream, file_format, owner, batch_size=None, rejects=None):
+    """Importa un stream de texto CSV o NDJSON y retorna un ``ImportResult``"""
+    importer = OrganizationImporter(owner, batch_size=batch_size, rejects=rejects)
+    return importer.run(read_rows(stream, file_format))
@@ -0,0 +1,177 @@
+"""
+Instrumentación de consultas SQL por vista.
+
+``QueryInstrumentationMiddleware`` registra por petición el número de
+consultas, el tiempo total en base de datos, las consultas duplicadas, los
+patrones N+1 y el tiempo de render de templates, agrupado por nombre de URL
+(``dashboard``, ``public_feed``, ...). Cada petición se agrega como una línea
+JSON a ``EMPRESA_QUERY_REPORT_PATH``; el comando ``query_report`` la resume.
+Cuando el archivo pasa de ``EMPRESA_QUERY_REPORT_MAX_BYTES`` se renombra a
+``<archivo>.1`` y se empieza uno nuevo, así el registro no crece sin límite.
+
+Se activa solo con ``EMPRESA_QUERY_INSTRUMENTATION`` (``QUERY_INSTRUMENTATION=1``
+en el entorno); el tiempo de render se mide si además ``TEMPLATES`` usa
+``InstrumentedDjangoTemplates``, que settings elige con el mismo flag.
+
+Si una vista supera su presupuesto de ``EMPRESA_QUERY_BUDGETS`` se registra
+una advertencia, o se lanza ``QueryBudgetExceeded`` cuando
+``EMPRESA_QUERY_BUDGET_STRICT`` está activo (así lo configura el runner de
+tests ``Apps.Empresa.testing.BudgetTestRunner``).
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+# Repeticiones de una misma consulta (con distintos parámetros) que se
+# consideran un patrón N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+_current = contextvars.ContextVar('empresa_request_stats', default=None)
+_report_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Se registra como execute_wrapper de cada conexión
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            try:
+                key = (sql, repr(params))
+            except Exception:
+                key = (sql, None)
+            self.queries.append(key)
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        return sum(count - 1 for count in Counter(self.queries).values() if count > 1)
+
+    def n_plus_one(self):
+        by_sql = Counter(sql for sql, _ in self.queries)
+        return sorted(sql for sql, count in by_sql.items() if count >= N_PLUS_ONE_THRESHOLD)
+
+    def as_dict(self, url_name, method, status, total_time):
+        return {
+            'url_name': url_name,
+            'method': method,
+            'status': status,
+            'queries': self.query_count,
+            'duplicates': self.duplicates(),
+            'n_plus_one': self.n_plus_one(),
+            'db_ms': round(self.db_time * 1000, 3),
+            'template_ms': round(self.template_time * 1000, 3),
+            'total_ms': round(total_time * 1000, 3),
+            'timestamp': time.time(),
+        }
+
+
+def get_budget(url_name):
+    return getattr(settings, 'EMPRESA_QUERY_BUDGETS', {}).get(url_name)
+
+
+def get_report_max_bytes():
+    return getattr(settings, 'EMPRESA_QUERY_REPORT_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def rotated_path(path):
+    return '%s.1' % path
+
+
+def append_report(entry):
+    path = getattr(settings, 'EMPRESA_QUERY_REPORT_PATH', None)
+    if not path:
+        return
+    line = json.dumps(entry, ensure_ascii=False)
+    with _report_lock:
+        try:
+            full = os.path.getsize(path) >= get_report_max_bytes()
+        except OSError:
+            full = False
+        if full:
+            os.replace(path, rotated_path(path))
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'EMPRESA_QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_time = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        entry = stats.as_dict(url_name, request.method, response.status_code, total_time)
+        append_report(entry)
+        response['X-Query-Count'] = str(stats.query_count)
+        response['X-DB-Time-ms'] = str(entry['db_ms'])
+
+        budget = get_budget(url_name)
+        if budget is not None and request.method == 'GET' and stats.query_count > budget:
+            message = '%s ejecutó %d consultas (presupuesto %d)' % (url_name, stats.query_count, budget)
+            if getattr(settings, 'EMPRESA_QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Backend de templates de Django que mide el tiempo de render por petición"""
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from Apps.Empresa.benchmarking import dump, summarize
+from Apps.Empresa.models import Organization, UserProfile
+from Apps.Empresa.synthetic import search_queries
+from Apps.Empresa.testing import async_feed_views
+
+# (nombre de URL, autenticado, con búsqueda)
+REQUESTS = [
+    ('public_feed', False, False),
+    ('public_feed', False, True),
+    ('dashboard', True, False),
+    ('dashboard_feed', True, False),
+    ('dashboard_feed', True, True),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compara el throughput de dashboard y los feeds bajo carga concurrente: handler '
+            'WSGI con vistas síncronas contra handler ASGI con vistas síncronas y asíncronas')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones por configuración')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Hilos (WSGI) o tareas (ASGI) simultáneas')
+        parser.add_argument('--username', default='benchmark-views')
+        parser.add_argument('--password', default='benchmark-123')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        if not Organization.objects.exists():
+            raise CommandError('No hay organizaciones; ejecute primero generate_data')
+        self.user = self.get_user(options['username'], options['password'])
+        queries = search_queries(options['requests'], seed=options['seed'])
+        self.plan = [
+            (reverse(name), authenticated, {'search': query} if search else {})
+            for (name, authenticated, search), query in zip(itertools.cycle(REQUESTS), queries)
+        ]
+
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+            # Todas las peticiones salen de la misma IP
+            'EMPRESA_RATE_LIMITS': {},
+        }
+        results = {}
+        with override_settings(**overrides):
+            for label, handler, async_views in (
+                ('wsgi_sync_views', 'wsgi', False),
+                ('asgi_sync_views', 'asgi', False),
+                ('asgi_async_views', 'asgi', True),
+            ):
+                with async_feed_views(async_views):
+                    run = self.run_wsgi if handler == 'wsgi' else self.run_asgi
+                    results[label] = run(options['concurrency'])
+                self.stderr.write('%-18s p50=%sms p99=%sms %s req/s' % (
+                    label, results[label]['p50_ms'], results[label]['p99_ms'],
+                    results[label]['throughput_per_s']))
+
+        report = {
+            'benchmark': 'asgi',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'organizations': Organization.objects.count(),
+            'requests': len(self.plan),
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        dump(report, self.stdout, options['output'])
+
+    def get_user(self, username, password):
+        user, created = User.objects.get_or_create(username=username, defaults={'email': 'bench@example.com'})
+        if created:
+            user.set_password(password)
+            user.save()
+        UserProfile.objects.get_or_create(user=user, defaults={'email': user.email})
+        return user
+
+    def summary(self, latencies, errors, elapsed):
+        result = summarize(latencies)
+        # Con peticiones simultáneas el throughput es sobre el tiempo total
+        result['throughput_per_s'] = round(len(latencies) / elapsed, 2) if elapsed else None
+        result['errors'] = errors
+        return result
+
+    def run_wsgi(self, concurrency):
+        plan = iter(self.plan)
+
+        def worker():
+            clients = {False: Client(), True: Client()}
+            clients[True].force_login(self.user)
+            latencies, errors = [], 0
+            try:
+                for url, authenticated, params in plan:
+                    start = time.perf_counter()
+                    response = clients[authenticated].get(url, params)
+                    latencies.append(time.perf_counter() - start)
+                    errors += response.status_code >= 400
+            finally:
+                connections.close_all()
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = [future.result() for future in [executor.submit(worker) for _ in range(concurrency)]]
+        elapsed = time.perf_counter() - start
+        return self.summary([latency for latencies, _ in outcomes for latency in latencies],
+                            sum(errors for _, errors in outcomes), elapsed)
+
+    def run_asgi(self, concurrency):
+        clients = {False: AsyncClient(), True: AsyncClient()}
+        clients[True].force_login(self.user)
+        latencies = []
+        errors = 0
+
+        async def worker(plan):
+            nonlocal errors
+            for url, authenticated, params in plan:
+                start = time.perf_counter()
+                response = await clients[authenticated].get(url, params)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        async def main():
+            plan = iter(self.plan)
+            try:
+                await asyncio.gather(*[worker(plan) for _ in range(concurrency)])
+            finally:
+                await sync_to_async(connections.close_all)()
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - start
+        return self.summary(latencies, errors, elapsed)
@@ -0,0 +1,134 @@
+import platform
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import Context, Engine
+from django.test import override_settings
+
+from Apps.Empresa.benchmarking import dump, summarize
+from Apps.Empresa.caching import card_context
+from Apps.Empresa.cards import render_cards
+from Apps.Empresa.models import Organization
+
+# Loop de tarjetas anterior a organization/card.html: atributos y métodos del
+# modelo resueltos en el template y un {% cache %} por tarjeta
+LEGACY_TEMPLATE = """{% load cache %}
+{% for org in organizations %}
+{% cache card_cache_timeout organization_card org.pk org.card_version %}
+<div class="col-md-6 col-lg-4">
+    <div class="card h-100 shadow-sm hover-shadow transition">
+        <div class="card-body">
+            <div class="text-center mb-3">
+                {% if org.logo %}
+                    {% with variants=org.get_logo_variants %}
+                    <picture>
+                        {% if variants.webp_srcset %}<source type="image/webp" srcset="{{ variants.webp_srcset }}" sizes="100px">{% endif %}
+                        <img src="{{ variants.src }}" {% if variants.srcset %}srcset="{{ variants.srcset }}" sizes="100px"{% endif %} alt="{{ org.name }}" class="img-fluid mb-3" style="max-height: 100px;" loading="lazy">
+                    </picture>
+                    {% endwith %}
+                {% else %}
+                    <div class="bg-light d-flex align-items-center justify-content-center mb-3" style="height: 100px;">
+                        <i class="fas fa-building fa-3x text-secondary"></i>
+                    </div>
+                {% endif %}
+                <h5 class="card-title">{{ org.name }}</h5>
+            </div>
+
+            <!-- Tipo de Organización -->
+            <div class="mb-3">
+                <span class="badge bg-secondary">{{ org.type }}</span>
+            </div>
+
+            <!-- Servicios -->
+            {% if org.services %}
+            <div class="mb-3">
+                {% for service in org.get_services_list %}
+                    <span class="badge bg-primary me-1 mb-1">{{ service }}</span>
+                {% endfor %}
+            </div>
+            {% endif %}
+
+            <!-- Información de Contacto -->
+            <div class="mb-2">
+                <a href="{{ org.website }}" target="_blank" class="text-decoration-none text-muted">
+                    <i class="fas fa-globe me-2"></i>{{ org.website }}
+                </a>
+            </div>
+            <div class="mb-2">
+                <a href="tel:{{ org.phone }}" class="text-decoration-none text-muted">
+                    <i class="fas fa-phone me-2"></i>{{ org.phone }}
+                </a>
+            </div>
+        </div>
+    </div>
+</div>
+{% endcache %}
+{% endfor %}"""
+
+
+class Command(BaseCommand):
+    help = ('Mide el render de un lote de tarjetas de organizaciones con el template anterior '
+            '(con y sin {% cache %}) y con el componente de Apps/Empresa/cards.py (frío y caliente)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help='Tarjetas por render')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders por modo')
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        organizations = list(Organization.objects.for_feed().order_by('-pk')[:options['cards']])
+        if not organizations:
+            raise CommandError('No hay organizaciones; ejecute primero generate_data')
+        legacy = Engine.get_default().from_string(LEGACY_TEMPLATE)
+        overrides = {
+            # Caché local y vacía: no toca la caché real ni ve tarjetas de otra ejecución
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                   'LOCATION': 'benchmark-cards', 'OPTIONS': {'MAX_ENTRIES': 100000}}},
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+        }
+        results = {}
+        with override_settings(**overrides):
+            card_context(organizations)
+
+            def legacy_render(cached):
+                return legacy.render(Context({
+                    'organizations': organizations,
+                    # Un timeout de 0 hace que {% cache %} no guarde nada
+                    'card_cache_timeout': 3600 if cached else 0,
+                }))
+
+            modes = (
+                ('legacy', lambda: legacy_render(False), None),
+                ('legacy_cached_warm', lambda: legacy_render(True), lambda: legacy_render(True)),
+                ('component_cold', lambda: render_cards(organizations), cache.clear),
+                ('component_warm', lambda: render_cards(organizations), lambda: render_cards(organizations)),
+            )
+            for mode, render, before in modes:
+                cache.clear()
+                latencies = []
+                for _ in range(options['repeat']):
+                    if before is not None:
+                        before()
+                    start = time.perf_counter()
+                    html = render()
+                    latencies.append(time.perf_counter() - start)
+                results[mode] = summarize(latencies)
+                results[mode]['bytes'] = len(html)
+                self.stderr.write('%-20s p50=%sms (%d bytes)' % (mode, results[mode]['p50_ms'], len(html)))
+
+        report = {
+            'benchmark': 'cards',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'cards': len(organizations),
+            'repeat': options['repeat'],
+            'results': results,
+            'speedup_cold': round(results['legacy']['p50_ms'] / results['component_cold']['p50_ms'], 2),
+            'speedup_warm': round(results['legacy_cached_warm']['p50_ms'] / results['component_warm']['p50_ms'], 2),
+        }
+        dump(report, self.stdout, options['output'])
@@ -0,0 +1,119 @@
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Apps.Empresa.benchmarking import dump, summarize
+from Apps.Empresa.models import Organization
+from Apps.Empresa.synthetic import search_queries
+
+# (modo, CONN_MAX_AGE)
+MODES = (('per_request', 0), ('persistent', 600))
+
+
+class Command(BaseCommand):
+    help = ('Compara abrir una conexión a la base de datos por petición (CONN_MAX_AGE=0) con '
+            'reutilizarla (CONN_MAX_AGE>0) sobre public_feed_page sin cachés')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Peticiones por modo')
+        parser.add_argument('--connects', type=int, default=200,
+                            help='Conexiones que se abren y cierran para medir su costo aislado')
+        parser.add_argument('--database', default='default', help='Alias de la base de datos a medir')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES:
+            raise CommandError('No existe la base de datos %s' % alias)
+        connection = connections[alias]
+        if not Organization.objects.using(alias).exists():
+            raise CommandError('No hay organizaciones; ejecute primero generate_data')
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(connection)
+
+        connection_created.connect(count_connection)
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+            # Todas las peticiones salen de la misma IP
+            'EMPRESA_RATE_LIMITS': {},
+            # Sin cachés cada petición consulta la base de datos
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+            'EMPRESA_READ_REPLICA': None if alias == 'default' else alias,
+        }
+        results = {}
+        try:
+            results['connect'] = self.measure_connect(connection, options['connects'])
+            self.stderr.write('conexión aislada: p50=%sms' % results['connect']['p50_ms'])
+            queries = search_queries(20, seed=options['seed'])
+            plan = [{'search': queries[index % len(queries)]} if index % 2 else {}
+                    for index in range(options['requests'])]
+            with override_settings(**overrides):
+                # Una pasada previa carga el índice de búsqueda en memoria
+                self.run(plan[:len(queries) * 2])
+                for mode, max_age in MODES:
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    connection.close()
+                    del opened[:]
+                    results[mode] = self.run(plan)
+                    results[mode]['connections_opened'] = len(opened)
+                    self.stderr.write('%-12s p50=%sms %s req/s, %d conexiones' % (
+                        mode, results[mode]['p50_ms'], results[mode]['throughput_per_s'], len(opened)))
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+            connection.close()
+
+        report = {
+            'benchmark': 'connections',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'alias': alias,
+            'organizations': Organization.objects.using(alias).count(),
+            'requests_per_mode': options['requests'],
+            'results': results,
+            'saved_ms_per_request': round(results['per_request']['p50_ms'] - results['persistent']['p50_ms'], 3),
+        }
+        dump(report, self.stdout, options['output'])
+
+    def measure_connect(self, connection, count):
+        """Abrir, consultar ``SELECT 1`` y cerrar, sin pasar por una vista"""
+        connection.close()
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            connection.ensure_connection()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.close()
+            latencies.append(time.perf_counter() - start)
+        return summarize(latencies)
+
+    def run(self, plan):
+        client = Client()
+        url = reverse('public_feed_page')
+        latencies = []
+        for params in plan:
+            start = time.perf_counter()
+            response = client.get(url, params)
+            # El cliente de pruebas no emite request_finished como el servidor: se
+            # cierran aquí las conexiones vencidas (todas si CONN_MAX_AGE=0)
+            close_old_connections()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError('public_feed_page respondió %d' % response.status_code)
+        return summarize(latencies)
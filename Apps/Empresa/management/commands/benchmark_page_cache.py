@@ -0,0 +1,92 @@
+import itertools
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Apps.Empresa.benchmarking import dump, summarize
+from Apps.Empresa.models import Organization
+from Apps.Empresa.synthetic import search_queries
+
+# (escenario, nombre de URL, con búsqueda)
+SCENARIOS = [
+    ('public_feed', 'public_feed', False),
+    ('public_feed_search', 'public_feed', True),
+    ('about_us', 'home', False),
+]
+# Sin caché de página, con caché de página y revalidando con If-None-Match
+MODES = ('no_page_cache', 'page_cache', 'conditional')
+
+
+class Command(BaseCommand):
+    help = ('Compara el throughput de tráfico anónimo repetido sobre public_feed y about_us '
+            'sin caché de página, con caché de página y con GET condicional (304)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones por escenario y modo')
+        parser.add_argument('--searches', type=int, default=10,
+                            help='Búsquedas distintas que se repiten en public_feed_search')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        if not Organization.objects.exists():
+            raise CommandError('No hay organizaciones; ejecute primero generate_data')
+        queries = search_queries(options['searches'], seed=options['seed'])
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+            # Todas las peticiones salen de la misma IP
+            'EMPRESA_RATE_LIMITS': {},
+        }
+        results = {}
+        with override_settings(**overrides):
+            for scenario, url_name, search in SCENARIOS:
+                params = itertools.cycle([{'search': query} for query in queries] if search else [{}])
+                plan = [(reverse(url_name), next(params)) for _ in range(options['requests'])]
+                results[scenario] = {}
+                for mode in MODES:
+                    with override_settings(EMPRESA_PAGE_CACHE=mode != 'no_page_cache'):
+                        results[scenario][mode] = self.run(plan, conditional=mode == 'conditional')
+                    self.stderr.write('%-20s %-14s p50=%sms %s req/s (%s)' % (
+                        scenario, mode, results[scenario][mode]['p50_ms'],
+                        results[scenario][mode]['throughput_per_s'], results[scenario][mode]['statuses']))
+
+        report = {
+            'benchmark': 'page_cache',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'organizations': Organization.objects.count(),
+            'requests_per_scenario': options['requests'],
+            'scenarios': results,
+        }
+        dump(report, self.stdout, options['output'])
+
+    def run(self, plan, conditional):
+        client = Client()
+        etags = {}
+        # Una pasada previa llena las cachés (y las ETag del navegador simulado)
+        for url, params in plan:
+            response = client.get(url, params)
+            etags[(url, tuple(params.items()))] = response.get('ETag')
+        latencies = []
+        statuses = {}
+        for url, params in plan:
+            headers = {}
+            etag = etags[(url, tuple(params.items()))]
+            if conditional and etag:
+                headers['HTTP_IF_NONE_MATCH'] = etag
+            start = time.perf_counter()
+            response = client.get(url, params, **headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        result = summarize(latencies)
+        result['statuses'] = statuses
+        return result
@@ -0,0 +1,79 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Apps.Empresa.benchmarking import dump, summarize, timed
+from Apps.Empresa.models import UserProfile
+from Apps.Empresa.search import PostgresSearchBackend, PythonSearchBackend, get_backend
+from Apps.Empresa.synthetic import create_directory, organization_rows, search_queries, typo_queries
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia p50/p99 del motor de búsqueda con directorios sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--backend', choices=['python', 'postgres'],
+                            help='Por defecto el configurado en EMPRESA_SEARCH_BACKEND')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if options['backend'] == 'python':
+            backend = PythonSearchBackend()
+        elif options['backend'] == 'postgres':
+            backend = PostgresSearchBackend()
+        queries = search_queries(options['queries'], seed=options['seed'])
+        # Sin tildes y con errores: pasan por la búsqueda aproximada
+        self.typos = typo_queries(options['queries'], seed=options['seed'])
+
+        results = []
+        for size in options['sizes']:
+            if isinstance(backend, PythonSearchBackend):
+                result = self.bench_python(backend, size, queries, options['seed'])
+            else:
+                result = self.bench_database(backend, size, queries, options['seed'])
+            results.append(result)
+            self.stderr.write('%d organizaciones: p50=%sms p99=%sms, con errores p50=%sms p99=%sms' % (
+                size, result['latency']['p50_ms'], result['latency']['p99_ms'],
+                result['typo_latency']['p50_ms'], result['typo_latency']['p99_ms']))
+
+        report = {'benchmark': 'search', 'backend': type(backend).__name__, 'results': results}
+        dump(report, self.stdout, options['output'])
+
+    def bench_python(self, backend, size, queries, seed):
+        rows = ((pk, row['name'], row['type'], row['services'])
+                for pk, row in enumerate(organization_rows(size, seed=seed), start=1))
+        _, build_seconds = timed(backend.rebuild, rows)
+        return self.run_queries(backend, size, queries, build_seconds=round(build_seconds, 3))
+
+    def bench_database(self, backend, size, queries, seed):
+        # Los datos se insertan en una transacción que se revierte al terminar
+        with transaction.atomic():
+            user = User.objects.create(username='benchmark-search-%d' % size)
+            owner = UserProfile.objects.create(user=user, email='benchmark@example.com')
+            create_directory(0, size, batch_size=5000, seed=seed, owners=[owner])
+            result = self.run_queries(backend, size, queries)
+            transaction.set_rollback(True)
+        return result
+
+    def time_queries(self, backend, queries):
+        latencies = []
+        matches = 0
+        for query in queries:
+            hits, seconds = timed(backend.search, query, 50)
+            latencies.append(seconds)
+            matches += len(hits)
+        return summarize(latencies), round(matches / len(queries), 1) if queries else 0
+
+    def run_queries(self, backend, size, queries, **extra):
+        latency, avg_hits = self.time_queries(backend, queries)
+        typo_latency, typo_avg_hits = self.time_queries(backend, self.typos)
+        result = {'organizations': size, 'latency': latency, 'avg_hits': avg_hits,
+                  'typo_latency': typo_latency, 'typo_avg_hits': typo_avg_hits}
+        result.update(extra)
+        return result
@@ -0,0 +1,119 @@
+import platform
+import re
+import shutil
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+
+from Apps.Empresa.assets import ENCODINGS, serve
+from Apps.Empresa.benchmarking import dump
+from Apps.Empresa.models import UserProfile
+
+# (nombre de URL, autenticado)
+PAGES = [
+    ('public_feed', False),
+    ('dashboard_feed', True),
+    ('dashboard', True),
+]
+
+ASSET_RE = re.compile(r'<(?:link|script)\b[^>]*?\b(?:href|src)="([^"]+)"')
+INLINE_STYLE_RE = re.compile(r'<style>(.*?)</style>', re.DOTALL)
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta collectstatic en un directorio temporal y mide los bytes transferidos por '
+            'página (HTML y estáticos propios) con caché del navegador fría y caliente')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='benchmark-views')
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=options['username'],
+                                             defaults={'email': 'bench@example.com'})
+        UserProfile.objects.get_or_create(user=user, defaults={'email': user.email})
+        static_root = tempfile.mkdtemp(prefix='benchmark-static-')
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+            # Todas las peticiones salen de la misma IP
+            'EMPRESA_RATE_LIMITS': {},
+            # Con DEBUG {% static %} no usa los nombres con hash
+            'DEBUG': False,
+            'STATIC_ROOT': static_root,
+        }
+        try:
+            with override_settings(**overrides):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                clients = {False: Client(), True: Client()}
+                clients[True].force_login(user)
+                pages = {}
+                for name, authenticated in PAGES:
+                    pages[name] = self.measure_page(clients[authenticated], reverse(name))
+                    self.stderr.write('%-16s fría: %s B (br) / %s B (sin comprimir), caliente: %s B' % (
+                        name, pages[name]['cold_bytes']['br'], pages[name]['cold_bytes']['identity'],
+                        pages[name]['warm_bytes']))
+        finally:
+            shutil.rmtree(static_root, ignore_errors=True)
+
+        report = {
+            'benchmark': 'static',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'storage': settings.STORAGES['staticfiles']['BACKEND'],
+            'pages': pages,
+        }
+        dump(report, self.stdout, options['output'])
+
+    def measure_page(self, client, url):
+        response = client.get(url)
+        html = response.content.decode()
+        html_bytes = len(response.content)
+        assets, external = [], []
+        # dict.fromkeys: el mismo estático puede aparecer en <noscript>
+        for asset_url in dict.fromkeys(ASSET_RE.findall(html)):
+            if asset_url.startswith(settings.STATIC_URL):
+                assets.append(self.measure_asset(asset_url))
+            else:
+                external.append(asset_url)
+
+        cold = {'identity': html_bytes}
+        for encoding, _ in ENCODINGS:
+            cold[encoding] = html_bytes
+        for asset in assets:
+            for encoding in cold:
+                cold[encoding] += asset['bytes'][encoding]
+        # Con caché caliente los estáticos immutable no se vuelven a pedir; el
+        # resto se revalida (304 sin cuerpo)
+        revalidated = [asset['url'] for asset in assets if 'immutable' not in asset['cache_control']]
+        return {
+            'status': response.status_code,
+            'html_bytes': html_bytes,
+            'inline_css_bytes': sum(len(css.encode()) for css in INLINE_STYLE_RE.findall(html)),
+            'assets': assets,
+            'external_assets': external,
+            'cold_bytes': cold,
+            'cold_requests': 1 + len(assets),
+            'warm_bytes': html_bytes,
+            'warm_requests': 1 + len(revalidated),
+        }
+
+    def measure_asset(self, url):
+        factory = RequestFactory()
+        path = url[len(settings.STATIC_URL):]
+        sizes = {}
+        cache_control = ''
+        for encoding in ('identity',) + tuple(encoding for encoding, _ in ENCODINGS):
+            response = serve(factory.get(url, HTTP_ACCEPT_ENCODING=encoding), path)
+            sizes[encoding] = sum(len(chunk) for chunk in response.streaming_content)
+            response.close()
+            cache_control = response['Cache-Control']
+        return {'url': url, 'bytes': sizes, 'cache_control': cache_control}
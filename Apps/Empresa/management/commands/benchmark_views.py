@@ -0,0 +1,158 @@
+import itertools
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from Apps.Empresa.benchmarking import dump, summarize
+from Apps.Empresa.models import Organization, UserProfile
+from Apps.Empresa.pagination import encode_cursor, get_page_size
+from Apps.Empresa.synthetic import search_queries
+
+SCENARIOS = [
+    'login', 'dashboard', 'dashboard_feed', 'dashboard_feed_page', 'public_feed',
+    'public_feed_search', 'organization_list', 'create_organization',
+    'edit_organization', 'delete_organization',
+]
+
+
+class Command(BaseCommand):
+    help = ('Mide latencia (p50/p90/p99) y throughput de las vistas principales con el '
+            'cliente de pruebas de Django y reporta el resultado como JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Peticiones por escenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Peticiones descartadas por escenario')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--username', default='benchmark-views')
+        parser.add_argument('--password', default='benchmark-123')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--instrumented', action='store_true',
+                            help='Mantiene activo QueryInstrumentationMiddleware durante la medición')
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        # Todas las peticiones salen de la misma IP: sin límite de peticiones
+        overrides = {'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'], 'EMPRESA_RATE_LIMITS': {}}
+        if not options['instrumented']:
+            overrides['EMPRESA_QUERY_INSTRUMENTATION'] = False
+        with override_settings(**overrides):
+            self.user = self.get_user(options['username'], options['password'])
+            self.password = options['password']
+            self.queries = itertools.cycle(search_queries(200, seed=options['seed']))
+            self.anonymous = Client()
+            self.client = Client()
+            self.client.force_login(self.user)
+
+            results = {}
+            for name in options['scenarios']:
+                results[name] = self.run_scenario(name, options['requests'], options['warmup'])
+                self.stderr.write('%-22s p50=%sms p99=%sms %s req/s' % (
+                    name, results[name]['p50_ms'], results[name]['p99_ms'],
+                    results[name]['throughput_per_s']))
+
+        report = {
+            'benchmark': 'views',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'organizations': Organization.objects.count(),
+            'requests_per_scenario': options['requests'],
+            'scenarios': results,
+        }
+        dump(report, self.stdout, options['output'])
+
+    def get_user(self, username, password):
+        user, created = User.objects.get_or_create(username=username, defaults={'email': 'bench@example.com'})
+        if created or not user.check_password(password):
+            user.set_password(password)
+            user.save()
+        profile, _ = UserProfile.objects.get_or_create(user=user, defaults={'email': user.email})
+        if not profile.organizations.exists():
+            Organization.objects.create(owner=profile, name='Benchmark', type='Tecnología',
+                                        website='https://bench.example.com', phone='3000000000',
+                                        nit='800000000-0', services='Consultoría')
+        return user
+
+    def organization_data(self, index):
+        return {
+            'name': 'Benchmark %d' % index, 'type': 'Tecnología',
+            'website': 'https://bench%d.example.com' % index, 'phone': '3000000000',
+            'nit': '80%07d-1' % index, 'services': 'Consultoría, Cloud',
+        }
+
+    def request(self, name, index):
+        """Ejecuta una petición del escenario y retorna la respuesta"""
+        if name == 'login':
+            client = Client()
+            return client.post(reverse('login'), {'username': self.user.username, 'password': self.password})
+        if name == 'public_feed':
+            return self.anonymous.get(reverse('public_feed'))
+        if name == 'public_feed_search':
+            return self.anonymous.get(reverse('public_feed'), {'search': next(self.queries)})
+        if name == 'dashboard_feed_page':
+            return self.client.get(reverse(name), {'cursor': self._cursor} if self._cursor else {})
+        if name in ('create_organization', 'edit_organization', 'delete_organization'):
+            return self.crud(name, index)
+        return self.client.get(reverse(name))
+
+    def crud(self, name, index):
+        if name == 'create_organization':
+            return self.client.post(reverse(name), self.organization_data(index))
+        # Organización de trabajo creada en prepare(), fuera de la medición
+        organization = self._scratch.pop()
+        if name == 'edit_organization':
+            data = self.organization_data(index)
+            data['name'] = 'Benchmark editada %d' % index
+            return self.client.post(reverse(name, args=[organization.pk]), data)
+        return self.client.post(reverse(name, args=[organization.pk]))
+
+    def prepare(self, name, count):
+        self._scratch = []
+        self._cursor = None
+        if name == 'dashboard_feed_page':
+            # Cursor de la segunda página del feed
+            pks = Organization.objects.order_by('-pk').values_list('pk', flat=True)[:get_page_size()]
+            if len(pks) == get_page_size():
+                self._cursor = encode_cursor(pks[len(pks) - 1])
+        if name in ('edit_organization', 'delete_organization'):
+            profile = self.user.profile
+            for index in range(count):
+                self._scratch.append(Organization.objects.create(owner=profile, **self.organization_data(index)))
+
+    def cleanup(self, name):
+        if name in ('create_organization', 'edit_organization'):
+            Organization.objects.filter(owner__user=self.user, name__startswith='Benchmark ').delete()
+
+    def run_scenario(self, name, requests, warmup):
+        self.prepare(name, requests + warmup)
+        latencies = []
+        query_counts = []
+        errors = 0
+        try:
+            for index in range(requests + warmup):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = self.request(name, index)
+                    elapsed = time.perf_counter() - start
+                if response.status_code >= 400:
+                    errors += 1
+                if index >= warmup:
+                    latencies.append(elapsed)
+                    query_counts.append(len(captured.captured_queries))
+        finally:
+            self.cleanup(name)
+        if not latencies:
+            raise CommandError('No se midió ninguna petición para %s' % name)
+        result = summarize(latencies)
+        result['errors'] = errors
+        result['queries_avg'] = round(sum(query_counts) / len(query_counts), 2)
+        return result
@@ -0,0 +1,71 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Apps.Empresa.images import THUMBNAIL_ROOT
+from Apps.Empresa.models import ChunkedUpload, Organization, UserProfile
+from Apps.Empresa.uploads import get_temp_dir
+
+
+class Command(BaseCommand):
+    help = ('Borra las cargas por partes vencidas y sus archivos y, con --orphans, los logos, '
+            'fotos y miniaturas de MEDIA_ROOT que ya no usa ninguna organización o perfil')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orphans', action='store_true',
+                            help='Busca también archivos huérfanos en MEDIA_ROOT')
+        parser.add_argument('--min-age', type=int, default=60 * 60,
+                            help='Segundos de antigüedad mínima de un huérfano (evita borrar cargas en curso)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo lista lo que se borraría')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        expired = list(ChunkedUpload.objects.expired())
+        for upload in expired:
+            if not dry_run:
+                upload.delete_file()
+                upload.delete()
+        self.stdout.write('%d cargas por partes vencidas' % len(expired))
+
+        # Archivos de cargas cuyo registro ya no existe
+        temp_dir = get_temp_dir()
+        parts = [name for name in os.listdir(temp_dir) if name.endswith('.part')] if os.path.isdir(temp_dir) else []
+        known = {'%s.part' % pk for pk in ChunkedUpload.objects.values_list('pk', flat=True)}
+        stray = [name for name in parts if name not in known]
+        if not dry_run:
+            for name in stray:
+                os.remove(os.path.join(temp_dir, name))
+        self.stdout.write('%d archivos de cargas sin registro' % len(stray))
+
+        if options['orphans']:
+            orphans = self.find_orphans(options['min_age'])
+            for name in orphans:
+                if dry_run:
+                    self.stdout.write('  %s' % name)
+                else:
+                    default_storage.delete(name)
+            self.stdout.write('%d archivos huérfanos en MEDIA_ROOT' % len(orphans))
+
+    def find_orphans(self, min_age):
+        cutoff = timezone.now() - timedelta(seconds=min_age)
+        orphans = []
+        for model in (Organization, UserProfile):
+            attribute = model.getCropAttribute()
+            used = set()
+            rows = model.objects.exclude(**{attribute: ''}).values_list(attribute, '%s_variants' % attribute)
+            for name, variants in rows.iterator():
+                used.add(name)
+                for kind in ('webp', 'fallback'):
+                    used.update((variants or {}).get(kind, {}).values())
+            directories = (model._meta.get_field(attribute).upload_to, THUMBNAIL_ROOT + model.getCropPath())
+            for directory in directories:
+                if not default_storage.exists(directory):
+                    continue
+                for filename in default_storage.listdir(directory)[1]:
+                    name = os.path.join(directory, filename)
+                    if name not in used and default_storage.get_modified_time(name) < cutoff:
+                        orphans.append(name)
+        return orphans
@@ -0,0 +1,158 @@
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from Apps.Empresa.models import Organization
+from Apps.Empresa.pagination import encode_cursor, get_page_size
+
+LIMIT_RE = re.compile(r'\bLIMIT\s+\d+\s*$', re.IGNORECASE)
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta EXPLAIN sobre las consultas que hace cada vista y señala los recorridos '
+            'secuenciales sobre tablas con más filas que el umbral')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Usuario para las vistas con login (por defecto el '
+                                               'dueño de la organización más reciente)')
+        parser.add_argument('--threshold', type=int,
+                            default=getattr(settings, 'EMPRESA_EXPLAIN_ROW_THRESHOLD', 10000),
+                            help='Filas a partir de las cuales un recorrido secuencial es un problema')
+        parser.add_argument('--search', default='consultoría', help='Búsqueda usada en public_feed')
+        parser.add_argument('--json', action='store_true', help='Reporte en JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError('EXPLAIN solo está soportado para Postgres y SQLite')
+        user = self.get_user(options['username'])
+        self.table_rows = {}
+        self.threshold = options['threshold']
+
+        overrides = {
+            'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver'],
+            'EMPRESA_QUERY_INSTRUMENTATION': False,
+            # Todas las peticiones salen de la misma IP
+            'EMPRESA_RATE_LIMITS': {},
+            # Sin caché para que cada vista ejecute todas sus consultas
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        }
+        report = []
+        with override_settings(**overrides):
+            client = Client()
+            client.force_login(user)
+            for name, url, params in self.get_requests(user, options['search']):
+                report.append(self.explain_view(client, name, url, params))
+
+        flagged = sum(len(view['flagged']) for view in report)
+        if options['json']:
+            self.stdout.write(json.dumps({'threshold': self.threshold, 'views': report},
+                                         indent=2, ensure_ascii=False))
+            return
+        for view in report:
+            self.stdout.write('%s: %d consultas' % (view['view'], view['queries']))
+            for scan in view['flagged']:
+                self.stdout.write(self.style.WARNING('  recorrido secuencial de %s (%s filas): %s' % (
+                    scan['table'], scan['rows'], scan['sql'][:160])))
+        style = self.style.WARNING if flagged else self.style.SUCCESS
+        self.stdout.write(style('%d recorridos secuenciales sobre tablas de más de %d filas' % (
+            flagged, self.threshold)))
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(profile__organizations__isnull=False).order_by(
+                '-profile__organizations__id').first()
+        if user is None:
+            raise CommandError('No se encontró un usuario con organizaciones; use --username')
+        return user
+
+    def get_requests(self, user, search):
+        organization = Organization.objects.filter(owner__user=user).order_by('-pk').first()
+        pks = list(Organization.objects.order_by('-pk').values_list('pk', flat=True)[:get_page_size()])
+        cursor = {'cursor': encode_cursor(pks[-1])} if pks else {}
+        requests = [
+            ('dashboard', reverse('dashboard'), {}),
+            ('dashboard_feed', reverse('dashboard_feed'), {}),
+            ('dashboard_feed_page', reverse('dashboard_feed_page'), cursor),
+            ('public_feed', reverse('public_feed'), {}),
+            ('public_feed (búsqueda)', reverse('public_feed'), {'search': search}),
+            ('organization_list', reverse('organization_list'), {}),
+            ('organization_export', reverse('organization_export'), {'since_id': pks[-1] if pks else 0}),
+        ]
+        if organization is not None:
+            requests.append(('edit_organization', reverse('edit_organization', args=[organization.pk]), {}))
+        return requests
+
+    def explain_view(self, client, name, url, params):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url, params)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        flagged = []
+        seen = set()
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                continue
+            seen.add(sql)
+            for table in self.sequential_scans(sql):
+                rows = self.count_rows(table)
+                if rows is not None and rows > self.threshold:
+                    flagged.append({'table': table, 'rows': rows, 'sql': sql})
+        return {'view': name, 'status': response.status_code,
+                'queries': len(captured.captured_queries), 'flagged': flagged}
+
+    def sequential_scans(self, sql):
+        """Tablas que el plan de ``sql`` recorre completas"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return list(self.postgres_scans(plan[0]['Plan']))
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        # Un SCAN en el orden del rowid con LIMIT y sin ordenar aparte (p. ej.
+        # ORDER BY id DESC LIMIT 25) se detiene al llegar al límite
+        if LIMIT_RE.search(sql) and not any('TEMP B-TREE' in detail for detail in details):
+            return []
+        tables = []
+        for detail in details:
+            words = detail.split()
+            # "SCAN tabla" es un recorrido completo; "SEARCH" o "USING INDEX" usan un índice
+            if words[:1] == ['SCAN'] and len(words) >= 2 and 'USING' not in words:
+                tables.append(words[1])
+        return tables
+
+    def postgres_scans(self, node):
+        if node.get('Node Type') == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', []):
+            yield from self.postgres_scans(child)
+
+    def count_rows(self, table):
+        if table not in self.table_rows:
+            if table not in connection.introspection.table_names():
+                # Alias de una subconsulta o tabla temporal del plan
+                self.table_rows[table] = None
+            elif connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                                   [connection.ops.quote_name(table)])
+                    row = cursor.fetchone()
+                self.table_rows[table] = row[0] if row else None
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM %s' % connection.ops.quote_name(table))
+                    self.table_rows[table] = cursor.fetchone()[0]
+        return self.table_rows[table]
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Apps.Empresa.importer import FORMATS, detect_format, import_organizations
+from Apps.Empresa.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = ('Importa organizaciones desde un archivo CSV o NDJSON (name, type, website, phone, '
+            'nit, services), validando cada fila y descartando NIT repetidos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo .csv, .ndjson o .jsonl')
+        parser.add_argument('--owner', required=True, help='Usuario dueño de las organizaciones importadas')
+        parser.add_argument('--format', choices=FORMATS, help='Por defecto según la extensión del archivo')
+        parser.add_argument('--batch-size', type=int, help='Por defecto EMPRESA_IMPORT_BATCH_SIZE')
+        parser.add_argument('--rejects', help='CSV de filas rechazadas (por defecto <archivo>.rejects.csv)')
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        try:
+            owner = UserProfile.objects.get(user__username=options['owner'])
+        except UserProfile.DoesNotExist:
+            raise CommandError('El usuario %s no existe o no tiene perfil' % options['owner'])
+        file_format = options['format'] or detect_format(options['path'])
+        rejects_path = options['rejects'] or '%s.rejects.csv' % options['path']
+
+        start = time.perf_counter()
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as stream, \
+                    open(rejects_path, 'w', encoding='utf-8', newline='') as rejects:
+                result = import_organizations(stream, file_format, owner,
+                                              batch_size=options['batch_size'], rejects=rejects)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            '%d organizaciones importadas en %.1fs (%.0f filas/s)' % (
+                result.created, elapsed, (result.created + result.rejected) / elapsed if elapsed else 0)))
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(
+                '%d filas rechazadas (%d por NIT repetido), ver %s' % (
+                    result.rejected, result.duplicates, rejects_path)))
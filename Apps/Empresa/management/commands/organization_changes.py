@@ -0,0 +1,52 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Apps.Empresa.changes import MAX_LIMIT, latest_sequence, prune_changes, read_changes
+
+
+class Command(BaseCommand):
+    help = ('Escribe como NDJSON los cambios de organizaciones posteriores a una secuencia, en lotes; '
+            'con --follow sigue esperando cambios nuevos. La secuencia desde la que seguir se informa '
+            'en stderr')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0, help='Última secuencia ya procesada')
+        parser.add_argument('--limit', type=int, help='Cambios por lote (por defecto EMPRESA_CHANGES_BATCH_SIZE)')
+        parser.add_argument('--follow', action='store_true', help='No termina: consulta cada --interval segundos')
+        parser.add_argument('--interval', type=float, default=5)
+        parser.add_argument('--latest', action='store_true',
+                            help='Solo imprime la última secuencia (para empezar después de una exportación)')
+        parser.add_argument('--prune-days', type=int,
+                            help='Solo borra los cambios con más de estos días de antigüedad')
+
+    def handle(self, *args, **options):
+        if options['latest']:
+            self.stdout.write(str(latest_sequence()))
+            return
+        if options['prune_days'] is not None:
+            deleted = prune_changes(timedelta(days=options['prune_days']))
+            self.stdout.write(self.style.SUCCESS('%d cambios borrados' % deleted))
+            return
+        limit = options['limit']
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise CommandError('--limit debe estar entre 1 y %d' % MAX_LIMIT)
+
+        since = options['since']
+        try:
+            while True:
+                batch = read_changes(since, limit)
+                for change in batch.changes:
+                    self.stdout.write(json.dumps(change, ensure_ascii=False, separators=(',', ':')))
+                since = batch.next
+                if batch.has_more:
+                    continue
+                if not options['follow']:
+                    break
+                self.stdout.flush()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stderr.write('next=%d' % since)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from Apps.Empresa.images import process_image
+from Apps.Empresa.models import Organization, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas y variantes WebP de los logos y fotos de perfil existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenera también las imágenes que ya tienen variantes')
+
+    def handle(self, *args, **options):
+        for model in (Organization, UserProfile):
+            attribute = model.getCropAttribute()
+            variants_attribute = '%s_variants' % attribute
+            queryset = model.objects.exclude(**{attribute: ''}).exclude(**{'%s__isnull' % attribute: True})
+            processed = 0
+            for pk, variants in queryset.values_list('pk', variants_attribute).iterator():
+                if options['force'] and variants:
+                    model.objects.filter(pk=pk).update(**{variants_attribute: {}})
+                try:
+                    if process_image(model._meta.label, pk):
+                        processed += 1
+                except (OSError, ValueError) as error:
+                    self.stderr.write('%s %s: %s' % (model.__name__, pk, error))
+            self.stdout.write('%s: %d imágenes procesadas' % (model.__name__, processed))
@@ -0,0 +1,190 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Apps.Empresa.benchmarking import dump, summarize
+
+# Se ejecuta en un proceso nuevo: importa ProjectOpp.wsgi (o asgi), le hace
+# dos peticiones y escribe los tiempos como JSON. Las marcas en stderr separan
+# las líneas de -X importtime del arranque de las de la primera petición.
+CHILD = r'''
+import json
+import sys
+import time
+
+start = time.perf_counter()
+entry, path, host = sys.argv[1:4]
+application = __import__('ProjectOpp.%s' % entry, fromlist=['application']).application
+booted = time.perf_counter()
+boot_modules = set(sys.modules)
+sys.stderr.write('profile_startup: boot\n')
+
+
+def wsgi_request():
+    import io
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'PATH_INFO': path, 'HTTP_HOST': host, 'SERVER_NAME': host, 'REMOTE_ADDR': '127.0.0.1',
+               'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr}
+    setup_testing_defaults(environ)
+    statuses = []
+    result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(result)
+    finally:
+        result.close()
+    return int(statuses[0].split()[0])
+
+
+def asgi_request():
+    import asyncio
+    from asgiref.testing import ApplicationCommunicator
+
+    async def call():
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                 'root_path': '', 'headers': [(b'host', host.encode())], 'client': ('127.0.0.1', 0),
+                 'server': (host, 80)}
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        response = await communicator.receive_output(60)
+        while (await communicator.receive_output(60)).get('more_body'):
+            pass
+        return response['status']
+
+    return asyncio.run(call())
+
+
+request = wsgi_request if entry == 'wsgi' else asgi_request
+status = request()
+first = time.perf_counter()
+sys.stderr.write('profile_startup: first-request\n')
+request()
+second = time.perf_counter()
+print(json.dumps({
+    'status': status,
+    'boot': booted - start,
+    'first_request': first - booted,
+    'second_request': second - first,
+    'boot_modules': sorted(boot_modules),
+    'first_request_modules': sorted(set(sys.modules) - boot_modules),
+}))
+'''
+
+# Módulos pesados o de rutas poco usadas que conviene no cargar al arrancar
+WATCHED = (
+    'PIL.Image', 'brotli', 'csv', 'django.contrib.admin.options', 'django.contrib.auth.forms',
+    'Apps.Empresa.admin', 'Apps.Empresa.export', 'Apps.Empresa.forms', 'Apps.Empresa.images',
+    'Apps.Empresa.importer', 'Apps.Empresa.uploads',
+)
+
+NEXT_PHASE = {'boot': 'first-request', 'first-request': 'second-request'}
+
+
+def parse_importtime(stderr):
+    """Líneas de ``-X importtime`` como ``(fase, módulo, propio_us, acumulado_us, profundidad)``.
+    Cada marca del proceso hijo cierra una fase: lo que sigue es de la siguiente"""
+    phase = 'boot'
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith('profile_startup: '):
+            phase = NEXT_PHASE[line.split(': ', 1)[1]]
+            continue
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((phase, name.strip(), int(own), int(cumulative), (len(name) - len(name.lstrip())) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = ('Mide el arranque de ProjectOpp en procesos nuevos: tiempo de importación por módulo '
+            '(como python -X importtime), tiempo hasta la primera respuesta y qué módulos pesados '
+            'se cargan al arrancar o con la primera petición')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--path', default='/feed/', help='URL de la primera petición')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--runs', type=int, default=5, help='Procesos que se miden (sin importtime)')
+        parser.add_argument('--top', type=int, default=25, help='Módulos más lentos que se listan')
+        parser.add_argument('--output', help='Ruta donde guardar el reporte JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = os.environ.get('DJANGO_SETTINGS_MODULE', 'ProjectOpp.settings')
+        # El proceso hijo ve los mismos módulos que este (settings fuera del proyecto incluidos)
+        env['PYTHONPATH'] = os.pathsep.join([str(settings.BASE_DIR)] + [path for path in sys.path if path])
+        arguments = [options['entry'], options['path'], options['host']]
+
+        profiled, stderr = self.run_child(['-X', 'importtime'], arguments, env)
+        timings = [self.run_child([], arguments, env)[0] for _ in range(options['runs'])]
+        rows = parse_importtime(stderr)
+
+        phases = {}
+        for phase in ('boot', 'first-request'):
+            selected = [row for row in rows if row[0] == phase]
+            packages = {}
+            for _, name, own, _, _ in selected:
+                package = name.split('.')[0]
+                packages[package] = packages.get(package, 0) + own
+            phases[phase] = {
+                'modules': len(selected),
+                'import_ms': round(sum(own for _, _, own, _, _ in selected) / 1000, 3),
+                'packages_ms': {package: round(total / 1000, 3) for package, total in
+                                sorted(packages.items(), key=lambda item: -item[1])[:options['top']]},
+            }
+        slowest = sorted(rows, key=lambda row: -row[3])[:options['top']]
+        loaded = {}
+        for name in WATCHED:
+            if name in profiled['boot_modules']:
+                loaded[name] = 'boot'
+            elif name in profiled['first_request_modules']:
+                loaded[name] = 'first_request'
+            else:
+                loaded[name] = None
+
+        def summary(key):
+            return summarize([timing[key] for timing in timings])
+
+        report = {
+            'benchmark': 'startup',
+            'timestamp': time.time(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'entry': options['entry'],
+            'path': options['path'],
+            'status': profiled['status'],
+            'runs': options['runs'],
+            'boot': summary('boot'),
+            'first_request': summary('first_request'),
+            'second_request': summary('second_request'),
+            'time_to_first_response_ms': round(
+                sorted(timing['boot'] + timing['first_request'] for timing in timings)[len(timings) // 2] * 1000, 3
+            ) if timings else None,
+            'imports': phases,
+            'slowest_modules': [
+                {'module': name, 'phase': phase, 'self_ms': round(own / 1000, 3),
+                 'cumulative_ms': round(cumulative / 1000, 3), 'depth': depth}
+                for phase, name, own, cumulative, depth in slowest
+            ],
+            'watched_modules': loaded,
+        }
+        self.stderr.write('arranque p50=%sms, primera petición p50=%sms, segunda p50=%sms (%s)' % (
+            report['boot']['p50_ms'], report['first_request']['p50_ms'],
+            report['second_request']['p50_ms'], profiled['status']))
+        dump(report, self.stdout, options['output'])
+
+    def run_child(self, flags, arguments, env):
+        process = subprocess.run([sys.executable] + flags + ['-c', CHILD] + arguments, env=env,
+                                 cwd=str(settings.BASE_DIR), capture_output=True, text=True)
+        if process.returncode != 0:
+            raise CommandError('El proceso de arranque falló:\n%s' % process.stderr[-4000:])
+        return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
@@ -0,0 +1,80 @@
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Apps.Empresa.benchmarking import percentile
+from Apps.Empresa.instrumentation import get_budget, rotated_path
+
+
+class Command(BaseCommand):
+    help = 'Resume por vista las consultas registradas por QueryInstrumentationMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Archivo de registro (por defecto EMPRESA_QUERY_REPORT_PATH)')
+        parser.add_argument('--json', action='store_true', help='Imprime el reporte como JSON')
+        parser.add_argument('--reset', action='store_true', help='Borra el registro después de leerlo')
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'EMPRESA_QUERY_REPORT_PATH', None)
+        # El archivo rotado (<archivo>.1) va primero: tiene las peticiones anteriores
+        paths = [name for name in (rotated_path(path), path) if os.path.exists(name)] if path else []
+        if not paths:
+            raise CommandError('No hay registro de consultas en %s' % path)
+
+        entries = defaultdict(list)
+        for name in paths:
+            with open(name, encoding='utf-8') as handle:
+                for line in handle:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry['url_name'] or '(sin nombre)'].append(entry)
+
+        report = [self.summarize(url_name, rows) for url_name, rows in sorted(entries.items())]
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            self.print_table(report)
+        if options['reset']:
+            for name in paths:
+                os.remove(name)
+
+    def summarize(self, url_name, rows):
+        queries = [row['queries'] for row in rows]
+        db_ms = [row['db_ms'] for row in rows]
+        budget = get_budget(url_name)
+        patterns = Counter(sql for row in rows for sql in row['n_plus_one'])
+        return {
+            'url_name': url_name,
+            'requests': len(rows),
+            'queries_avg': round(sum(queries) / len(rows), 2),
+            'queries_p95': percentile(queries, 0.95),
+            'queries_max': max(queries),
+            'duplicates_avg': round(sum(row['duplicates'] for row in rows) / len(rows), 2),
+            'db_ms_avg': round(sum(db_ms) / len(rows), 3),
+            'db_ms_p95': percentile(db_ms, 0.95),
+            'template_ms_avg': round(sum(row['template_ms'] for row in rows) / len(rows), 3),
+            'total_ms_p95': percentile([row['total_ms'] for row in rows], 0.95),
+            'budget': budget,
+            'over_budget': sum(1 for row in rows if budget is not None and row['queries'] > budget),
+            'n_plus_one': [sql for sql, _ in patterns.most_common(5)],
+        }
+
+    def print_table(self, report):
+        header = '%-24s %8s %8s %8s %8s %8s %10s %10s %8s %8s' % (
+            'vista', 'peticion', 'sql avg', 'sql max', 'dup avg', 'budget', 'db ms avg', 'tpl ms avg',
+            'excedido', 'n+1')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in report:
+            line = '%-24s %8d %8.2f %8d %8.2f %8s %10.3f %10.3f %8d %8d' % (
+                row['url_name'], row['requests'], row['queries_avg'], row['queries_max'],
+                row['duplicates_avg'], row['budget'] if row['budget'] is not None else '-',
+                row['db_ms_avg'], row['template_ms_avg'], row['over_budget'], len(row['n_plus_one']))
+            style = self.style.ERROR if row['over_budget'] or row['n_plus_one'] else self.style.SUCCESS
+            self.stdout.write(style(line))
+        for row in report:
+            for sql in row['n_plus_one']:
+                self.stdout.write('N+1 en %s: %s' % (row['url_name'], sql))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Apps.Empresa.caching import invalidate_all
+from Apps.Empresa.models import Service, TypeFacet
+
+
+class Command(BaseCommand):
+    help = ('Recalcula desde cero los conteos de las facetas del directorio '
+            '(organizaciones por tipo y por servicio)')
+
+    def handle(self, *args, **options):
+        Service.refresh_counts()
+        types = TypeFacet.rebuild()
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('%d tipos y %d servicios con organizaciones' % (
+            types, Service.objects.popular().count())))
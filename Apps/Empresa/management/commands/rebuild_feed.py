@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from Apps.Empresa.caching import invalidate_all
+from Apps.Empresa.models import OrganizationFeedEntry
+
+
+class Command(BaseCommand):
+    help = ('Reconstruye desde cero el modelo de lectura de los feeds (OrganizationFeedEntry) '
+            'a partir de las organizaciones')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Filas por inserción')
+
+    def handle(self, *args, **options):
+        total = OrganizationFeedEntry.rebuild(batch_size=options['batch_size'])
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('%d organizaciones en el feed' % total))
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+def fill_search_text(apps, schema_editor):
+    Organization = apps.get_model('Empresa', 'Organization')
+    batch = []
+    for organization in Organization.objects.only('name', 'type', 'services').iterator(chunk_size=2000):
+        organization.search_text = ' '.join(
+            part.lower() for part in (organization.name, organization.type, organization.services) if part
+        )
+        batch.append(organization)
+        if len(batch) >= 2000:
+            Organization.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Organization.objects.bulk_update(batch, ['search_text'])
+
+
+def create_trigram_index(apps, schema_editor):
+    # El índice de trigramas solo existe en Postgres; en SQLite se usa el
+    # índice en memoria de Apps/Empresa/search.py
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS empresa_org_search_trgm '
+        'ON "Empresa_organization" USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS empresa_org_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0004_organization_services'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 2000
+
+
+def split_services(services):
+    if not services:
+        return []
+    return [' '.join(service.split()) for service in services.split(',') if service.strip()]
+
+
+def services_to_tags(apps, schema_editor):
+    """Convierte en bloque el texto separado por comas en filas de Service"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    Service = apps.get_model('Empresa', 'Service')
+    Through = Organization.service_tags.through
+
+    rows = (Organization.objects.exclude(services__isnull=True).exclude(services='')
+            .values_list('pk', 'services').iterator(chunk_size=BATCH_SIZE))
+    names = {}
+    links = []
+    for pk, services in rows:
+        seen = set()
+        for service in split_services(services):
+            key = service.casefold()
+            names.setdefault(key, service)
+            if key not in seen:
+                seen.add(key)
+                links.append((pk, key))
+
+    Service.objects.bulk_create(
+        [Service(name=name, normalized_name=key) for key, name in names.items()],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    ids = dict(Service.objects.values_list('normalized_name', 'pk'))
+    Through.objects.bulk_create(
+        [Through(organization_id=pk, service_id=ids[key]) for pk, key in links],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    counts = Through.objects.values('service_id').annotate(total=Count('*')).order_by()
+    services = []
+    for row in counts:
+        services.append(Service(pk=row['service_id'], organization_count=row['total']))
+    Service.objects.bulk_update(services, ['organization_count'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0005_organization_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('normalized_name', models.CharField(max_length=100, unique=True)),
+                ('organization_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['normalized_name'],
+                'indexes': [models.Index(fields=['normalized_name'], name='empresa_service_prefix_idx', opclasses=['varchar_pattern_ops']), models.Index(fields=['-organization_count'], name='empresa_service_count_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='service_tags',
+            field=models.ManyToManyField(blank=True, related_name='organizations', to='Empresa.service'),
+        ),
+        migrations.RunPython(services_to_tags, migrations.RunPython.noop),
+    ]
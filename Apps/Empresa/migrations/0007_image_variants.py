@@ -0,0 +1,23 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0006_service'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
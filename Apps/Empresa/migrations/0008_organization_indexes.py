@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:24
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0007_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(fields=['owner', '-id'], name='empresa_org_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(fields=['nit'], name='empresa_org_nit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='empresa_org_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=models.Index(django.db.models.functions.text.Lower('type'), name='empresa_org_type_lower_idx'),
+        ),
+    ]
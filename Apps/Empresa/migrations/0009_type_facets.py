@@ -0,0 +1,48 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:33
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_types(apps, schema_editor):
+    """Crea las facetas de tipo con el conteo de las organizaciones existentes"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    TypeFacet = apps.get_model('Empresa', 'TypeFacet')
+
+    counts = {}
+    names = {}
+    totals = (Organization.objects.order_by().values('type')
+              .annotate(total=Count('*')).values_list('type', 'total'))
+    for organization_type, total in totals:
+        key = ' '.join((organization_type or '').split()).casefold()
+        if key:
+            counts[key] = counts.get(key, 0) + total
+            names.setdefault(key, ' '.join(organization_type.split()))
+    TypeFacet.objects.bulk_create([
+        TypeFacet(name=names[key], normalized_name=key, organization_count=total)
+        for key, total in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0008_organization_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TypeFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('normalized_name', models.CharField(max_length=50, unique=True)),
+                ('organization_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['normalized_name'],
+                'indexes': [models.Index(fields=['-organization_count'], name='empresa_typefacet_count_idx')],
+            },
+        ),
+        migrations.RunPython(count_types, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def unaccent_search_text(apps, schema_editor):
+    """Recalcula search_text en minúsculas y sin tildes (ver Apps/Empresa/search.py)"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    batch = []
+    for organization in Organization.objects.only('name', 'type', 'services').iterator(chunk_size=BATCH_SIZE):
+        organization.search_text = normalize_text(' '.join(
+            part for part in (organization.name, organization.type, organization.services) if part
+        ))
+        batch.append(organization)
+        if len(batch) >= BATCH_SIZE:
+            Organization.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Organization.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0009_type_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(unaccent_search_text, migrations.RunPython.noop),
+    ]
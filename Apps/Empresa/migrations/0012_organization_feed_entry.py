@@ -0,0 +1,110 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import unicodedata
+
+BATCH_SIZE = 2000
+
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def collapse(text):
+    return ' '.join(text.split())
+
+
+def srcset(storage, names):
+    return ', '.join('%s %sw' % (storage.url(name), size)
+                     for size, name in sorted(names.items(), key=lambda item: int(item[0])))
+
+
+def fill_feed(apps, schema_editor):
+    """Copia las organizaciones existentes (ver OrganizationFeedEntry.from_organization)"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    OrganizationFeedEntry = apps.get_model('Empresa', 'OrganizationFeedEntry')
+    batch = []
+    for organization in Organization.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        logo = organization.logo
+        variants = organization.logo_variants or {}
+        if not logo or variants.get('source') != logo.name:
+            variants = {}
+        fallback = variants.get('fallback') or {}
+        if fallback:
+            smallest = min(fallback, key=int)
+            logo_src = logo.storage.url(fallback[smallest])
+        else:
+            logo_src = logo.url if logo else ''
+        services = [collapse(service) for service in (organization.services or '').split(',') if service.strip()]
+        batch.append(OrganizationFeedEntry(
+            organization_id=organization.pk,
+            owner_id=organization.owner_id,
+            name=organization.name,
+            type=organization.type,
+            type_key=collapse(organization.type or '').casefold(),
+            services=services,
+            website=organization.website,
+            phone=organization.phone,
+            logo_src=logo_src,
+            logo_srcset=srcset(logo.storage, fallback) if fallback else '',
+            logo_webp_srcset=srcset(logo.storage, variants.get('webp') or {}),
+            search_key=normalize_text(' '.join(
+                part for part in (organization.name, organization.type, organization.services) if part
+            )),
+        ))
+        if len(batch) >= BATCH_SIZE:
+            OrganizationFeedEntry.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        OrganizationFeedEntry.objects.bulk_create(batch)
+
+
+def create_trigram_index(apps, schema_editor):
+    # Mismo índice que empresa_org_search_trgm (0005), sobre el modelo de lectura
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS empresa_feed_search_trgm '
+        'ON "Empresa_organizationfeedentry" USING gin (search_key gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS empresa_feed_search_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0011_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationFeedEntry',
+            fields=[
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_entry', serialize=False, to='Empresa.organization')),
+                ('name', models.CharField(max_length=50)),
+                ('type', models.CharField(max_length=50)),
+                ('type_key', models.CharField(max_length=50)),
+                ('services', models.JSONField(default=list)),
+                ('website', models.CharField(max_length=80)),
+                ('phone', models.CharField(max_length=50)),
+                ('logo_src', models.CharField(blank=True, max_length=255)),
+                ('logo_srcset', models.TextField(blank=True)),
+                ('logo_webp_srcset', models.TextField(blank=True)),
+                ('search_key', models.TextField(blank=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='Empresa.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-organization'], name='empresa_feed_owner_idx'), models.Index(fields=['type_key', '-organization'], name='empresa_feed_type_idx')],
+            },
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.3 on 2026-10-18 14:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0012_organization_feed_entry'),
+    ]
+
+    operations = [
+        # Las organizaciones existentes quedan con la fecha de la migración
+        migrations.AddField(
+            model_name='organization',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='OrganizationChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('organization_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('created', 'Alta'), ('updated', 'Modificación'), ('deleted', 'Baja')], max_length=10)),
+                ('changed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def seed_changes(apps, schema_editor):
+    """Un alta por cada organización existente: un consumidor que empieza en
+    ``since=0`` recibe todo el directorio"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    OrganizationChange = apps.get_model('Empresa', 'OrganizationChange')
+    db_alias = schema_editor.connection.alias
+    now = timezone.now()
+    batch = []
+    pks = Organization.objects.using(db_alias).order_by('pk').values_list('pk', flat=True)
+    for pk in pks.iterator(chunk_size=2000):
+        batch.append(OrganizationChange(organization_id=pk, action='created', changed_at=now))
+        if len(batch) >= 2000:
+            OrganizationChange.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    if batch:
+        OrganizationChange.objects.using(db_alias).bulk_create(batch)
+
+
+def unseed_changes(apps, schema_editor):
+    OrganizationChange = apps.get_model('Empresa', 'OrganizationChange')
+    OrganizationChange.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0013_organization_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_changes, unseed_changes),
+    ]
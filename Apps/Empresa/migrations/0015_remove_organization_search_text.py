@@ -0,0 +1,56 @@
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def drop_trigram_index(apps, schema_editor):
+    # La búsqueda usa empresa_feed_search_trgm (0012) sobre el modelo de lectura
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS empresa_org_search_trgm')
+
+
+def restore_search_text(apps, schema_editor):
+    """Vuelve a llenar search_text y a crear su índice (ver 0005 y 0010)"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    organizations = Organization.objects.using(db_alias).only('name', 'type', 'services')
+    for organization in organizations.iterator(chunk_size=BATCH_SIZE):
+        organization.search_text = normalize_text(' '.join(
+            part for part in (organization.name, organization.type, organization.services) if part
+        ))
+        batch.append(organization)
+        if len(batch) >= BATCH_SIZE:
+            Organization.objects.using(db_alias).bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Organization.objects.using(db_alias).bulk_update(batch, ['search_text'])
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS empresa_org_search_trgm '
+        'ON "Empresa_organization" USING gin (search_text gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0014_seed_organization_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_trigram_index, restore_search_text),
+        migrations.RemoveField(
+            model_name='organization',
+            name='search_text',
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations, models
+from django.db.models import F
+
+# Lock de Postgres (pg_advisory_xact_lock) que ordena las secuencias del registro de cambios
+OUTBOX_LOCK_ID = 0x456d707265736131
+
+POSTGRES_TRIGGER = '''
+CREATE SEQUENCE IF NOT EXISTS empresa_change_sequence;
+SELECT setval('empresa_change_sequence',
+              COALESCE((SELECT MAX(sequence) FROM "Empresa_organizationchange"), 0) + 1, false);
+CREATE OR REPLACE FUNCTION empresa_assign_change_sequence() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    -- Corre al confirmar: el lock dura solo hasta el fin de esta transacción
+    -- y las secuencias se confirman en el orden en que se asignan
+    PERFORM pg_advisory_xact_lock(%d);
+    UPDATE "Empresa_organizationchange" SET sequence = nextval('empresa_change_sequence') WHERE id = NEW.id;
+    RETURN NULL;
+END
+$$;
+CREATE CONSTRAINT TRIGGER empresa_change_sequence AFTER INSERT ON "Empresa_organizationchange"
+    DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION empresa_assign_change_sequence();
+''' % OUTBOX_LOCK_ID
+
+POSTGRES_DROP = '''
+DROP TRIGGER IF EXISTS empresa_change_sequence ON "Empresa_organizationchange";
+DROP FUNCTION IF EXISTS empresa_assign_change_sequence();
+DROP SEQUENCE IF EXISTS empresa_change_sequence;
+'''
+
+# SQLite serializa las escrituras: la secuencia es el id
+SQLITE_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS empresa_change_sequence AFTER INSERT ON "Empresa_organizationchange"
+BEGIN
+    UPDATE "Empresa_organizationchange" SET sequence = NEW.id WHERE id = NEW.id;
+END
+'''
+
+SQLITE_DROP = 'DROP TRIGGER IF EXISTS empresa_change_sequence'
+
+
+def create_trigger(apps, schema_editor):
+    OrganizationChange = apps.get_model('Empresa', 'OrganizationChange')
+    OrganizationChange.objects.using(schema_editor.connection.alias).update(sequence=F('pk'))
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_TRIGGER)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0015_remove_organization_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationchange',
+            name='sequence',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,91 @@
+import unicodedata
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 2000
+
+
+def normalize_key(name):
+    decomposed = unicodedata.normalize('NFKD', ' '.join(name.split()).casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def unaccent_services(Organization, Service):
+    """Recalcula ``normalized_name`` y une los servicios que solo se distinguían por tildes"""
+    Through = Organization.service_tags.through
+    survivors = {}
+    renamed = []
+    # Hay un servicio por nombre distinto: se leen todos antes de borrar filas
+    for pk, normalized_name in list(Service.objects.order_by('pk').values_list('pk', 'normalized_name')):
+        key = normalize_key(normalized_name)
+        survivor = survivors.setdefault(key, pk)
+        if survivor != pk:
+            # Las organizaciones del duplicado pasan al primer servicio con esa clave
+            organizations = Through.objects.filter(service_id=pk).values_list('organization_id', flat=True)
+            Through.objects.bulk_create(
+                [Through(organization_id=organization, service_id=survivor) for organization in organizations],
+                batch_size=BATCH_SIZE, ignore_conflicts=True,
+            )
+            Through.objects.filter(service_id=pk).delete()
+            Service.objects.filter(pk=pk).delete()
+        elif key != normalized_name:
+            renamed.append(Service(pk=pk, normalized_name=key))
+    # Después de borrar los duplicados: ninguna otra fila tiene ya estas claves
+    Service.objects.bulk_update(renamed, ['normalized_name'], batch_size=BATCH_SIZE)
+    counts = (Through.objects.filter(service_id=OuterRef('pk'))
+              .order_by().values('service_id').annotate(total=Count('*')).values('total'))
+    Service.objects.update(organization_count=Coalesce(Subquery(counts), Value(0)))
+
+
+def unaccent_type_facets(Organization, TypeFacet):
+    counts = {}
+    names = {}
+    totals = (Organization.objects.order_by().values('type')
+              .annotate(total=Count('*')).values_list('type', 'total'))
+    for organization_type, total in totals:
+        key = normalize_key(organization_type or '')
+        if key:
+            counts[key] = counts.get(key, 0) + total
+            names.setdefault(key, ' '.join(organization_type.split()))
+    TypeFacet.objects.all().delete()
+    TypeFacet.objects.bulk_create([
+        TypeFacet(name=names[key], normalized_name=key, organization_count=total)
+        for key, total in counts.items()
+    ])
+
+
+def unaccent_feed_type_keys(OrganizationFeedEntry):
+    batch = []
+    for entry in OrganizationFeedEntry.objects.only('type', 'type_key').iterator(chunk_size=BATCH_SIZE):
+        key = normalize_key(entry.type or '')
+        if key != entry.type_key:
+            entry.type_key = key
+            batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            OrganizationFeedEntry.objects.bulk_update(batch, ['type_key'])
+            batch = []
+    if batch:
+        OrganizationFeedEntry.objects.bulk_update(batch, ['type_key'])
+
+
+def unaccent_facet_keys(apps, schema_editor):
+    """Claves de tipo y servicio sin tildes, como el índice de búsqueda en
+    memoria (ver normalize_service_name en Apps/Empresa/models.py)"""
+    Organization = apps.get_model('Empresa', 'Organization')
+    unaccent_services(Organization, apps.get_model('Empresa', 'Service'))
+    unaccent_type_facets(Organization, apps.get_model('Empresa', 'TypeFacet'))
+    unaccent_feed_type_keys(apps.get_model('Empresa', 'OrganizationFeedEntry'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Empresa', '0016_organization_change_sequence'),
+    ]
+
+    operations = [
+        # Los servicios unidos no se pueden volver a separar
+        migrations.RunPython(unaccent_facet_keys, migrations.RunPython.noop),
+    ]
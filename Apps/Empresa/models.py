@@ -1,17 +1,42 @@
-from django.db import models
+import os
+import uuid
+from datetime import timedelta
+
+from django.db import models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .search import normalize_text
 # Create your models here.
 
 
+def split_services(services):
+    """Separa un texto de servicios por comas, sin vacíos ni espacios extra"""
+    if not services:
+        return []
+    return [' '.join(service.split()) for service in services.split(',') if service.strip()]
+
+
+def normalize_service_name(name):
+    """Clave única de un servicio o tipo: espacios colapsados y ``normalize_text``
+    (minúsculas y sin tildes, como el índice de búsqueda en memoria)"""
+    return normalize_text(' '.join(name.split()))
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User,related_name="profile",on_delete=models.CASCADE)
     image = models.ImageField(upload_to="uploaded/img/profile_photos/", null=True, blank=True)
+    # Miniaturas generadas por Apps/Empresa/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     first_name = models.CharField(max_length=30,blank=True,null=True)
     last_name = models.CharField(max_length=30,blank=True,null=True)
     #language=models.CharField(max_length=5, default='es-es')
     email = models.CharField(max_length=50)
     def __str__(self):              # __unicode__ on Python 2
-        return_name = str(self.user.id.__str__()+'_user_profile')
+        # user_id evita consultar el usuario solo para mostrar el perfil
+        return_name = str(self.user_id) + '_user_profile'
         return return_name
 
     @property
@@ -20,24 +45,487 @@ class UserProfile(models.Model):
             return self.image.url
         return None
 
+    @property
+    def get_image_variants(self):
+        """URLs de las miniaturas (``src``, ``srcset``, ``webp_srcset``) para los templates"""
+        from .images import ImageVariants
+        return ImageVariants(self.image, self.image_variants)
+
+    @staticmethod
+    def getCropAttribute():
+        return "image"
+    @staticmethod
+    def getCropPath():
+        return "profile_photos/"
+    @staticmethod
+    def getCropSizes():
+        # Avatar de la barra de navegación (32px) y de la barra lateral (150px), a 1x y 2x
+        return (64, 150, 300)
+
+class ServiceQuerySet(models.QuerySet):
+    def exact(self, name):
+        return self.filter(normalized_name=normalize_service_name(name))
+
+    def prefix(self, prefix):
+        return self.filter(normalized_name__startswith=normalize_service_name(prefix))
+
+    def popular(self):
+        return self.filter(organization_count__gt=0).order_by('-organization_count', 'normalized_name')
+
+
+class Service(models.Model):
+    name = models.CharField(max_length=100)
+    normalized_name = models.CharField(max_length=100, unique=True)
+    # Número de organizaciones que ofrecen el servicio, mantenido por señales
+    organization_count = models.PositiveIntegerField(default=0)
+
+    objects = ServiceQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['normalized_name']
+        indexes = [
+            # varchar_pattern_ops permite que LIKE 'prefijo%' use el índice en Postgres
+            models.Index(fields=['normalized_name'], name='empresa_service_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['-organization_count'], name='empresa_service_count_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def get_or_create_many(cls, names):
+        """Retorna los servicios para ``names`` creando en bloque los que falten"""
+        wanted = {}
+        for name in names:
+            wanted.setdefault(normalize_service_name(name), name)
+        if not wanted:
+            return []
+        existing = {service.normalized_name: service
+                    for service in cls.objects.filter(normalized_name__in=wanted)}
+        missing = [cls(name=name, normalized_name=key) for key, name in wanted.items() if key not in existing]
+        if missing:
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            existing = {service.normalized_name: service
+                        for service in cls.objects.filter(normalized_name__in=wanted)}
+        return [existing[key] for key in wanted]
+
+    @classmethod
+    def refresh_counts(cls, service_ids=None):
+        """Recalcula ``organization_count`` para los servicios indicados (o todos)"""
+        through = Organization.service_tags.through
+        counts = (through.objects.filter(service_id=OuterRef('pk'))
+                  .order_by().values('service_id').annotate(total=Count('*')).values('total'))
+        services = cls.objects.all()
+        if service_ids is not None:
+            services = services.filter(pk__in=list(service_ids))
+        services.update(organization_count=Coalesce(Subquery(counts), Value(0)))
+
+
+
+class TypeFacetQuerySet(models.QuerySet):
+    def popular(self):
+        return self.filter(organization_count__gt=0).order_by('-organization_count', 'normalized_name')
+
+
+class TypeFacet(models.Model):
+    """Conteo de organizaciones por tipo para los filtros del directorio"""
+    name = models.CharField(max_length=50)
+    # Misma normalización que los servicios (ver normalize_service_name)
+    normalized_name = models.CharField(max_length=50, unique=True)
+    # Mantenido por las señales de Organization (ver Apps/Empresa/signals.py)
+    organization_count = models.PositiveIntegerField(default=0)
+
+    objects = TypeFacetQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['normalized_name']
+        indexes = [
+            models.Index(fields=['-organization_count'], name='empresa_typefacet_count_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def adjust(cls, organization_type, delta):
+        """Suma ``delta`` al conteo del tipo, creando la faceta si no existe"""
+        key = normalize_service_name(organization_type or '')
+        if not key or not delta:
+            return
+        if delta > 0:
+            cls.objects.get_or_create(normalized_name=key, defaults={'name': ' '.join(organization_type.split())})
+            facets = cls.objects.filter(normalized_name=key)
+        else:
+            # El conteo es positivo: nunca se resta por debajo de cero
+            facets = cls.objects.filter(normalized_name=key, organization_count__gte=-delta)
+        facets.update(organization_count=F('organization_count') + delta)
+
+    @classmethod
+    def rebuild(cls):
+        """Recalcula todas las facetas de tipo desde las organizaciones"""
+        counts = {}
+        names = {}
+        totals = (Organization.objects.order_by().values('type')
+                  .annotate(total=Count('*')).values_list('type', 'total'))
+        for organization_type, total in totals:
+            key = normalize_service_name(organization_type or '')
+            if key:
+                counts[key] = counts.get(key, 0) + total
+                names.setdefault(key, ' '.join(organization_type.split()))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([
+                cls(name=names[key], normalized_name=key, organization_count=total)
+                for key, total in counts.items()
+            ])
+        return len(counts)
+
+
+# Campos que muestran las tarjetas de organizaciones (feeds, dashboard). owner_id
+# se incluye porque el related manager lo lee al asignar el dueño conocido
+FEED_FIELDS = ('id', 'owner', 'name', 'type', 'website', 'phone', 'services', 'logo', 'logo_variants')
+# Listados que además muestran el NIT y el dueño (mis organizaciones, admin)
+OWNER_LIST_FIELDS = FEED_FIELDS + (
+    'nit', 'owner__email', 'owner__first_name', 'owner__last_name',
+    'owner__user__username', 'owner__user__first_name', 'owner__user__last_name',
+)
+# Campos de la exportación del directorio (ver Apps/Empresa/export.py)
+EXPORT_FIELDS = ('id', 'name', 'type', 'website', 'phone', 'nit', 'services', 'logo')
+
+
+class OrganizationQuerySet(models.QuerySet):
+    """Proyecciones reutilizables: cada una carga solo lo que muestra su vista"""
+
+    def for_feed(self):
+        return self.only(*FEED_FIELDS)
+
+    def for_owner_list(self):
+        # El dueño y su usuario vienen en la misma consulta (sin N+1 por fila)
+        return self.select_related('owner__user').only(*OWNER_LIST_FIELDS)
+
+    def for_export(self):
+        return self.only(*EXPORT_FIELDS).order_by('pk')
+
+    # LOWER() de SQLite solo convierte letras ASCII; Postgres convierte todas
+    def of_type(self, organization_type):
+        """Filtro sin distinguir mayúsculas que usa el índice funcional LOWER(type)"""
+        return self.alias(type_lower=Lower('type')).filter(type_lower=Lower(Value(organization_type)))
+
+    def offering(self, service):
+        """Organizaciones que ofrecen el servicio (clave normalizada)"""
+        return self.filter(service_tags__normalized_name=service)
+
+    def named(self, name):
+        """Filtro sin distinguir mayúsculas que usa el índice funcional LOWER(name)"""
+        return self.alias(name_lower=Lower('name')).filter(name_lower=Lower(Value(name)))
+
+
 class Organization(models.Model):
     name=models.CharField(max_length=50) #
     logo=models.ImageField(upload_to="uploaded/img/organization_logos/",blank=True)
+    # Miniaturas generadas por Apps/Empresa/images.py
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
     type=models.CharField(max_length=50)#
     website=models.CharField(max_length=80) #
     phone=models.CharField(max_length=50)
     nit=models.CharField(max_length=20)
     services = models.CharField(max_length=200, blank=True, null=True, help_text="Ingresa los servicios separados por comas (ej: Consultoría, Desarrollo, Marketing)")
     owner=models.ForeignKey(UserProfile, related_name="organizations", on_delete=models.CASCADE)
+    # Servicios normalizados; ``services`` se conserva como texto para mostrar las tarjetas
+    service_tags = models.ManyToManyField(Service, related_name="organizations", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrganizationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Organizaciones de un dueño de la más reciente a la más antigua
+            models.Index(fields=['owner', '-id'], name='empresa_org_owner_id_idx'),
+            # Deduplicación de la importación en bloque (Apps/Empresa/importer.py)
+            models.Index(fields=['nit'], name='empresa_org_nit_idx'),
+            # Filtros sin distinguir mayúsculas (of_type() y named())
+            models.Index(Lower('name'), name='empresa_org_name_lower_idx'),
+            models.Index(Lower('type'), name='empresa_org_type_lower_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+        # La fila, su entrada del feed y su registro de cambios (señales) se
+        # confirman juntos; dentro de otra transacción no agrega un savepoint
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
     @staticmethod
     def getCropAttribute():
         return "logo"
     @staticmethod
     def getCropPath():
         return "organization_logos/"
+    @staticmethod
+    def getCropSizes():
+        # Las tarjetas muestran el logo a 100px de alto, a 1x y 2x
+        return (100, 200)
+
+    @property
+    def get_logo_variants(self):
+        """URLs de las miniaturas (``src``, ``srcset``, ``webp_srcset``) para los templates"""
+        from .images import ImageVariants
+        return ImageVariants(self.logo, self.logo_variants)
 
     def get_services_list(self):
         """Retorna la lista de servicios como una lista de strings"""
-        if self.services:
-            return [service.strip() for service in self.services.split(',')]
-        return []
+        return split_services(self.services)
+
+    def set_services(self, services):
+        """Sincroniza ``service_tags`` con un texto separado por comas"""
+        self.service_tags.set(Service.get_or_create_many(split_services(services)))
+
+    def build_search_text(self):
+        """Retorna el texto en minúsculas y sin tildes sobre el que se indexa la organización
+        (``OrganizationFeedEntry.search_key``)"""
+        return normalize_text(' '.join(part for part in (self.name, self.type, self.services) if part))
+
+    @classmethod
+    def bulk_insert(cls, organizations):
+        """
+        Inserta ``organizations`` con ``bulk_create`` y asigna sus servicios.
+        ``bulk_create`` no emite señales: al terminar la carga completa hay que
+        llamar a ``Organization.bulk_insert_done()``.
+        """
+        cls.objects.bulk_create(organizations)
+        OrganizationFeedEntry.sync(organizations)
+        OrganizationChange.record(organizations, OrganizationChange.CREATED)
+        names = [name for organization in organizations for name in organization.get_services_list()]
+        services = {service.normalized_name: service.pk for service in Service.get_or_create_many(names)}
+        through = cls.service_tags.through
+        through.objects.bulk_create([
+            through(organization_id=organization.pk, service_id=services[normalize_service_name(name)])
+            for organization in organizations
+            for name in organization.get_services_list()
+        ], ignore_conflicts=True)
+        return organizations
+
+    @staticmethod
+    def bulk_insert_done():
+        """Recalcula facetas (servicios y tipos), cachés e índices de búsqueda y
+        sugerencias tras una carga en bloque"""
+        from .caching import invalidate_all
+        from .search import reset_backend
+        from .suggest import reset_suggest_index
+
+        Service.refresh_counts()
+        TypeFacet.rebuild()
+        invalidate_all()
+        reset_backend()
+        reset_suggest_index()
+
+
+class OrganizationFeedEntryQuerySet(models.QuerySet):
+    """Filtros de ``facets.Facets.filter`` sobre las claves normalizadas
+    (``type_key`` y ``Service.normalized_name``)"""
+
+    def of_type(self, organization_type):
+        return self.filter(type_key=normalize_service_name(organization_type))
+
+    def offering(self, service):
+        return self.filter(organization__service_tags__normalized_name=service)
+
+
+# Campos que se copian de la organización (además de la llave)
+FEED_ENTRY_FIELDS = ('owner', 'name', 'type', 'type_key', 'services', 'website', 'phone',
+                     'logo_src', 'logo_srcset', 'logo_webp_srcset', 'search_key')
+
+
+class OrganizationFeedEntry(models.Model):
+    """
+    Modelo de lectura de los feeds: una fila por organización con lo que
+    muestra su tarjeta ya calculado (servicios separados, URLs de las
+    miniaturas) y el texto de búsqueda. Comparte la llave con la organización,
+    así los cursores, las claves de tarjeta y los resultados de búsqueda
+    sirven igual. Lo mantienen las señales de ``Organization``, el
+    procesamiento de imágenes y ``Organization.bulk_insert``; se reconstruye
+    con ``python manage.py rebuild_feed`` (por ejemplo tras cambiar
+    ``MEDIA_URL``, porque guarda las URLs completas).
+    """
+    organization = models.OneToOneField(Organization, primary_key=True, related_name='feed_entry',
+                                        on_delete=models.CASCADE)
+    owner = models.ForeignKey(UserProfile, related_name='feed_entries', on_delete=models.CASCADE)
+    name = models.CharField(max_length=50)
+    type = models.CharField(max_length=50)
+    # Tipo normalizado (normalize_service_name, sin tildes) para el filtro por tipo
+    type_key = models.CharField(max_length=50)
+    services = models.JSONField(default=list)
+    website = models.CharField(max_length=80)
+    phone = models.CharField(max_length=50)
+    logo_src = models.CharField(max_length=255, blank=True)
+    logo_srcset = models.TextField(blank=True)
+    logo_webp_srcset = models.TextField(blank=True)
+    # Texto en minúsculas y sin tildes del motor de búsqueda de Postgres
+    search_key = models.TextField(blank=True)
+
+    objects = OrganizationFeedEntryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', '-organization'], name='empresa_feed_owner_idx'),
+            models.Index(fields=['type_key', '-organization'], name='empresa_feed_type_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_organization(cls, organization):
+        variants = organization.get_logo_variants
+        return cls(
+            organization_id=organization.pk,
+            owner_id=organization.owner_id,
+            name=organization.name,
+            type=organization.type,
+            type_key=normalize_service_name(organization.type or ''),
+            services=organization.get_services_list(),
+            website=organization.website,
+            phone=organization.phone,
+            logo_src=(variants.src or '') if variants else '',
+            logo_srcset=variants.srcset if variants else '',
+            logo_webp_srcset=variants.webp_srcset if variants else '',
+            search_key=organization.build_search_text(),
+        )
+
+    @classmethod
+    def sync(cls, organizations):
+        """Crea o actualiza en una sola consulta las filas de ``organizations``"""
+        entries = [cls.from_organization(organization) for organization in organizations]
+        if entries:
+            cls.objects.bulk_create(entries, update_conflicts=True, unique_fields=['organization'],
+                                    update_fields=FEED_ENTRY_FIELDS)
+        return entries
+
+    @classmethod
+    def refresh(cls, pks):
+        """Vuelve a copiar las organizaciones ``pks`` (y borra las que ya no existen)"""
+        pks = set(pks)
+        organizations = list(Organization.objects.for_feed().filter(pk__in=pks))
+        cls.sync(organizations)
+        gone = pks - {organization.pk for organization in organizations}
+        if gone:
+            cls.objects.filter(pk__in=gone).delete()
+
+    @classmethod
+    def rebuild(cls, batch_size=2000):
+        """Reconstruye la tabla completa desde las organizaciones"""
+        total = 0
+        with transaction.atomic():
+            cls.objects.all().delete()
+            batch = []
+            for organization in Organization.objects.for_feed().order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(cls.from_organization(organization))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch)
+                total += len(batch)
+        return total
+
+
+class OrganizationChangeQuerySet(models.QuerySet):
+    def after(self, sequence):
+        return self.filter(sequence__gt=sequence).order_by('sequence')
+
+    def newest_first(self):
+        # En Postgres, antes de confirmar, los cambios propios aún no tienen secuencia
+        return self.filter(sequence__isnull=False).order_by('-sequence')
+
+
+class OrganizationChange(models.Model):
+    """
+    Registro de cambios (outbox) de las organizaciones: una fila por alta,
+    modificación o baja, escrita en la misma transacción que el cambio por las
+    señales de ``Organization``, ``Organization.bulk_insert`` y el
+    procesamiento de logos. ``sequence`` es el número con el que los
+    consumidores piden los cambios siguientes (ver Apps/Empresa/changes.py).
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = [(CREATED, 'Alta'), (UPDATED, 'Modificación'), (DELETED, 'Baja')]
+
+    # Sin llave foránea: el cambio se conserva después de borrar la organización
+    organization_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # La asigna la base al confirmar la transacción, no al insertar la fila
+    # (triggers de la migración 0016); en SQLite es igual al id
+    sequence = models.BigIntegerField(null=True, unique=True, editable=False)
+
+    objects = OrganizationChangeQuerySet.as_manager()
+
+    def __str__(self):
+        return '#%s %s %s' % (self.pk, self.action, self.organization_id)
+
+    @classmethod
+    def record(cls, organizations, action):
+        """Agrega un cambio por organización en una sola consulta. No toma
+        locks: la secuencia se asigna al confirmar la transacción que lo incluye"""
+        using = router.db_for_write(cls)
+        now = timezone.now()
+        changes = cls.objects.using(using).bulk_create([
+            cls(organization_id=organization.pk, action=action, changed_at=now)
+            for organization in organizations
+        ])
+        # Este proceso ve la nueva versión del directorio sin esperar al TTL
+        from .caching import forget_directory_version
+        forget_directory_version()
+        return changes
+
+
+class ChunkedUploadQuerySet(models.QuerySet):
+    def complete(self):
+        return self.filter(completed_at__isnull=False)
+
+    def expired(self):
+        from .uploads import get_expiry
+        return self.filter(created_at__lt=timezone.now() - timedelta(seconds=get_expiry()))
+
+
+class ChunkedUpload(models.Model):
+    """Carga por partes (reanudable) de un logo o una foto de perfil; ver Apps/Empresa/uploads.py"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, related_name='chunked_uploads', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Bytes recibidos: la siguiente parte debe empezar aquí
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ChunkedUploadQuerySet.as_manager()
+
+    def __str__(self):
+        return '%s (%d/%d)' % (self.filename, self.offset, self.size)
+
+    @property
+    def path(self):
+        from .uploads import get_temp_dir
+        return os.path.join(get_temp_dir(), '%s.part' % self.id)
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+    def as_file(self):
+        from .uploads import AssembledUpload
+        return AssembledUpload(self.path, self.filename, self.size)
+
+    def delete_file(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,141 @@
+"""
+Caché de páginas completas y GET condicional para visitantes anónimos.
+
+``anonymous_page_cache`` envuelve vistas cuya respuesta anónima solo depende
+de la URL (``public_feed``, ``about_us``):
+
+* ``ETag`` y ``Last-Modified`` salen de ``directory_version()``, el último
+  cambio registrado en ``OrganizationChange``: cambia con cualquier alta,
+  edición o borrado de una organización y es la misma en todos los procesos.
+  Un visitante o proxy que ya tiene la versión vigente recibe un 304 sin que
+  se ejecute la vista.
+* El HTML se guarda en caché por versión y parámetros normalizados, así las
+  peticiones repetidas no vuelven a renderizar la página.
+
+Los usuarios autenticados siguen pasando por la vista (barra lateral por
+usuario). Tampoco se cachean respuestas con mensajes pendientes, con token
+CSRF o que fijan cookies. Se desactiva con ``EMPRESA_PAGE_CACHE = False``;
+el comando ``benchmark_page_cache`` compara ambos casos.
+"""
+import asyncio
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import directory_version, feed_timeout
+from .facets import parse_facets
+from .search import parse_query
+
+PAGE_KEY = 'empresa:page:%s:%s'
+
+
+def page_cache_enabled():
+    return getattr(settings, 'EMPRESA_PAGE_CACHE', True)
+
+
+def get_max_age():
+    return getattr(settings, 'EMPRESA_PAGE_CACHE_MAX_AGE', 0)
+
+
+def default_key(request):
+    """Ruta y parámetros ordenados; las vistas pueden normalizar más (ver ``feed_key``)"""
+    params = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    return '%s?%r' % (request.path, params)
+
+
+def feed_key(request):
+    """Búsqueda normalizada, facetas y cursor: "Cloud " y "cloud" comparten página"""
+    return '%s?%s|%s|%s' % (request.path, ','.join(parse_query(request.GET.get('search', ''))),
+                            parse_facets(request.GET).key(), request.GET.get('cursor', ''))
+
+
+def _has_messages(request):
+    storage = get_messages(request)
+    pending = bool(list(storage))
+    # Iterar los marca como leídos: se conservan para el render de la vista
+    storage.used = False
+    return pending
+
+
+def _validators(request, key_func):
+    """``(etag, last_modified, clave)`` de la petición o ``None`` si no se cachea"""
+    if not page_cache_enabled() or request.method not in ('GET', 'HEAD'):
+        return None
+    if request.user.is_authenticated or _has_messages(request):
+        return None
+    version = directory_version()
+    digest = hashlib.md5(('%s|%s' % (version.token, key_func(request))).encode()).hexdigest()
+    last_modified = int(version.changed_at.timestamp()) if version.changed_at else None
+    return quote_etag(digest), last_modified, PAGE_KEY % (version.token, digest)
+
+
+def _cacheable(request, response):
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'))
+
+
+def _add_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=get_max_age(), must_revalidate=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _cached_response(cached):
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def anonymous_page_cache(key_func=default_key):
+    """Decorador de vistas (síncronas o asíncronas) con caché de página para anónimos"""
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                validators = await sync_to_async(_validators)(request, key_func)
+                if validators is None:
+                    return await view(request, *args, **kwargs)
+                etag, last_modified, key = validators
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    cached = await cache.aget(key)
+                    if cached is None:
+                        response = await view(request, *args, **kwargs)
+                        if not _cacheable(request, response):
+                            return response
+                        await cache.aset(key, (response.content, response['Content-Type']), feed_timeout())
+                    else:
+                        response = _cached_response(cached)
+                return _add_headers(response, etag, last_modified)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            validators = _validators(request, key_func)
+            if validators is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified, key = validators
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                cached = cache.get(key)
+                if cached is None:
+                    response = view(request, *args, **kwargs)
+                    if not _cacheable(request, response):
+                        return response
+                    cache.set(key, (response.content, response['Content-Type']), feed_timeout())
+                else:
+                    response = _cached_response(cached)
+            return _add_headers(response, etag, last_modified)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,185 @@
+"""
+Paginación por cursor (keyset) para los feeds de organizaciones.
+
+Las filas salen de ``OrganizationFeedEntry`` (el modelo de lectura de los
+feeds), que comparte la llave con ``Organization``.
+
+En lugar de ``OFFSET`` cada página pide las filas "después" de la última que
+vio el cliente, así el costo de una página no depende de su posición. El
+total se estima o se guarda en caché para no ejecutar ``COUNT(*)`` en cada
+petición; las claves llevan la versión del directorio
+(``caching.directory_version``), así un alta o una baja en cualquier proceso
+cambia el total de inmediato.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .caching import COUNT_KEY, directory_version
+from .facets import precomputed_count
+from .models import OrganizationFeedEntry
+from .routers import in_own_connection
+from .search import get_backend, parse_query
+
+Page = namedtuple('Page', ['organizations', 'next_cursor', 'total_count'])
+
+
+def get_page_size():
+    return getattr(settings, 'EMPRESA_FEED_PAGE_SIZE', 24)
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Retorna la tupla del cursor o ``None`` si está vacío o es inválido"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return None
+    return tuple(values)
+
+
+def _count_timeout():
+    return getattr(settings, 'EMPRESA_FEED_COUNT_TIMEOUT', 300)
+
+
+def directory_count():
+    """Total aproximado de organizaciones, cacheado unos minutos"""
+    key = COUNT_KEY % directory_version().token
+    total = cache.get(key)
+    if total is None:
+        if connection.vendor == 'postgresql':
+            # Estimación del planner; solo se usa si la tabla ya es grande
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [connection.ops.quote_name(OrganizationFeedEntry._meta.db_table)])
+                row = cursor.fetchone()
+            if row and row[0] >= 10000:
+                total = row[0]
+        if total is None:
+            total = OrganizationFeedEntry.objects.count()
+        cache.set(key, total, _count_timeout())
+    return total
+
+
+def search_count(search_query, facets=None):
+    """Total de resultados de una búsqueda, cacheado por búsqueda normalizada y facetas"""
+    raw = ','.join(parse_query(search_query))
+    if facets:
+        raw += '|' + facets.key()
+    key = 'empresa:feed:search-count:%s:%s' % (directory_version().token, hashlib.md5(raw.encode()).hexdigest())
+    total = cache.get(key)
+    if total is None:
+        total = get_backend().count(search_query, facets=facets)
+        cache.set(key, total, _count_timeout())
+    return total
+
+
+def facet_count(facets):
+    """Total del directorio filtrado por facetas, cacheado por combinación de facetas"""
+    key = 'empresa:feed:facet-count:%s:%s' % (directory_version().token,
+                                               hashlib.md5(facets.key().encode()).hexdigest())
+    total = cache.get(key)
+    if total is None:
+        # Con una sola faceta el total ya está en las tablas de conteos
+        total = precomputed_count(facets)
+        if total is None:
+            total = facets.filter(OrganizationFeedEntry.objects.all()).count()
+        cache.set(key, total, _count_timeout())
+    return total
+
+
+def _feed_total(facets):
+    return facet_count(facets) if facets else directory_count()
+
+
+def _directory_rows(cursor, page_size, queryset, facets=None):
+    """Consulta (sin evaluar) de la página del directorio, con una fila extra"""
+    queryset = OrganizationFeedEntry.objects.all() if queryset is None else queryset
+    if facets:
+        queryset = facets.filter(queryset)
+    after = decode_cursor(cursor, 1)
+    if after is not None:
+        queryset = queryset.filter(pk__lt=after[0])
+    return queryset.order_by('-pk')[:page_size + 1]
+
+
+def _directory_page(rows, page_size, total):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].pk)
+    return Page(rows, next_cursor, total)
+
+
+def _split_hits(hits, page_size):
+    next_cursor = None
+    if len(hits) > page_size:
+        hits = hits[:page_size]
+        next_cursor = encode_cursor(hits[-1].score, hits[-1].pk)
+    return hits, next_cursor
+
+
+def _ordered(hits, found):
+    return [found[hit.pk] for hit in hits if hit.pk in found]
+
+
+def paginate_organizations(cursor=None, page_size=None, queryset=None, facets=None):
+    """Página del directorio ordenada por ``-id`` a partir de ``cursor``"""
+    page_size = page_size or get_page_size()
+    rows = list(_directory_rows(cursor, page_size, queryset, facets))
+    return _directory_page(rows, page_size, _feed_total(facets))
+
+
+def paginate_search(search_query, cursor=None, page_size=None, queryset=None, facets=None):
+    """Página de resultados de búsqueda ordenados por relevancia y ``-id``"""
+    page_size = page_size or get_page_size()
+    hits = get_backend().search(search_query, limit=page_size + 1, after=decode_cursor(cursor, 2),
+                                facets=facets)
+    hits, next_cursor = _split_hits(hits, page_size)
+    queryset = OrganizationFeedEntry.objects.all() if queryset is None else queryset
+    organizations = _ordered(hits, queryset.in_bulk([hit.pk for hit in hits]))
+    return Page(organizations, next_cursor, search_count(search_query, facets))
+
+
+# Versiones para las vistas asíncronas (Apps/Empresa/async_views.py). Las
+# filas (o los resultados de la búsqueda) y el total no dependen entre sí: se
+# consultan a la vez, cada uno con su conexión (``in_own_connection``).
+
+async def apaginate_organizations(cursor=None, page_size=None, queryset=None, facets=None):
+    page_size = page_size or get_page_size()
+    rows, total = await asyncio.gather(
+        in_own_connection(list)(_directory_rows(cursor, page_size, queryset, facets)),
+        in_own_connection(_feed_total)(facets),
+    )
+    return _directory_page(rows, page_size, total)
+
+
+async def apaginate_search(search_query, cursor=None, page_size=None, queryset=None, facets=None):
+    page_size = page_size or get_page_size()
+    # El motor de búsqueda es síncrono (índice en memoria o consulta en Postgres)
+    hits, total = await asyncio.gather(
+        in_own_connection(get_backend().search)(
+            search_query, limit=page_size + 1, after=decode_cursor(cursor, 2), facets=facets),
+        in_own_connection(search_count)(search_query, facets),
+    )
+    hits, next_cursor = _split_hits(hits, page_size)
+    queryset = OrganizationFeedEntry.objects.all() if queryset is None else queryset
+    organizations = _ordered(hits, await queryset.ain_bulk([hit.pk for hit in hits]))
+    return Page(organizations, next_cursor, total)
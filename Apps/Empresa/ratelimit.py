@@ -0,0 +1,204 @@
+"""
+Límite de peticiones por IP, usuario y nombre de usuario (token bucket).
+
+``RateLimitMiddleware`` revisa en ``process_view`` las reglas de
+``EMPRESA_RATE_LIMITS`` para el nombre de URL de la petición. Corre antes
+de CSRF, de la vista y de cualquier consulta: una petición que se pasa del
+límite recibe un 429 con ``Retry-After`` sin llegar a ``authenticate()`` (el
+hash de la contraseña) ni a la base de datos. Cada regla es un diccionario::
+
+    {'key': 'ip' | 'user' | 'username', 'rate': '5/m', 'methods': ['POST']}
+
+* ``ip``: la dirección del cliente (``REMOTE_ADDR`` o, detrás de
+  ``EMPRESA_RATE_LIMIT_PROXIES`` proxies, la que agregó el último proxy de
+  confianza en ``X-Forwarded-For``). Las IPv6 se agrupan por /64.
+* ``user``: el id del usuario autenticado; los anónimos cuentan por IP.
+* ``username``: el campo ``username`` del formulario (sin distinguir
+  mayúsculas), para frenar intentos contra una misma cuenta desde muchas IPs.
+
+``rate`` es ``<peticiones>/<s|m|h|d>``: el balde admite ráfagas de hasta ese
+número de peticiones y se rellena de forma continua en el período.
+
+El estado se guarda en ``EMPRESA_RATE_LIMIT_STORE``:
+
+* ``LocalMemoryStore`` (por defecto): diccionario en memoria del proceso,
+  con un máximo de claves (se descartan las usadas hace más tiempo). Cada
+  worker lleva su propia cuenta.
+* ``CacheStore``: la caché ``EMPRESA_RATE_LIMIT_CACHE`` de Django, para
+  compartir la cuenta entre workers (con ``FileBasedCache`` o
+  ``DatabaseCache`` sirve de respaldo en archivo o base de datos). Leer y
+  escribir el balde no es atómico: con peticiones simultáneas de la misma
+  clave se pueden colar algunas de más.
+"""
+import hashlib
+import ipaddress
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+KEY_PREFIX = 'empresa:ratelimit:'
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """``'5/m'`` -> ``(5, 60)``"""
+    count, _, period = rate.partition('/')
+    try:
+        return int(count), PERIODS[period]
+    except (KeyError, ValueError):
+        raise ValueError('Límite inválido: %r (use <peticiones>/<s|m|h|d>)' % rate)
+
+
+def take_token(state, capacity, period, now):
+    """Retorna ``(nuevo estado, segundos de espera)``; espera 0 si hay token.
+    ``state`` es ``(tokens, instante)`` o ``None`` para un balde lleno"""
+    tokens, updated = state if state is not None else (capacity, now)
+    rate = capacity / period
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalMemoryStore:
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or getattr(settings, 'EMPRESA_RATE_LIMIT_MAX_KEYS', 100000)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period):
+        now = time.monotonic()
+        with self._lock:
+            state, wait = take_token(self._buckets.pop(key, None), capacity, period, now)
+            self._buckets[key] = state
+            while len(self._buckets) > self.max_keys:
+                # La menos usada; un balde descartado vuelve lleno
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheStore:
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, 'EMPRESA_RATE_LIMIT_CACHE', 'default')]
+
+    def consume(self, key, capacity, period):
+        # time.time() y no monotonic(): el estado se comparte entre procesos.
+        # El hash evita espacios y largos que memcached no acepta en las claves
+        key = KEY_PREFIX + hashlib.md5(key.encode()).hexdigest()
+        state, wait = take_token(self.cache.get(key), capacity, period, time.time())
+        # Un balde sin uso se llena en ``period`` segundos: después ya no hace falta
+        self.cache.set(key, state, math.ceil(period))
+        return wait
+
+    def clear(self):
+        pass
+
+
+def get_store():
+    path = getattr(settings, 'EMPRESA_RATE_LIMIT_STORE', 'Apps.Empresa.ratelimit.LocalMemoryStore')
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = import_string(path)()
+    return store
+
+
+def reset_stores():
+    """Vacía los baldes en memoria (tests y cambios de configuración)"""
+    with _stores_lock:
+        for store in _stores.values():
+            store.clear()
+        _stores.clear()
+
+
+def get_rules(url_name):
+    return getattr(settings, 'EMPRESA_RATE_LIMITS', {}).get(url_name, ())
+
+
+def client_ip(request):
+    proxies = getattr(settings, 'EMPRESA_RATE_LIMIT_PROXIES', 0)
+    address = request.META.get('REMOTE_ADDR', '')
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if len(forwarded) >= proxies:
+            address = forwarded[-proxies]
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    if ip.version == 6:
+        return str(ipaddress.ip_network('%s/64' % ip, strict=False).network_address)
+    return str(ip)
+
+
+def rule_key(rule, request):
+    """Clave del balde de la regla, o ``None`` si no aplica a la petición"""
+    kind = rule['key']
+    if kind == 'ip':
+        return 'ip:%s' % client_ip(request)
+    if kind == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return 'user:%s' % user.pk
+        return 'ip:%s' % client_ip(request)
+    if kind == 'username':
+        # 150: largo máximo de User.username
+        username = request.POST.get('username', '').strip().casefold()[:150]
+        return 'username:%s' % username if username else None
+    raise ValueError('Clave de límite desconocida: %r' % kind)
+
+
+def check_request(request, url_name):
+    """Segundos que el cliente debe esperar, o 0 si la petición pasa"""
+    wait = 0
+    for rule in get_rules(url_name):
+        methods = rule.get('methods')
+        if methods and request.method not in methods:
+            continue
+        key = rule_key(rule, request)
+        if key is None:
+            continue
+        capacity, period = parse_rate(rule['rate'])
+        # Cada regla tiene su balde: la misma IP en login y en el feed cuenta aparte
+        wait = max(wait, get_store().consume('%s:%s:%s' % (url_name, rule['rate'], key), capacity, period))
+    return wait
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Demasiadas peticiones. Intente de nuevo en unos segundos.',
+                            status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        if not url_name or not get_rules(url_name):
+            return None
+        wait = check_request(request, url_name)
+        if wait:
+            return too_many_requests(wait)
+        return None
@@ -0,0 +1,104 @@
+"""
+Lecturas de los feeds desde una réplica de la base de datos.
+
+Si ``DATABASE_REPLICA_URL`` está configurada, ``settings.py`` agrega el alias
+``replica`` y ``EMPRESA_READ_REPLICA`` lo nombra. Las vistas de solo lectura
+se marcan con ``use_replica`` y, mientras se ejecutan, ``ReadReplicaRouter``
+envía a la réplica las lecturas de los modelos de Empresa. Sesiones y
+usuarios siguen en ``default`` (se acaban de escribir al iniciar sesión) y
+todas las escrituras van a ``default``.
+
+La réplica puede ir unos instantes atrás del primario: una página cacheada
+con la versión nueva del directorio puede mostrar el estado anterior hasta el
+próximo cambio o hasta que venza ``EMPRESA_FEED_CACHE_TIMEOUT``.
+"""
+import asyncio
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+
+# Apps cuyos modelos se leen desde la réplica
+REPLICA_APP_LABELS = {'Empresa'}
+
+# contextvars y no threading.local: asgiref copia el contexto a los hilos de
+# sync_to_async, así también funciona con las vistas asíncronas
+_replica_reads = contextvars.ContextVar('empresa_replica_reads', default=False)
+
+
+def get_replica_alias():
+    return getattr(settings, 'EMPRESA_READ_REPLICA', None)
+
+
+def read_alias():
+    """Alias para lecturas que terminan fuera de la vista (respuestas en streaming)"""
+    return get_replica_alias() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_replica(view):
+    """Decorador de vistas de solo lectura (síncronas o asíncronas)"""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with replica_reads():
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def in_own_connection(function):
+    """Versión asíncrona de ``function`` que corre en un hilo del pool de
+    asgiref con su propia conexión, no en el hilo de la petición
+    (``thread_sensitive``): varias consultas de una vista asíncrona corren a la
+    vez con ``asyncio.gather``. Como al final de una petición, la conexión se
+    cierra según ``CONN_MAX_AGE``; ``use_replica`` sigue valiendo porque el
+    contexto se copia al hilo"""
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = get_replica_alias()
+        if alias and _replica_reads.get() and model._meta.app_label in REPLICA_APP_LABELS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y primario tienen las mismas filas
+        databases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema por replicación
+        if db == get_replica_alias():
+            return False
+        return None
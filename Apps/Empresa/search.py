@@ -0,0 +1,528 @@
+"""
+Motor de búsqueda del directorio de organizaciones.
+
+Hay dos implementaciones con la misma interfaz:
+
+* ``PostgresSearchBackend``: filtra sobre ``OrganizationFeedEntry.search_key``
+  (el texto de ``Organization.build_search_text()`` en el modelo de lectura
+  de los feeds) usando el índice GIN de trigramas (pg_trgm) creado en la
+  migración 0012 y ordena por similitud de trigramas. Postgres mantiene el
+  índice en cada escritura.
+* ``PythonSearchBackend``: índice invertido en memoria para SQLite y los
+  tests. Se construye la primera vez que se usa, se actualiza con las
+  señales ``post_save``/``post_delete`` de ``Organization`` y, antes de cada
+  búsqueda, con los cambios que otros procesos registraron en
+  ``OrganizationChange`` (ver ``SyncedIndex``).
+
+``search_key``, el índice en memoria y las búsquedas pasan por ``normalize_text``
+(minúsculas y sin tildes), así "consultoria" encuentra "Consultoría". En los
+dos motores un término coincide cuando cada una de sus palabras empieza una
+palabra de la organización ("desarr" encuentra "Desarrollo", "rrollo" no).
+Los errores de tipeo se toleran con similitud de trigramas: en Postgres con
+el operador ``<%`` de pg_trgm (que usa el mismo índice GIN) y en memoria con
+un índice de trigramas sobre el vocabulario y distancia de edición.
+
+Las coincidencias exactas son las mismas en ambos motores; difieren en las
+aproximadas y en el orden. El índice en memoria solo corrige un término sin
+coincidencias exactas, mientras que Postgres suma siempre las palabras
+parecidas, y cada motor calcula su propio puntaje (pesos por campo en
+memoria, similitud de trigramas en Postgres).
+
+Ambos aceptan ``facets`` (ver ``Apps/Empresa/facets.py``) para limitar los
+resultados por tipo y servicios, con las mismas claves sin tildes.
+
+El backend se elige con ``settings.EMPRESA_SEARCH_BACKEND`` ('postgres',
+'python' o ``None`` para decidir según la base de datos).
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Func
+
+SearchHit = namedtuple('SearchHit', ['pk', 'score'])
+
+# Peso de cada campo al calcular la relevancia de una coincidencia
+FIELD_WEIGHTS = (('name', 3.0), ('type', 2.0), ('services', 1.0))
+
+# Las coincidencias aproximadas valen menos que una coincidencia exacta
+FUZZY_WEIGHT = 0.5
+# Palabras más cortas no se corrigen: cualquier error las vuelve otra palabra
+FUZZY_MIN_LENGTH = 4
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    """Minúsculas y sin tildes: "Consultoría" -> "consultoria" """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def trigrams(word):
+    padded = ' %s ' % word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word):
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Distancia de edición (con transposiciones) o ``limit + 1`` si la supera"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+
+
+def parse_query(search_query):
+    """Divide la búsqueda por comas y retorna los términos normalizados"""
+    terms = []
+    for term in search_query.split(','):
+        term = ' '.join(normalize_text(term).split())
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize_text(text)) if text else []
+
+
+class SyncedIndex:
+    """
+    Base de los índices en memoria de cada proceso (``PythonSearchBackend`` y
+    ``suggest.SuggestIndex``). Las señales los actualizan con los cambios de
+    este proceso; ``_sync()`` compara además la versión del directorio
+    (``caching.directory_version``, a lo sumo una consulta cada
+    ``EMPRESA_DIRECTORY_VERSION_TTL`` segundos) y, si otro proceso registró
+    cambios, vuelve a leer esas organizaciones desde ``OrganizationChange`` o
+    reconstruye el índice si son demasiados.
+
+    Las subclases tienen ``_lock``, ``_loaded``, ``rebuild(rows=None)`` y
+    ``_refresh(pks)``, que vuelve a indexar (o descarta) esas organizaciones.
+    """
+    # Secuencia y versión del registro de cambios que refleja el índice. Un
+    # índice construido desde filas explícitas (tests) no sigue los cambios
+    _sequence = 0
+    _token = None
+    _follows_changes = True
+
+    def _mark_version(self, version):
+        self._sequence = version.sequence
+        self._token = version.token
+
+    def _sync(self):
+        """Carga o pone al día el índice; se llama con ``_lock`` tomado"""
+        from .caching import directory_version
+
+        if self._loaded and not self._follows_changes:
+            return
+        version = directory_version()
+        if self._loaded and version.token == self._token:
+            return
+        if self._loaded and version.sequence > self._sequence:
+            from .changes import changed_since
+
+            changed = changed_since(self._sequence)
+            if changed is not None:
+                pks, sequence = changed
+                self._refresh(pks)
+                self._sequence = sequence
+                self._token = version.token if sequence == version.sequence else None
+                return
+        # Sin cargar, demasiados cambios o una secuencia anterior (base restaurada)
+        self.rebuild()
+
+
+class BaseSearchBackend:
+    def search(self, search_query, limit=None, after=None, facets=None):
+        """
+        Retorna una lista de ``SearchHit`` ordenada por relevancia descendente
+        y luego por id descendente. ``after`` es el par ``(score, pk)`` del
+        último resultado de la página anterior (paginación por cursor).
+        """
+        raise NotImplementedError
+
+    def count(self, search_query, facets=None):
+        raise NotImplementedError
+
+    def index(self, organization):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class TrigramWordMatch(Func):
+    """``término <% search_key``: alguna palabra del texto se parece al término
+    (umbral ``pg_trgm.word_similarity_threshold``); lo resuelve el índice GIN"""
+    arg_joiner = ' <%% '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def _filter(self, terms, facets=None):
+        # Import diferido: django.contrib.postgres requiere psycopg
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        from django.db.models import F, Q, Value
+        from .models import OrganizationFeedEntry
+
+        query = Q()
+        score = None
+        for term in terms:
+            # Como en PythonSearchBackend, cada palabra del término debe empezar una
+            # palabra del texto (\m); ``contains`` deja que el índice GIN descarte
+            # las filas antes de evaluar la expresión regular
+            words = tokenize(term)
+            if words:
+                query |= Q(*(Q(search_key__contains=word, search_key__regex=r'\m' + word) for word in words))
+            query |= Q(TrigramWordMatch(Value(term), F('search_key')))
+            similarity = TrigramWordSimilarity(term, 'search_key')
+            score = similarity if score is None else score + similarity
+        organizations = OrganizationFeedEntry.objects.filter(query)
+        if facets:
+            organizations = facets.filter(organizations)
+        return organizations, score
+
+    def search(self, search_query, limit=None, after=None, facets=None):
+        from django.db.models import FloatField, Q
+        from django.db.models.functions import Cast
+
+        terms = parse_query(search_query)
+        if not terms:
+            return []
+        organizations, score = self._filter(terms, facets)
+        # La similitud es real (float4): en double precision el puntaje vuelve
+        # del cursor (JSON) sin redondeos y la comparación con el límite de la
+        # página anterior es exacta, también entre empates
+        rows = organizations.annotate(search_rank=Cast(score, FloatField()))
+        if after is not None:
+            after_score, after_pk = after
+            rows = rows.filter(Q(search_rank__lt=after_score) | Q(search_rank=after_score, pk__lt=after_pk))
+        rows = rows.order_by('-search_rank', '-pk').values_list('pk', 'search_rank')
+        if limit is not None:
+            rows = rows[:limit]
+        return [SearchHit(pk, rank) for pk, rank in rows]
+
+    def count(self, search_query, facets=None):
+        terms = parse_query(search_query)
+        return self._filter(terms, facets)[0].count() if terms else 0
+
+
+class PythonSearchBackend(SyncedIndex, BaseSearchBackend):
+    """
+    Índice invertido palabra -> ids. Las palabras de cada término se buscan por
+    prefijo sobre el vocabulario ordenado, de modo que "desarr" encuentra
+    "desarrollo" igual que hacía el ``icontains`` original. Si un término no
+    tiene coincidencias, sus palabras se corrigen con el índice de trigramas
+    del vocabulario (``_grams``) y la distancia de edición.
+
+    La relevancia se calcula con operaciones de conjuntos sobre índices por
+    campo (``_field_postings`` y ``_field_values``): un campo coincide si cada
+    palabra del término empieza una palabra del campo. Los resultados quedan
+    agrupados por puntaje y solo se ordenan los ids de los grupos necesarios
+    para llenar la página.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._documents = {}
+        self._postings = {}
+        self._field_postings = tuple({} for _ in FIELD_WEIGHTS)
+        self._field_values = tuple({} for _ in FIELD_WEIGHTS)
+        self._vocabulary = []
+        self._grams = {}
+
+    def _ensure_loaded(self):
+        with self._lock:
+            self._sync()
+
+    @staticmethod
+    def _rows(pks=None):
+        from .models import Organization
+        organizations = Organization.objects.all() if pks is None else Organization.objects.filter(pk__in=pks)
+        return organizations.values_list('pk', 'name', 'type', 'services').iterator(chunk_size=2000)
+
+    def rebuild(self, rows=None):
+        """Reconstruye el índice desde la base de datos o desde ``rows``
+        (tuplas ``(pk, name, type, services)``)"""
+        version = None
+        if rows is None:
+            from .caching import directory_version
+            # Antes de leer las filas: un cambio concurrente se vuelve a aplicar después
+            version = directory_version()
+            rows = self._rows()
+        with self._lock:
+            self._follows_changes = version is not None
+            if version is not None:
+                self._mark_version(version)
+            self._loaded = False
+            self._documents = {}
+            self._postings = {}
+            self._field_postings = tuple({} for _ in FIELD_WEIGHTS)
+            self._field_values = tuple({} for _ in FIELD_WEIGHTS)
+            for pk, name, type_, services in rows:
+                self._add(pk, name, type_, services)
+            self._vocabulary = sorted(self._postings)
+            self._grams = {}
+            for token in self._vocabulary:
+                self._add_grams(token)
+            self._loaded = True
+
+    def _add_grams(self, token):
+        for gram in trigrams(token):
+            self._grams.setdefault(gram, set()).add(token)
+
+    def _discard_grams(self, token):
+        for gram in trigrams(token):
+            tokens = self._grams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._grams[gram]
+
+    def _add(self, pk, name, type_, services):
+        fields = tuple(normalize_text(value or '') for value in (name, type_, services))
+        self._documents[pk] = fields
+        for value, field_postings, field_values in zip(fields, self._field_postings, self._field_values):
+            field_values.setdefault(' '.join(value.split()), set()).add(pk)
+            for token in set(tokenize(value)):
+                field_postings.setdefault(token, set()).add(pk)
+        for token in set(tokenize(' '.join(fields))):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                if self._loaded:
+                    bisect.insort(self._vocabulary, token)
+                    self._add_grams(token)
+            postings.add(pk)
+
+    @staticmethod
+    def _discard_from(index, key, pk):
+        pks = index.get(key)
+        if pks is not None:
+            pks.discard(pk)
+            if not pks:
+                del index[key]
+
+    def _discard(self, pk):
+        fields = self._documents.pop(pk, None)
+        if fields is None:
+            return
+        for value, field_postings, field_values in zip(fields, self._field_postings, self._field_values):
+            self._discard_from(field_values, ' '.join(value.split()), pk)
+            for token in set(tokenize(value)):
+                self._discard_from(field_postings, token, pk)
+        for token in set(tokenize(' '.join(fields))):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(pk)
+            if not postings:
+                del self._postings[token]
+                self._discard_grams(token)
+                position = bisect.bisect_left(self._vocabulary, token)
+                if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                    del self._vocabulary[position]
+
+    def index(self, organization):
+        with self._lock:
+            if not self._loaded:
+                return
+            self._discard(organization.pk)
+            self._add(organization.pk, organization.name, organization.type, organization.services)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._loaded:
+                self._discard(pk)
+
+    def _refresh(self, pks):
+        for pk in pks:
+            self._discard(pk)
+        for pk, name, type_, services in self._rows(pks):
+            self._add(pk, name, type_, services)
+
+    def _prefix_tokens(self, word):
+        position = bisect.bisect_left(self._vocabulary, word)
+        end = position
+        while end < len(self._vocabulary) and self._vocabulary[end].startswith(word):
+            end += 1
+        return self._vocabulary[position:end]
+
+    def _similar_tokens(self, word):
+        """Palabras del vocabulario a ``max_edits(word)`` ediciones de ``word``
+        o de un prefijo suyo (la búsqueda también se escribe a medias)"""
+        limit = max_edits(word)
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        # Cada edición cambia a lo sumo 3 trigramas; un prefijo pierde el del final
+        wanted = max(1, len(grams) - 3 * limit - 1)
+        similar = []
+        for token, count in shared.items():
+            if count < wanted:
+                continue
+            if (edit_distance(word, token, limit) <= limit
+                    or edit_distance(word, token[:len(word)], limit) <= limit):
+                similar.append(token)
+        return similar
+
+    @staticmethod
+    def _matching(index, words):
+        """Ids que tienen, para cada palabra, alguno de sus tokens en ``index``"""
+        matches = None
+        for tokens in words:
+            found = set()
+            for token in tokens:
+                found |= index.get(token, set())
+            matches = found if matches is None else matches & found
+            if not matches:
+                return set()
+        return matches or set()
+
+    def _term_groups(self, term, facets=None):
+        """Retorna ``{puntaje: ids}`` para un término"""
+        words = [self._prefix_tokens(word) for word in tokenize(term)]
+        fuzzy = False
+        candidates = self._matching(self._postings, words)
+        if not candidates:
+            # Búsqueda aproximada: se corrigen las palabras sin coincidencias
+            fuzzy = True
+            words = [tokens or (self._similar_tokens(word) if len(word) >= FUZZY_MIN_LENGTH else [])
+                     for word, tokens in zip(tokenize(term), words)]
+            candidates = self._matching(self._postings, words)
+        if candidates and facets:
+            candidates = {pk for pk in candidates
+                          if facets.matches(self._documents[pk][1], self._documents[pk][2])}
+        if not candidates:
+            return {}
+
+        # Cada campo suma su peso si coincide y otra vez si es igual al término
+        groups = [(0.0, candidates)]
+        for (field, weight), field_postings, field_values in zip(
+                FIELD_WEIGHTS, self._field_postings, self._field_values):
+            splits = [(self._matching(field_postings, words), weight)]
+            if not fuzzy:
+                splits.append((field_values.get(term, set()), weight))
+            for matches, bonus in splits:
+                if not matches:
+                    continue
+                split = []
+                for score, pks in groups:
+                    inside = pks & matches
+                    if inside:
+                        split.append((score + bonus, inside))
+                    if len(inside) < len(pks):
+                        split.append((score, pks - inside))
+                groups = split
+
+        scored = {}
+        for score, pks in groups:
+            score = score or 0.5
+            if fuzzy:
+                score *= FUZZY_WEIGHT
+            scored.setdefault(score, set()).update(pks)
+        return scored
+
+    def _groups(self, terms, facets=None):
+        with self._lock:
+            self._ensure_loaded()
+            groups = [self._term_groups(term, facets) for term in terms]
+        # Varios términos: el puntaje de cada id es la suma de sus términos
+        combined = groups[0]
+        for term_groups in groups[1:]:
+            merged = {}
+            seen = set().union(*combined.values())
+            term_seen = set().union(*term_groups.values())
+            for score, pks in combined.items():
+                for term_score, term_pks in term_groups.items():
+                    both = pks & term_pks
+                    if both:
+                        merged.setdefault(score + term_score, set()).update(both)
+                rest = pks - term_seen
+                if rest:
+                    merged.setdefault(score, set()).update(rest)
+            for term_score, term_pks in term_groups.items():
+                rest = term_pks - seen
+                if rest:
+                    merged.setdefault(term_score, set()).update(rest)
+            combined = merged
+        return combined
+
+    def search(self, search_query, limit=None, after=None, facets=None):
+        terms = parse_query(search_query)
+        if not terms:
+            return []
+        groups = self._groups(terms, facets)
+        hits = []
+        for score in sorted(groups, reverse=True):
+            pks = groups[score]
+            if after is not None:
+                after_score, after_pk = after
+                if score > after_score:
+                    continue
+                if score == after_score:
+                    pks = [pk for pk in pks if pk < after_pk]
+            if limit is None:
+                chosen = sorted(pks, reverse=True)
+            else:
+                chosen = heapq.nlargest(limit - len(hits), pks)
+            hits.extend(SearchHit(pk, score) for pk in chosen)
+            if limit is not None and len(hits) >= limit:
+                break
+        return hits
+
+    def count(self, search_query, facets=None):
+        terms = parse_query(search_query)
+        return sum(len(pks) for pks in self._groups(terms, facets).values()) if terms else 0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'EMPRESA_SEARCH_BACKEND', None)
+                if name is None:
+                    name = 'postgres' if connection.vendor == 'postgresql' else 'python'
+                _backend = PostgresSearchBackend() if name == 'postgres' else PythonSearchBackend()
+    return _backend
+
+
+def reset_backend():
+    """Descarta el backend actual; útil en tests y al cambiar de settings"""
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def search_organizations(search_query, limit=None, after=None, facets=None):
+    return get_backend().search(search_query, limit=limit, after=after, facets=facets)
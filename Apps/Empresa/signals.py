@@ -0,0 +1,159 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import invalidate_organization, invalidate_user
+from .models import Organization, OrganizationChange, OrganizationFeedEntry, Service, TypeFacet, UserProfile, normalize_service_name
+from .search import get_backend
+from .suggest import get_suggest_index
+
+# images y uploads (y con ellos el procesamiento de imágenes) se importan en
+# cada receptor: las señales se conectan al arrancar y esos módulos solo hacen
+# falta al guardar una organización o un perfil
+
+
+@receiver(post_save, sender=Organization)
+def index_organization(sender, instance, created, **kwargs):
+    from .images import schedule_processing
+    # Se indexa al confirmar la transacción para no publicar cambios revertidos
+    transaction.on_commit(lambda: get_backend().index(instance))
+    transaction.on_commit(lambda: get_suggest_index().index(instance))
+    transaction.on_commit(lambda: invalidate_organization(instance.pk))
+    transaction.on_commit(lambda: schedule_processing(instance))
+
+
+@receiver(post_save, sender=Organization)
+def update_feed_entry(sender, instance, **kwargs):
+    # En la misma transacción que la organización; al borrarla, su fila del
+    # feed se borra en cascada
+    OrganizationFeedEntry.sync([instance])
+
+
+@receiver(post_save, sender=Organization)
+def record_change(sender, instance, created, **kwargs):
+    # En la transacción de Organization.save(): si se revierte, el cambio tampoco queda
+    OrganizationChange.record([instance], OrganizationChange.CREATED if created else OrganizationChange.UPDATED)
+
+
+@receiver(post_delete, sender=Organization)
+def record_deletion(sender, instance, **kwargs):
+    # post_delete se emite dentro de la transacción del borrado (también en cascada)
+    OrganizationChange.record([instance], OrganizationChange.DELETED)
+
+
+@receiver(pre_save, sender=Organization)
+def remember_type(sender, instance, update_fields=None, **kwargs):
+    # Tipo (conteos de facetas) y logo (para borrar el reemplazado) en una sola consulta
+    if instance._state.adding:
+        return
+    fields = [name for name in ('type', 'logo') if update_fields is None or name in update_fields]
+    if not fields:
+        return
+    if 'logo' in fields:
+        fields.append('logo_variants')
+    previous = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+    instance._previous_type = previous.get('type')
+    from .uploads import remember_file
+    remember_file(instance, previous)
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_profile_image(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'image' not in update_fields):
+        return
+    from .uploads import remember_file
+    remember_file(instance, sender.objects.filter(pk=instance.pk).values('image', 'image_variants').first() or {})
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_save, sender=UserProfile)
+def delete_replaced_image(sender, instance, **kwargs):
+    from .uploads import delete_replaced_file
+    delete_replaced_file(instance)
+
+
+@receiver(pre_delete, sender=Organization)
+@receiver(pre_delete, sender=UserProfile)
+def delete_images(sender, instance, **kwargs):
+    from .uploads import delete_instance_files
+    # Antes de borrar (después ya no se pueden cargar campos diferidos); los
+    # archivos se eliminan solo si la transacción se confirma
+    delete_instance_files(instance)
+
+
+@receiver(post_save, sender=Organization)
+def update_type_facets(sender, instance, created, **kwargs):
+    # Se ajusta en la misma transacción: si se revierte, el conteo también
+    if created:
+        TypeFacet.adjust(instance.type, 1)
+        return
+    previous = getattr(instance, '_previous_type', None)
+    if previous is None:
+        return
+    instance._previous_type = None
+    if normalize_service_name(previous) != normalize_service_name(instance.type):
+        TypeFacet.adjust(previous, -1)
+        TypeFacet.adjust(instance.type, 1)
+
+
+@receiver(post_save, sender=UserProfile)
+def process_profile_image(sender, instance, **kwargs):
+    from .images import schedule_processing
+    transaction.on_commit(lambda: schedule_processing(instance))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # Se invalida de inmediato y otra vez al confirmar, por si otra petición
+    # volvió a cachear la fila anterior mientras la transacción seguía abierta
+    user_id = instance.pk
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def forget_cached_profile_user(sender, instance, **kwargs):
+    user_id = instance.user_id
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+@receiver(pre_delete, sender=Organization)
+def remember_services(sender, instance, **kwargs):
+    # Las filas de la tabla intermedia se borran en cascada sin emitir m2m_changed
+    instance._service_ids = list(instance.service_tags.values_list('pk', flat=True))
+    # Después de borrar ya no se puede cargar el tipo si venía diferido
+    instance._previous_type = instance.type
+
+
+@receiver(post_delete, sender=Organization)
+def unindex_organization(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: get_backend().remove(pk))
+    transaction.on_commit(lambda: get_suggest_index().remove(pk))
+    transaction.on_commit(lambda: invalidate_organization(pk))
+    service_ids = getattr(instance, '_service_ids', None)
+    if service_ids:
+        Service.refresh_counts(service_ids)
+    TypeFacet.adjust(getattr(instance, '_previous_type', instance.type), -1)
+
+
+@receiver(m2m_changed, sender=Organization.service_tags.through)
+def update_service_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if not reverse:
+            instance._service_ids = list(instance.service_tags.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        service_ids = [instance.pk]
+    elif action == 'post_clear':
+        service_ids = getattr(instance, '_service_ids', [])
+    else:
+        service_ids = pk_set
+    if service_ids:
+        Service.refresh_counts(service_ids)
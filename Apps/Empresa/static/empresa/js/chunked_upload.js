@@ -0,0 +1,125 @@
+// Carga por partes reanudable de logos y fotos (ver Apps/Empresa/uploads.py).
+// Al enviar el formulario la imagen se sube por partes a api/uploads/ y el
+// formulario solo lleva el id de la carga en el campo oculto <campo>_upload.
+(function () {
+    var MAX_RETRIES = 5;
+
+    function csrfToken(form) {
+        var input = form.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function request(method, url, token, body, headers) {
+        var options = {method: method, credentials: 'same-origin', headers: headers || {}};
+        options.headers['X-CSRFToken'] = token;
+        if (body !== undefined) {
+            options.body = body;
+        }
+        return fetch(url, options).then(function (response) {
+            return response.json().then(function (data) {
+                data.httpStatus = response.status;
+                return data;
+            });
+        });
+    }
+
+    function wait(milliseconds) {
+        return new Promise(function (resolve) { setTimeout(resolve, milliseconds); });
+    }
+
+    // Una carga interrumpida se retoma con el mismo archivo (incluso tras recargar la página)
+    function storageKey(file) {
+        return 'empresa-upload:' + [file.name, file.size, file.lastModified].join(':');
+    }
+
+    function start(input, file, token) {
+        var stored = window.localStorage && localStorage.getItem(storageKey(file));
+        var create = function () {
+            var body = new URLSearchParams({filename: file.name, size: file.size});
+            return request('POST', input.dataset.uploadUrl, token, body).then(function (upload) {
+                if (upload.httpStatus !== 201) {
+                    throw new Error(upload.error);
+                }
+                if (window.localStorage) {
+                    localStorage.setItem(storageKey(file), upload.id);
+                }
+                return upload;
+            });
+        };
+        if (!stored) {
+            return create();
+        }
+        return request('GET', input.dataset.uploadUrl + stored + '/', token).then(function (upload) {
+            return upload.httpStatus === 200 ? upload : create();
+        }, create);
+    }
+
+    function send(input, file, token, upload, progress, retries) {
+        if (upload.complete) {
+            return Promise.resolve(upload);
+        }
+        var url = input.dataset.uploadUrl + upload.id + '/';
+        var chunk = file.slice(upload.offset, upload.offset + upload.chunk_size);
+        progress(upload.offset / file.size);
+        return request('PUT', url, token, chunk, {'Upload-Offset': String(upload.offset)}).then(function (next) {
+            if (next.httpStatus === 200 || next.httpStatus === 409) {
+                // 409: el servidor ya tenía esa parte; se sigue desde su offset
+                return send(input, file, token, next, progress, 0);
+            }
+            throw new Error(next.error);
+        }, function () {
+            if (retries >= MAX_RETRIES) {
+                throw new Error('Se perdió la conexión al subir el archivo.');
+            }
+            return wait(1000 * Math.pow(2, retries)).then(function () {
+                return request('GET', url, token);
+            }).then(function (current) {
+                return send(input, file, token, current, progress, retries + 1);
+            }, function () {
+                return send(input, file, token, upload, progress, retries + 1);
+            });
+        });
+    }
+
+    function upload(form, input) {
+        var file = input.files[0];
+        var token = csrfToken(form);
+        var status = document.createElement('small');
+        status.className = 'form-text text-muted';
+        input.insertAdjacentElement('afterend', status);
+        var progress = function (fraction) {
+            status.textContent = 'Subiendo ' + Math.round(fraction * 100) + '%';
+        };
+        return start(input, file, token).then(function (created) {
+            return send(input, file, token, created, progress, 0);
+        }).then(function (done) {
+            if (window.localStorage) {
+                localStorage.removeItem(storageKey(file));
+            }
+            form.querySelector('input[name="' + input.name + '_upload"]').value = done.id;
+            // El archivo ya está en el servidor: no se vuelve a enviar con el formulario
+            input.value = '';
+            status.textContent = 'Archivo subido';
+        }, function (error) {
+            status.className = 'text-danger';
+            status.textContent = error.message;
+            throw error;
+        });
+    }
+
+    document.querySelectorAll('input[type=file][data-upload-url]').forEach(function (input) {
+        var form = input.form;
+        if (!form || !window.fetch || !input.files) {
+            return;
+        }
+        form.addEventListener('submit', function (event) {
+            if (!input.files.length) {
+                return;
+            }
+            event.preventDefault();
+            upload(form, input).then(function () {
+                form.submit();
+            }, function () {});
+        });
+    });
+})();
@@ -0,0 +1,41 @@
+// Scroll infinito: al llegar al final se pide el siguiente fragmento de tarjetas
+(function () {
+    var container = document.getElementById('feed-results');
+    if (!container || !('IntersectionObserver' in window)) {
+        return;
+    }
+    var loading = false;
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting && !loading) {
+                loadMore(entry.target);
+            }
+        });
+    }, {rootMargin: '400px'});
+
+    function watch() {
+        var sentinel = container.querySelector('.feed-sentinel');
+        if (sentinel) {
+            observer.observe(sentinel);
+        }
+    }
+
+    function loadMore(sentinel) {
+        loading = true;
+        observer.unobserve(sentinel);
+        fetch(sentinel.dataset.nextUrl, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+            .then(function (response) { return response.text(); })
+            .then(function (html) {
+                var fragment = document.createElement('template');
+                fragment.innerHTML = html;
+                sentinel.replaceWith(fragment.content);
+                loading = false;
+                watch();
+            })
+            .catch(function () {
+                loading = false;
+            });
+    }
+
+    watch();
+})();
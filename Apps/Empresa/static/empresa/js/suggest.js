@@ -0,0 +1,51 @@
+// Autocompletado del buscador: sugiere servicios y nombres mientras se escribe
+(function () {
+    var input = document.querySelector('input[data-suggest-url]');
+    if (!input || !window.fetch) {
+        return;
+    }
+    var list = document.getElementById(input.getAttribute('list'));
+    var responses = {};
+    var timer = null;
+    var current = '';
+
+    function render(data) {
+        if (data.query !== current) {
+            return;
+        }
+        list.innerHTML = '';
+        data.services.concat(data.names).forEach(function (suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.name;
+            if (suggestion.count !== undefined) {
+                option.label = suggestion.name + ' (' + suggestion.count + ')';
+            }
+            list.appendChild(option);
+        });
+    }
+
+    function suggest() {
+        // Solo se sugiere para el último término (la búsqueda se separa por comas)
+        current = input.value.split(',').pop().trim();
+        if (!current) {
+            list.innerHTML = '';
+            return;
+        }
+        if (responses[current]) {
+            render(responses[current]);
+            return;
+        }
+        fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(current))
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                responses[data.query] = data;
+                render(data);
+            })
+            .catch(function () {});
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 120);
+    });
+})();
@@ -0,0 +1,311 @@
+"""
+Sugerencias (autocompletado) del buscador del directorio.
+
+``api/suggest/?q=<prefijo>`` retorna los primeros nombres de organizaciones y
+los servicios más ofrecidos que empiezan con el prefijo. Se responde desde
+``SuggestIndex``, un índice en memoria que no consulta la base de datos:
+
+* nombres: lista ordenada de claves ``"<nombre normalizado>\\x00<id>"`` con
+  una entrada por cada palabra desde la que puede empezar la búsqueda
+  ("soft" encuentra "Acme Software"); el prefijo se ubica con ``bisect``.
+* servicios: lista ordenada de claves y un diccionario clave ->
+  ``[nombre, organizaciones]``.
+
+El índice se carga al iniciar el servidor (``preload`` desde
+``ProjectOpp/wsgi.py`` y ``asgi.py``), por defecto en un hilo aparte para que
+el worker atienda peticiones mientras tanto (las sugerencias que lleguen antes
+esperan a que termine), o, si no, con la primera petición. Se actualiza con
+las señales ``post_save``/``post_delete`` de ``Organization`` y, cada
+``EMPRESA_SUGGEST_REFRESH_INTERVAL`` segundos, con los cambios de otros
+procesos (``search.SyncedIndex``) en un hilo aparte: la sugerencia que lo
+dispara se responde con lo que ya hay en memoria, así ninguna tecla consulta
+la base de datos. El tamaño del índice se ve en ``api/suggest/stats/``
+(solo staff).
+"""
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .models import normalize_service_name, split_services
+from .search import SyncedIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Máximo de sugerencias de cada tipo que acepta ?limit=
+MAX_LIMIT = 20
+
+_SEPARATOR = '\x00'
+
+
+def get_limit():
+    return getattr(settings, 'EMPRESA_SUGGEST_LIMIT', 8)
+
+
+def get_max_age():
+    return getattr(settings, 'EMPRESA_SUGGEST_MAX_AGE', 60)
+
+
+def get_refresh_interval():
+    return getattr(settings, 'EMPRESA_SUGGEST_REFRESH_INTERVAL', 5)
+
+
+def normalize_prefix(text):
+    return ' '.join(normalize_text(text).split())
+
+
+def _name_keys(name):
+    """Una clave por cada palabra del nombre desde la que puede empezar la búsqueda"""
+    words = normalize_prefix(name).split()
+    return {' '.join(words[position:]) for position in range(len(words))}
+
+
+class SuggestIndex(SyncedIndex):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._documents = {}
+        self._names = []
+        self._service_keys = []
+        self._services = {}
+        self._bytes = 0
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def ensure_loaded(self):
+        with self._lock:
+            self._sync()
+            self._checked_at = time.monotonic()
+
+    def refresh_in_background(self):
+        """Si pasaron ``EMPRESA_SUGGEST_REFRESH_INTERVAL`` segundos desde la última
+        revisión, pone el índice al día en un hilo aparte y lo retorna"""
+        with self._lock:
+            if (not self._loaded or self._refreshing
+                    or time.monotonic() - self._checked_at < get_refresh_interval()):
+                return None
+            self._checked_at = time.monotonic()
+            self._refreshing = True
+        thread = threading.Thread(target=self._catch_up, name='empresa-suggest-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def _catch_up(self):
+        try:
+            self.ensure_loaded()
+        except DatabaseError:
+            logger.warning('No se pudo actualizar el índice de sugerencias', exc_info=True)
+        finally:
+            self._refreshing = False
+            # La conexión del hilo no la cierra ningún request_finished
+            connections.close_all()
+
+    @staticmethod
+    def _rows(pks=None):
+        from .models import Organization
+        organizations = Organization.objects.all() if pks is None else Organization.objects.filter(pk__in=pks)
+        return organizations.values_list('pk', 'name', 'services').iterator(chunk_size=2000)
+
+    def rebuild(self, rows=None):
+        """Reconstruye el índice desde la base de datos o desde ``rows``
+        (tuplas ``(pk, name, services)``)"""
+        version = None
+        if rows is None:
+            from .caching import directory_version
+            version = directory_version()
+            rows = self._rows()
+        with self._lock:
+            self._follows_changes = version is not None
+            if version is not None:
+                self._mark_version(version)
+            self._loaded = False
+            self._documents = {}
+            self._names = []
+            self._services = {}
+            self._bytes = 0
+            for pk, name, services in rows:
+                self._add(pk, name, services)
+            self._names.sort()
+            self._service_keys = sorted(self._services)
+            self._loaded = True
+
+    def _add(self, pk, name, services):
+        name = name or ''
+        services = {normalize_prefix(normalize_service_name(service)): service
+                    for service in split_services(services)}
+        # Las claves de servicio se repiten en miles de organizaciones: se comparten
+        keys = tuple(sys.intern(key) for key in services)
+        self._documents[pk] = (name, keys)
+        self._bytes += sys.getsizeof(name) + sys.getsizeof(keys)
+        for key in _name_keys(name):
+            entry = '%s%s%d' % (key, _SEPARATOR, pk)
+            self._bytes += sys.getsizeof(entry)
+            if self._loaded:
+                bisect.insort(self._names, entry)
+            else:
+                self._names.append(entry)
+        for key, display in services.items():
+            service = self._services.get(key)
+            if service is None:
+                service = self._services[key] = [display, 0]
+                self._bytes += sys.getsizeof(key) + sys.getsizeof(display)
+                if self._loaded:
+                    bisect.insort(self._service_keys, key)
+            service[1] += 1
+
+    def _discard(self, pk):
+        document = self._documents.pop(pk, None)
+        if document is None:
+            return
+        name, keys = document
+        self._bytes -= sys.getsizeof(name) + sys.getsizeof(keys)
+        for key in _name_keys(name):
+            entry = '%s%s%d' % (key, _SEPARATOR, pk)
+            position = bisect.bisect_left(self._names, entry)
+            if position < len(self._names) and self._names[position] == entry:
+                del self._names[position]
+                self._bytes -= sys.getsizeof(entry)
+        for key in keys:
+            service = self._services[key]
+            service[1] -= 1
+            if not service[1]:
+                del self._services[key]
+                self._bytes -= sys.getsizeof(key) + sys.getsizeof(service[0])
+                del self._service_keys[bisect.bisect_left(self._service_keys, key)]
+
+    def index(self, organization):
+        with self._lock:
+            if self._loaded:
+                self._discard(organization.pk)
+                self._add(organization.pk, organization.name, organization.services)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._loaded:
+                self._discard(pk)
+
+    def _refresh(self, pks):
+        for pk in pks:
+            self._discard(pk)
+        for pk, name, services in self._rows(pks):
+            self._add(pk, name, services)
+
+    def _prefix_range(self, keys, prefix):
+        position = bisect.bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            yield keys[position]
+            position += 1
+
+    def suggest(self, text, limit=None):
+        """Retorna ``(nombres, servicios)``: listas de ``(id, nombre)`` en orden
+        alfabético y de ``(servicio, organizaciones)`` de más a menos ofrecido"""
+        prefix = normalize_prefix(text)
+        limit = min(limit or get_limit(), MAX_LIMIT)
+        if not prefix:
+            return [], []
+        self.refresh_in_background()
+        with self._lock:
+            if not self._loaded:
+                # Sin precarga: la primera sugerencia construye el índice
+                self.ensure_loaded()
+            names = {}
+            for entry in self._prefix_range(self._names, prefix):
+                pk = int(entry.rpartition(_SEPARATOR)[2])
+                if pk not in names:
+                    names[pk] = self._documents[pk][0]
+                    if len(names) >= limit:
+                        break
+            services = [self._services[key] for key in self._prefix_range(self._service_keys, prefix)]
+        services.sort(key=lambda service: (-service[1], service[0]))
+        return list(names.items()), [tuple(service) for service in services[:limit]]
+
+    def stats(self):
+        """Entradas y tamaño aproximado del índice en bytes"""
+        with self._lock:
+            size = (self._bytes + sys.getsizeof(self._documents) + sys.getsizeof(self._names)
+                    + sys.getsizeof(self._service_keys) + sys.getsizeof(self._services)
+                    + len(self._services) * sys.getsizeof([None, 0]))
+            return {
+                'loaded': self._loaded,
+                'organizations': len(self._documents),
+                'name_entries': len(self._names),
+                'services': len(self._services),
+                'bytes': size,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_suggest_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SuggestIndex()
+    return _index
+
+
+def reset_suggest_index():
+    """Descarta el índice actual (tests, cargas en bloque)"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def preload():
+    """Carga el índice al iniciar el servidor. Con ``EMPRESA_SUGGEST_PRELOAD =
+    'background'`` lo construye un hilo y retorna enseguida"""
+    global _preloading
+    mode = getattr(settings, 'EMPRESA_SUGGEST_PRELOAD', 'background')
+    if not mode:
+        return None
+    if mode != 'background':
+        _load()
+        return None
+    _preloading = True
+    thread = threading.Thread(target=_load_in_background, name='empresa-suggest-preload', daemon=True)
+    thread.start()
+    return thread
+
+
+def _load():
+    try:
+        get_suggest_index().ensure_loaded()
+    except DatabaseError:
+        # Base sin migrar: el índice se cargará con la primera petición
+        logger.warning('No se pudo precargar el índice de sugerencias', exc_info=True)
+
+
+def _load_in_background():
+    global _preloading
+    try:
+        _load()
+    finally:
+        _preloading = False
+        # La conexión del hilo no la cierra ningún request_finished
+        connections.close_all()
+
+
+_preloading = False
+
+
+def _discard_partial_index():
+    # Fork (p. ej. gunicorn --preload) mientras un hilo construía o ponía al
+    # día el índice: en el proceso hijo el hilo no existe y el índice y sus
+    # locks quedaron a medias
+    global _index, _index_lock, _preloading
+    if _preloading or (_index is not None and _index._refreshing):
+        _index = None
+        _index_lock = threading.Lock()
+        _preloading = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_partial_index)
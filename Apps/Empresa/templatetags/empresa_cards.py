@@ -0,0 +1,11 @@
+from django import template
+
+from Apps.Empresa.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def organization_cards(organizations, manage=False):
+    """Tarjetas de organizaciones (ver Apps/Empresa/cards.py)"""
+    return render_cards(organizations, manage=manage)
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from Apps.Empresa.assets import read_static
+
+register = template.Library()
+
+
+@register.simple_tag
+def inline_static(path):
+    """Inserta en línea el contenido de un estático (CSS crítico de los feeds)"""
+    return mark_safe(read_static(path))
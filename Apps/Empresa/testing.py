@@ -0,0 +1,48 @@
+import importlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+
+class BudgetTestRunner(DiscoverRunner):
+    """
+    Runner de tests que activa la instrumentación de consultas en modo
+    estricto: cualquier petición del cliente de pruebas que supere el
+    presupuesto de su vista en ``EMPRESA_QUERY_BUDGETS`` hace fallar el test.
+    Los límites de peticiones se desactivan (todas vienen de la misma IP); los
+    tests de ``ratelimit.py`` los configuran con ``override_settings``.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._budget_settings = override_settings(
+            EMPRESA_QUERY_INSTRUMENTATION=True,
+            EMPRESA_QUERY_BUDGET_STRICT=True,
+            EMPRESA_QUERY_REPORT_PATH=None,
+            EMPRESA_RATE_LIMITS={},
+        )
+        self._budget_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._budget_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def _reload_urlconf():
+    importlib.reload(importlib.import_module('Apps.Empresa.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def async_feed_views(enabled=True):
+    """Activa o desactiva ``EMPRESA_ASYNC_VIEWS`` recargando las URLs"""
+    try:
+        with override_settings(EMPRESA_ASYNC_VIEWS=enabled):
+            _reload_urlconf()
+            yield
+    finally:
+        _reload_urlconf()
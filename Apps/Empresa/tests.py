@@ -1,3 +1,1479 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from PIL import Image
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import Http404, QueryDict
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from .admin import OrganizationImportUploadForm
+from .assets import serve as serve_static
+from .caching import USER_KEY, card_context, forget_directory_version, get_recent_organizations
+from .cards import render_cards
+from .changes import prune_changes, read_changes
+from .facets import parse_facets
+from .images import process_image
+from .importer import ImportResult, import_organizations
+from .instrumentation import QueryBudgetExceeded, RequestStats, append_report
+from .models import (ChunkedUpload, Organization, OrganizationChange, OrganizationFeedEntry, Service, TypeFacet,
+                     UserProfile)
+from .pagination import decode_cursor, directory_count, encode_cursor, facet_count
+from .ratelimit import client_ip, parse_rate, reset_stores, take_token
+from .routers import ReadReplicaRouter, in_own_connection, read_alias, replica_reads, use_replica
+from .search import (PostgresSearchBackend, PythonSearchBackend, get_backend, normalize_text, parse_query,
+                     reset_backend, search_organizations)
+from . import suggest
+from .management.commands.profile_startup import parse_importtime
+from .suggest import get_suggest_index, reset_suggest_index
+from .testing import async_feed_views
+from .uploads import OversizedUpload
+
+
+def create_profile(username='owner'):
+    user = User.objects.create_user(username=username, password='secreto-123')
+    return UserProfile.objects.create(user=user, email='%s@example.com' % username)
+
+
+def create_organization(owner, **fields):
+    values = {
+        'name': 'Organización',
+        'type': 'Tecnología',
+        'website': 'https://www.ejemplo.com',
+        'phone': '3000000000',
+        'nit': '900000000-1',
+        'services': '',
+    }
+    values.update(fields)
+    return Organization.objects.create(owner=owner, **values)
+
+
+def pks(objects):
+    # Los feeds muestran filas de OrganizationFeedEntry, que comparten la llave
+    return [obj.pk for obj in objects]
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python')
+class SearchTests(TestCase):
+    def setUp(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.owner = create_profile()
+        self.acme = create_organization(self.owner, name='Acme Software', type='Tecnología',
+                                        services='Desarrollo Web, Cloud')
+        self.norte = create_organization(self.owner, name='Consultores del Norte', type='Consultoría',
+                                         services='Auditoría, Desarrollo Web')
+        self.pan = create_organization(self.owner, name='Panadería Central', type='Comercio',
+                                       services='Eventos')
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query(' Marketing ,, desarrollo  web, marketing'),
+                         ['marketing', 'desarrollo web'])
+
+    def test_search_matches_prefixes_and_ranks_by_field(self):
+        hits = search_organizations('desarr')
+        self.assertEqual({hit.pk for hit in hits}, {self.acme.pk, self.norte.pk})
+        # Una coincidencia en el nombre pesa más que una en los servicios
+        self.assertEqual(search_organizations('consult, desarrollo')[0].pk, self.norte.pk)
+
+    def test_index_follows_saves_and_deletes(self):
+        search_organizations('acme')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.services = 'Cloud'
+            self.pan.save()
+        self.assertIn(self.pan.pk, [hit.pk for hit in search_organizations('cloud')])
+        pk = self.acme.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme.delete()
+        self.assertNotIn(pk, [hit.pk for hit in search_organizations('cloud')])
+
+    def test_accent_insensitive_and_typo_tolerant(self):
+        self.assertEqual(normalize_text('Consultoría TÉCNICA'), 'consultoria tecnica')
+        self.assertEqual([hit.pk for hit in search_organizations('consultoria')], [self.norte.pk])
+        self.assertEqual([hit.pk for hit in search_organizations('Panaderia')], [self.pan.pk])
+        # Un error de tipeo (o dos letras invertidas) se corrige con el vocabulario
+        self.assertEqual({hit.pk for hit in search_organizations('desarrolo')}, {self.acme.pk, self.norte.pk})
+        self.assertEqual([hit.pk for hit in search_organizations('evnetos')], [self.pan.pk])
+        self.assertEqual(search_organizations('xyzw'), [])
+        # Una coincidencia aproximada vale menos que una exacta
+        exact, fuzzy = search_organizations('eventos')[0], search_organizations('evnetos')[0]
+        self.assertLess(fuzzy.score, exact.score)
+
+    def test_index_follows_changes_from_other_processes(self):
+        search_organizations('acme')
+        Organization.objects.filter(pk=self.pan.pk).update(services='Cloud')
+        OrganizationChange.objects.create(organization_id=self.pan.pk, action=OrganizationChange.UPDATED)
+        forget_directory_version()
+        self.assertIn(self.pan.pk, [hit.pk for hit in search_organizations('cloud')])
+
+    def test_rebuild_from_rows(self):
+        backend = PythonSearchBackend()
+        backend.rebuild([(1, 'Delta', 'Salud', 'Eventos'), (2, 'Nova', 'Salud', None)])
+        self.assertEqual([hit.pk for hit in backend.search('salud')], [2, 1])
+
+    def test_public_feed_search(self):
+        response = self.client.get(reverse('public_feed'), {'search': 'panader'})
+        self.assertEqual(pks(response.context['organizations']), pks([self.pan]))
+
+
+class SearchCursorTests(TestCase):
+    """Los empates de puntaje en el límite de una página no repiten ni saltan filas"""
+
+    def setUp(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+        owner = create_profile()
+        # Mismo texto: el mismo puntaje en ambos motores
+        self.tied = [create_organization(owner, name='Cloud Andina', services='Cloud') for _ in range(5)]
+        self.best = create_organization(owner, name='Cloud Cloud', type='Cloud', services='Cloud')
+
+    def walk(self, page_size=2):
+        backend, seen, after = get_backend(), [], None
+        while True:
+            hits = backend.search('cloud', limit=page_size + 1, after=after)
+            seen.extend(hit.pk for hit in hits[:page_size])
+            if len(hits) <= page_size:
+                return seen
+            # El cursor viaja como JSON, igual que en el feed
+            after = decode_cursor(encode_cursor(hits[page_size - 1].score, hits[page_size - 1].pk), 2)
+
+    def assert_walks_every_row(self):
+        tied = sorted((organization.pk for organization in self.tied), reverse=True)
+        self.assertEqual(self.walk(), [self.best.pk] + tied)
+
+    @override_settings(EMPRESA_SEARCH_BACKEND='python')
+    def test_memory_backend(self):
+        self.assert_walks_every_row()
+
+    @skipUnless(connection.vendor == 'postgresql', 'requiere Postgres con pg_trgm')
+    @override_settings(EMPRESA_SEARCH_BACKEND='postgres')
+    def test_postgres_backend(self):
+        self.assert_walks_every_row()
+
+
+class SearchParityTests(TestCase):
+    """Ambos motores devuelven las mismas organizaciones y conteos para la misma
+    búsqueda y facetas (en búsquedas sin coincidencias aproximadas)"""
+
+    def setUp(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+        owner = create_profile()
+        self.acme = self.add(owner, 'Acme Software', 'Tecnología', 'Desarrollo Web, Cloud')
+        self.norte = self.add(owner, 'Consultores del Norte', 'Consultoría', 'Auditoría, Desarrollo Web')
+        self.cafe = self.add(owner, 'Café Andino', 'Comercio', 'Café, Eventos')
+        self.nube = self.add(owner, 'Nube Andina', 'TECNOLOGIA', 'Cloud, Marketing')
+        # (búsqueda, facetas, organizaciones esperadas)
+        self.cases = [
+            ('desarr', '', [self.acme, self.norte]),
+            # "Marketing" contiene "ing", pero ninguna palabra empieza así
+            ('ing', '', []),
+            ('CAFÉ', '', [self.cafe]),
+            ('andin', '', [self.cafe, self.nube]),
+            ('web, cloud', '', [self.acme, self.norte, self.nube]),
+            ('cloud', 'type=tecnología', [self.acme, self.nube]),
+            ('desarr', 'type=Consultoria', [self.norte]),
+            ('andin', 'service=cafe', [self.cafe]),
+            ('web', 'service=cloud&service=Desarrollo+Web', [self.acme]),
+        ]
+
+    def add(self, owner, name, organization_type, services):
+        organization = create_organization(owner, name=name, type=organization_type, services=services)
+        organization.set_services(services)
+        return organization
+
+    def results(self, backend):
+        results = []
+        for search_query, params, _ in self.cases:
+            facets = parse_facets(QueryDict(params))
+            hits = backend.search(search_query, facets=facets)
+            results.append(({hit.pk for hit in hits}, backend.count(search_query, facets=facets)))
+        return results
+
+    def test_memory_backend(self):
+        expected = [({organization.pk for organization in organizations}, len(organizations))
+                    for _, _, organizations in self.cases]
+        self.assertEqual(self.results(PythonSearchBackend()), expected)
+
+    @skipUnless(connection.vendor == 'postgresql', 'requiere Postgres con pg_trgm')
+    def test_postgres_backend_matches_memory_backend(self):
+        self.assertEqual(self.results(PostgresSearchBackend()), self.results(PythonSearchBackend()))
+
+
+class ServiceTagTests(TestCase):
+    def setUp(self):
+        self.owner = create_profile()
+        self.client.force_login(self.owner.user)
+
+    def post_organization(self, url, services):
+        return self.client.post(url, {
+            'name': 'Acme', 'type': 'Tecnología', 'website': 'https://acme.example.com',
+            'phone': '3000000000', 'nit': '900123456-1', 'services': services,
+        })
+
+    def test_form_accepts_comma_separated_services(self):
+        self.post_organization(reverse('create_organization'), 'Cloud, desarrollo  web,, cloud')
+        organization = Organization.objects.get()
+        self.assertEqual(organization.services, 'Cloud, desarrollo web')
+        self.assertEqual(sorted(organization.service_tags.values_list('normalized_name', flat=True)),
+                         ['cloud', 'desarrollo web'])
+        self.assertEqual(Service.objects.exact('CLOUD').get().organization_count, 1)
+        self.assertEqual(list(Service.objects.prefix('desa').values_list('name', flat=True)),
+                         ['desarrollo web'])
+
+    def test_counts_follow_edits_and_deletes(self):
+        other = create_organization(self.owner, name='Otra')
+        other.set_services('Cloud')
+        self.post_organization(reverse('create_organization'), 'Cloud, Eventos')
+        organization = Organization.objects.get(name='Acme')
+        self.assertEqual(Service.objects.exact('cloud').get().organization_count, 2)
+
+        self.post_organization(reverse('edit_organization', args=[organization.pk]), 'Eventos')
+        self.assertEqual(Service.objects.exact('cloud').get().organization_count, 1)
+
+        self.client.post(reverse('delete_organization', args=[organization.pk]))
+        self.assertEqual(Service.objects.exact('eventos').get().organization_count, 0)
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python', EMPRESA_FEED_PAGE_SIZE=2)
+class FeedPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.owner = create_profile()
+        self.organizations = [
+            create_organization(self.owner, name='Org %d' % index, services='Cloud')
+            for index in range(5)
+        ]
+
+    def test_dashboard_feed_walks_pages_by_cursor(self):
+        self.client.force_login(self.owner.user)
+        response = self.client.get(reverse('dashboard_feed'))
+        newest = list(reversed(self.organizations))
+        self.assertEqual(pks(response.context['organizations']), pks(newest[:2]))
+        self.assertEqual(response.context['total_count'], 5)
+
+        seen = list(response.context['organizations'])
+        next_url = response.context['next_url']
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertTemplateUsed(response, 'organization/feed_cards.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            seen.extend(response.context['organizations'])
+            next_url = response.context['next_url']
+        self.assertEqual(pks(seen), pks(newest))
+
+    def test_search_pages_keep_relevance_order(self):
+        self.organizations[1].name = 'Cloud Andina'
+        self.organizations[1].save()
+        response = self.client.get(reverse('public_feed'), {'search': 'cloud'})
+        self.assertEqual(response.context['organizations'][0].pk, self.organizations[1].pk)
+        self.assertEqual(response.context['total_count'], 5)
+
+        seen = list(response.context['organizations'])
+        next_url = response.context['next_url']
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(response.context['organizations'])
+            next_url = response.context['next_url']
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_cached_totals_follow_the_directory_version(self):
+        facets = parse_facets(QueryDict('type=Tecnología'))
+        self.assertEqual((directory_count(), facet_count(facets)), (5, 5))
+        # Sin ejecutar los callbacks de on_commit: la versión sale del registro de cambios
+        with self.captureOnCommitCallbacks(execute=False):
+            create_organization(self.owner, name='Org nueva', services='Cloud')
+        self.assertEqual((directory_count(), facet_count(facets)), (6, 6))
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        response = self.client.get(reverse('public_feed_page'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['organizations']), 2)
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python')
+class FeedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.owner = create_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization = create_organization(self.owner, name='Acme', services='Cloud')
+
+    def test_edit_invalidates_card_and_anonymous_feed(self):
+        self.assertContains(self.client.get(reverse('public_feed')), 'Acme')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('public_feed'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.name = 'Acme Renovada'
+            self.organization.save()
+        self.assertContains(self.client.get(reverse('public_feed')), 'Acme Renovada')
+
+    def test_recent_organizations_are_cached_until_a_change(self):
+        self.client.force_login(self.owner.user)
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(pks(get_recent_organizations()), pks([self.organization]))
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = create_organization(self.owner, name='Nueva')
+        self.assertEqual(pks(get_recent_organizations()), pks([newer, self.organization]))
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'Nueva')
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python', EMPRESA_FEED_PAGE_SIZE=2)
+class AsyncFeedViewTests(TransactionTestCase):
+    # Las consultas corren en otros hilos con sus propias conexiones: los datos
+    # tienen que estar confirmados
+    def setUp(self):
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.enterContext(async_feed_views())
+        self.owner = create_profile()
+        self.organizations = [
+            create_organization(self.owner, name='Org %d' % index, services='Cloud')
+            for index in range(5)
+        ]
+
+    def test_feed_views_are_async(self):
+        for name in ('dashboard', 'public_feed', 'dashboard_feed', 'dashboard_feed_page'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse(name)).func), name)
+
+    async def test_dashboard_feed_walks_pages_by_cursor(self):
+        await sync_to_async(self.async_client.force_login)(self.owner.user)
+        response = await self.async_client.get(reverse('dashboard_feed'))
+        self.assertEqual(response.context['organization'].pk, self.organizations[0].pk)
+        self.assertEqual(response.context['total_count'], 5)
+        seen = list(response.context['organizations'])
+        next_url = response.context['next_url']
+        while next_url:
+            response = await self.async_client.get(next_url)
+            seen.extend(response.context['organizations'])
+            next_url = response.context['next_url']
+        self.assertEqual(pks(seen), pks(reversed(self.organizations)))
+
+    async def test_independent_queries_run_concurrently(self):
+        # Con una barrera de dos: si corrieran una después de la otra no pasarían
+        barrier = threading.Barrier(2, timeout=5)
+
+        def count():
+            barrier.wait()
+            return OrganizationFeedEntry.objects.count()
+
+        self.assertEqual(await asyncio.gather(in_own_connection(count)(), in_own_connection(count)()), [5, 5])
+
+    async def test_anonymous_public_feed_search(self):
+        response = await self.async_client.get(reverse('public_feed'), {'search': 'org 3'})
+        self.assertEqual(response.context['organizations'][0].pk, self.organizations[3].pk)
+        self.assertContains(response, 'Org 3')
+
+    async def test_dashboard_requires_login_and_creates_profile(self):
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertRedirects(response, '%s?next=%s' % (reverse('login'), reverse('dashboard')),
+                             fetch_redirect_response=False)
+
+        user = await User.objects.acreate(username='sin-perfil')
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(await UserProfile.objects.filter(user=user).aexists())
+        self.assertEqual(len(response.context['recent_organizations']), 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        self.organizations = [
+            create_organization(self.owner, name='Org %d' % index, services='Cloud, Eventos')
+            for index in range(3)
+        ]
+
+    def export(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(reverse('organization_export'), params, **headers)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_with_since_id(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [organization.pk for organization in self.organizations])
+        self.assertEqual(rows[0]['services'], ['Cloud', 'Eventos'])
+
+        _, body = self.export(since_id=self.organizations[0].pk)
+        self.assertEqual([json.loads(line)['name'] for line in body.splitlines()], ['Org 1', 'Org 2'])
+
+    def test_json_array_and_invalid_params(self):
+        _, body = self.export(format='json')
+        self.assertEqual([row['name'] for row in json.loads(body)], ['Org 0', 'Org 1', 'Org 2'])
+        response = self.client.get(reverse('organization_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('organization_export'), {'since_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_changes_with_the_directory(self):
+        response, _ = self.export()
+        etag = response['ETag']
+        response = self.client.get(reverse('organization_export'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organizations[0].name = 'Org renombrada'
+            self.organizations[0].save()
+        response, body = self.export(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Org renombrada', body)
+
+        # Un cambio registrado por otro proceso también cambia el ETag
+        etag = response['ETag']
+        OrganizationChange.objects.create(organization_id=self.organizations[1].pk,
+                                          action=OrganizationChange.UPDATED)
+        forget_directory_version()
+        response, _ = self.export(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        create_organization(self.owner, name='Existente', nit='900000000-1')
+
+    def test_csv_import_validates_and_dedupes_on_nit(self):
+        stream = io.StringIO(
+            'name,type,website,phone,nit,services\n'
+            'Andina,Tecnología,https://andina.example.com,300,800-1,"Cloud, cloud, Eventos"\n'
+            ',Salud,https://sin-nombre.example.com,300,800-2,\n'
+            'Andina Copia,Tecnología,https://copia.example.com,300,800-1,\n'
+            'Ya existe,Salud,https://existe.example.com,300,900000000-1,\n'
+            'Caribe,Salud,https://caribe.example.com,300,800-3,Eventos\n'
+        )
+        rejects = io.StringIO()
+        result = import_organizations(stream, 'csv', self.owner, batch_size=2, rejects=rejects)
+        self.assertEqual(result, ImportResult(created=2, duplicates=2, rejected=3))
+
+        andina = Organization.objects.get(nit='800-1')
+        self.assertEqual(andina.owner, self.owner)
+        self.assertEqual(andina.services, 'Cloud, Eventos')
+        self.assertEqual(sorted(andina.service_tags.values_list('name', flat=True)), ['Cloud', 'Eventos'])
+        self.assertEqual(Service.objects.get(normalized_name='eventos').organization_count, 2)
+
+        rejected = list(csv.DictReader(io.StringIO(rejects.getvalue())))
+        self.assertEqual([row['line'] for row in rejected], ['3', '4', '5'])
+        self.assertIn('name', rejected[0]['errors'])
+        self.assertEqual(rejected[2]['errors'], 'NIT ya registrado')
+
+    def test_ndjson_import_and_admin_upload(self):
+        stream = io.StringIO(
+            '{"name": "Delta", "type": "Logística", "website": "https://delta.example.com",'
+            ' "phone": "300", "nit": "700-1", "services": ["Transporte", "Logística"]}\n'
+            'no es json\n'
+        )
+        result = import_organizations(stream, 'ndjson', self.owner)
+        self.assertEqual((result.created, result.rejected), (1, 1))
+        self.assertEqual(Organization.objects.get(nit='700-1').services, 'Transporte, Logística')
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secreto-123')
+        self.client.force_login(admin_user)
+        upload = SimpleUploadedFile('orgs.csv', 'name,type,website,phone,nit,services\n'
+                                    'Nova,Salud,https://nova.example.com,300,700-2,\n'.encode())
+        response = self.client.post(reverse('admin:Empresa_organization_import'),
+                                    {'file': upload, 'owner': self.owner.user.username})
+        self.assertRedirects(response, reverse('admin:Empresa_organization_changelist'))
+        self.assertTrue(Organization.objects.filter(nit='700-2', owner=self.owner).exists())
+
+    def test_admin_edit_syncs_service_tags(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secreto-123')
+        self.client.force_login(admin_user)
+        organization = Organization.objects.get(nit='900000000-1')
+        url = reverse('admin:Empresa_organization_change', args=[organization.pk])
+        self.assertNotContains(self.client.get(url), 'name="service_tags"')
+        response = self.client.post(url, {
+            'name': 'Existente', 'type': 'Salud', 'website': 'https://existe.example.com', 'phone': '300',
+            'nit': '900000000-1', 'services': 'Cloud, Eventos', 'owner': self.owner.pk,
+        })
+        self.assertRedirects(response, reverse('admin:Empresa_organization_changelist'))
+        self.assertEqual(sorted(organization.service_tags.values_list('name', flat=True)), ['Cloud', 'Eventos'])
+        self.assertEqual(Service.objects.get(normalized_name='cloud').organization_count, 1)
+
+    @override_settings(EMPRESA_UPLOAD_MAX_SIZE=1024)
+    def test_admin_upload_is_not_limited_to_image_size(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'secreto-123')
+        self.client.force_login(admin_user)
+        rows = ''.join('Org %d,Salud,https://org%d.example.com,300,600-%d,\n' % (i, i, i) for i in range(40))
+        upload = SimpleUploadedFile('orgs.csv', ('name,type,website,phone,nit,services\n' + rows).encode())
+        self.assertGreater(upload.size, 1024)
+        response = self.client.post(reverse('admin:Empresa_organization_import'),
+                                    {'file': upload, 'owner': self.owner.user.username})
+        self.assertRedirects(response, reverse('admin:Empresa_organization_changelist'))
+        self.assertEqual(Organization.objects.filter(nit__startswith='600-').count(), 40)
+        # Un archivo descartado por tamaño es un error del formulario
+        form = OrganizationImportUploadForm({'owner': self.owner.user.username},
+                                            {'file': OversizedUpload('orgs.csv', 'text/csv', 10 ** 7)})
+        self.assertIn('demasiado grande', form.errors['file'][0])
+
+
+class QuerySetProjectionTests(TestCase):
+    """Las vistas con listas de organizaciones no hacen una consulta por fila"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secreto-123')
+
+    def add_organizations(self, count):
+        for index in range(count):
+            owner = create_profile('dueno-%d-%d' % (Organization.objects.count(), index))
+            create_organization(owner, name='Org %d' % index, nit='800-%d' % index)
+            create_organization(self.owner, name='Propia %d' % index, nit='801-%d' % index)
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        pages = [
+            (self.owner.user, reverse('organization_list')),
+            (self.owner.user, reverse('dashboard_feed')),
+            (self.admin, reverse('admin:Empresa_organization_changelist')),
+        ]
+        self.add_organizations(1)
+        before = [self.count_queries(user, url) for user, url in pages]
+        self.add_organizations(10)
+        cache.clear()
+        self.assertEqual([self.count_queries(user, url) for user, url in pages], before)
+
+    def test_projections_load_only_their_fields(self):
+        create_organization(self.owner, name='Acme')
+        organization = Organization.objects.for_owner_list().get()
+        with self.assertNumQueries(0):
+            self.assertEqual(organization.owner.user.username, 'owner')
+            self.assertEqual(str(organization.owner), '%d_user_profile' % self.owner.user_id)
+        self.assertIn('nit', Organization.objects.for_feed().get().get_deferred_fields())
+        self.assertIn('owner_id', Organization.objects.for_export().get().get_deferred_fields())
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python')
+class ExplainViewsTests(TestCase):
+    def test_indexed_queries_are_not_flagged(self):
+        reset_backend()
+        self.addCleanup(reset_backend)
+        owner = create_profile()
+        for index in range(3):
+            create_organization(owner, name='Org %d' % index, nit='800-%d' % index)
+        out = io.StringIO()
+        call_command('explain_views', '--threshold', '0', '--json', '--username', 'owner', stdout=out)
+        views = {view['view']: view for view in json.loads(out.getvalue())['views']}
+        self.assertTrue(all(view['status'] == 200 for view in views.values()))
+        self.assertEqual(views['dashboard']['flagged'], [])
+        self.assertEqual(views['organization_list']['flagged'], [])
+        # El índice en memoria del motor de búsqueda lee toda la tabla al construirse
+        self.assertEqual(views['public_feed (búsqueda)']['flagged'][0]['table'], 'Empresa_organization')
+
+    def test_lower_case_filters(self):
+        owner = create_profile()
+        create_organization(owner, name='Andina', type='Tecnología')
+        self.assertEqual(Organization.objects.of_type('TECNOLOGíA').count(), 1)
+        self.assertEqual(Organization.objects.named('andina').count(), 1)
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        self.client.force_login(self.owner.user)
+
+    def test_session_user_and_profile_come_from_cache(self):
+        self.client.get(reverse('edit_profile'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('edit_profile'))
+        self.assertEqual(response.context['profile'], self.owner)
+
+    def test_profile_form_invalidates_user_and_profile(self):
+        self.client.get(reverse('edit_profile'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_profile'), {
+                'first_name': 'Ana', 'last_name': 'Ruiz', 'email': 'ana@example.com',
+            })
+        user = self.client.get(reverse('edit_profile')).wsgi_request.user
+        self.assertEqual(user.first_name, 'Ana')
+        self.assertEqual(user.profile.email, 'ana@example.com')
+
+    def test_password_hash_is_not_cached(self):
+        user = self.owner.user
+        self.client.get(reverse('edit_profile'))
+        cached = cache.get(USER_KEY % user.pk)
+        self.assertNotIn('password', cached['user'])
+        self.assertNotIn(user.password, repr(cached))
+
+        # La contraseña diferida no se sobrescribe al guardar y se verifica con una consulta
+        cached_user = self.client.get(reverse('edit_profile')).wsgi_request.user
+        cached_user.first_name = 'Ana'
+        cached_user.save()
+        with self.assertNumQueries(1):
+            self.assertTrue(cached_user.check_password('secreto-123'))
+
+    def test_new_password_changes_the_session_hash(self):
+        self.client.get(reverse('edit_profile'))
+        user = self.client.get(reverse('edit_profile')).wsgi_request.user
+        session_hash = user.get_session_auth_hash()
+        self.assertEqual(session_hash, self.owner.user.get_session_auth_hash())
+        # update_session_auth_hash() tras cambiar la contraseña usa la nueva
+        user.set_password('otra-clave-456')
+        self.assertNotEqual(user.get_session_auth_hash(), session_hash)
+
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python')
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.owner = create_profile()
+        self.acme = self.add('Acme', 'Tecnología', 'Cloud, Desarrollo Web')
+        self.nube = self.add('Nube', 'TECNOLOGíA', 'Cloud')
+        self.norte = self.add('Norte', 'Consultoría', 'Desarrollo Web')
+
+    def add(self, name, organization_type, services):
+        organization = create_organization(self.owner, name=name, type=organization_type, services=services)
+        organization.set_services(services)
+        return organization
+
+    def type_counts(self):
+        return dict(TypeFacet.objects.popular().values_list('normalized_name', 'organization_count'))
+
+    def test_type_counts_follow_creates_edits_and_deletes(self):
+        self.assertEqual(self.type_counts(), {'tecnologia': 2, 'consultoria': 1})
+        self.nube.type = 'Consultoría'
+        self.nube.save()
+        self.assertEqual(self.type_counts(), {'tecnologia': 1, 'consultoria': 2})
+        # Guardar sin cambiar el tipo no altera los conteos
+        self.nube.save()
+        self.norte.delete()
+        self.assertEqual(self.type_counts(), {'tecnologia': 1, 'consultoria': 1})
+
+        TypeFacet.objects.update(organization_count=7)
+        call_command('rebuild_facets', stdout=io.StringIO())
+        self.assertEqual(self.type_counts(), {'tecnologia': 1, 'consultoria': 1})
+
+    def test_public_feed_filters_by_type_and_services(self):
+        url = reverse('public_feed')
+        response = self.client.get(url, {'type': 'tecnología'})
+        self.assertEqual(pks(response.context['organizations']), pks([self.nube, self.acme]))
+        self.assertEqual(response.context['total_count'], 2)
+
+        response = self.client.get(url, {'service': ['cloud', 'desarrollo web']})
+        self.assertEqual(pks(response.context['organizations']), pks([self.acme]))
+        self.assertEqual(response.context['total_count'], 1)
+
+        response = self.client.get(url, {'search': 'desarrollo', 'type': 'consultoria'})
+        self.assertEqual(pks(response.context['organizations']), pks([self.norte]))
+        self.assertEqual(response.context['total_count'], 1)
+
+        services = {facet['name']: facet for facet in response.context['service_facets']}
+        self.assertEqual(services['Cloud']['count'], 2)
+        self.assertIn('type=consultoria', services['Cloud']['url'])
+        types = {facet['name']: facet for facet in response.context['type_facets']}
+        self.assertTrue(types['Consultoría']['active'])
+        self.assertEqual(types['Tecnología']['count'], 2)
+
+    @override_settings(EMPRESA_FEED_PAGE_SIZE=1)
+    def test_next_page_keeps_the_filters(self):
+        response = self.client.get(reverse('public_feed'), {'service': 'cloud'})
+        self.assertEqual(pks(response.context['organizations']), pks([self.nube]))
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual(pks(response.context['organizations']), pks([self.acme]))
+        self.assertIsNone(response.context['next_url'])
+
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        settings_override = override_settings(STATIC_ROOT=self.static_root, DEBUG=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+
+    def test_hashed_and_compressed_files_with_cache_headers(self):
+        url = staticfiles_storage.url('empresa/js/infinite_scroll.js')
+        self.assertRegex(url, r'/static/empresa/js/infinite_scroll\.[0-9a-f]{12}\.js$')
+        path = url[len(settings.STATIC_URL):]
+        request = RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        response = serve_static(request, path)
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with open(finders.find('empresa/js/infinite_scroll.js'), 'rb') as source:
+            self.assertLess(len(body), len(source.read()))
+
+        response = serve_static(RequestFactory().get(url), path)
+        self.assertNotIn('Content-Encoding', response)
+        response.close()
+        with self.assertRaises(Http404):
+            serve_static(RequestFactory().get(url), '../settings.py')
+
+    def test_feed_pages_inline_critical_css(self):
+        response = self.client.get(reverse('public_feed'))
+        self.assertContains(response, '.sidebar {')
+        self.assertContains(response, 'rel="preload" href="%s"' % staticfiles_storage.url('empresa/css/cards.css'))
+        self.assertNotContains(response, staticfiles_storage.url('empresa/css/layout.css'))
+
+
+
+@override_settings(EMPRESA_SEARCH_BACKEND='python')
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_backend()
+        self.addCleanup(reset_backend)
+        self.owner = create_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization = create_organization(self.owner, name='Acme', services='Cloud')
+
+    def test_anonymous_feed_is_cached_and_revalidated(self):
+        url = reverse('public_feed')
+        response = self.client.get(url, {'search': 'Cloud '})
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        # Misma búsqueda normalizada: HTML desde caché, sin consultas
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'search': 'cloud'})
+        self.assertContains(response, 'Acme')
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'search': 'cloud'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.name = 'Acme Renovada'
+            self.organization.save()
+        response = self.client.get(url, {'search': 'cloud'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Acme Renovada')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_version_comes_from_the_change_log(self):
+        url = reverse('public_feed')
+        etag = self.client.get(url)['ETag']
+        # Cambio hecho por otro worker: no pasa por la caché de este proceso
+        Organization.objects.filter(pk=self.organization.pk).update(name='Acme Externa')
+        OrganizationFeedEntry.refresh([self.organization.pk])
+        OrganizationChange.objects.create(organization_id=self.organization.pk, action=OrganizationChange.UPDATED)
+        # Vence EMPRESA_DIRECTORY_VERSION_TTL
+        forget_directory_version()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Acme Externa')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_authenticated_users_get_their_own_render(self):
+        self.client.force_login(self.owner.user)
+        response = self.client.get(reverse('public_feed'))
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.context['user_profile'], self.owner)
+
+    def test_about_us_answers_not_modified(self):
+        response = self.client.get(reverse('home'))
+        response = self.client.get(reverse('home'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(EMPRESA_DIRECTORY_VERSION_TTL=60)
+class SuggestTests(TestCase):
+    def setUp(self):
+        reset_suggest_index()
+        self.addCleanup(reset_suggest_index)
+        self.owner = create_profile()
+        self.acme = create_organization(self.owner, name='Acme Software', services='Desarrollo Web, Cloud')
+        self.norte = create_organization(self.owner, name='Consultores del Norte',
+                                         services='Auditoría, Desarrollo Web')
+        self.pan = create_organization(self.owner, name='Panadería Central', services='Eventos')
+        get_suggest_index().ensure_loaded()
+
+    def suggest(self, **params):
+        # Cada tecla se responde desde memoria, sin consultas
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('organization_suggest'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_names_and_services_by_prefix(self):
+        data = self.suggest(q='desa')
+        self.assertEqual(data['services'], [{'name': 'Desarrollo Web', 'count': 2}])
+        self.assertEqual(data['names'], [])
+        # Sin tildes y desde cualquier palabra del nombre
+        self.assertEqual([name['id'] for name in self.suggest(q='panaderia')['names']], [self.pan.pk])
+        self.assertEqual([name['name'] for name in self.suggest(q='soft')['names']], ['Acme Software'])
+        self.assertEqual(len(self.suggest(q='c', limit=1)['names']), 1)
+        self.assertEqual(self.suggest(q=' ')['names'], [])
+        self.assertNotIn('index', self.suggest(q='a'))
+        self.assertEqual(self.client.get(reverse('organization_suggest'), {'limit': 'x'}).status_code, 400)
+
+    def test_stats_for_staff(self):
+        url = reverse('organization_suggest_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secreto-123'))
+        stats = self.client.get(url).json()
+        self.assertEqual(stats['organizations'], 3)
+        self.assertGreater(stats['bytes'], 0)
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.name = 'Panificadora Sur'
+            self.pan.services = 'Eventos, Desarrollo Web'
+            self.pan.save()
+        self.assertEqual([name['name'] for name in self.suggest(q='pan')['names']], ['Panificadora Sur'])
+        self.assertEqual(self.suggest(q='desarrollo')['services'], [{'name': 'Desarrollo Web', 'count': 3}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.norte.delete()
+        self.assertEqual(self.suggest(q='audit')['services'], [])
+        self.assertEqual(self.suggest(q='norte')['names'], [])
+
+    def test_index_follows_changes_from_other_processes(self):
+        # Cambios que no pasan por las señales de este proceso
+        Organization.objects.filter(pk=self.pan.pk).update(name='Panificadora Sur')
+        Organization.objects.filter(pk=self.norte.pk).delete()
+        OrganizationChange.objects.bulk_create([
+            OrganizationChange(organization_id=self.pan.pk, action=OrganizationChange.UPDATED),
+            OrganizationChange(organization_id=self.norte.pk, action=OrganizationChange.DELETED),
+        ])
+        forget_directory_version()
+        # La tecla no espera: responde con el índice anterior
+        self.assertEqual([name['name'] for name in self.suggest(q='pan')['names']], ['Panadería Central'])
+        # Lo que hace el hilo de refresh_in_background()
+        get_suggest_index()._catch_up()
+        self.assertEqual([name['name'] for name in self.suggest(q='pan')['names']], ['Panificadora Sur'])
+        self.assertEqual(self.suggest(q='norte')['names'], [])
+
+    def test_refresh_runs_in_background_at_most_once_per_interval(self):
+        index = get_suggest_index()
+        self.assertIsNone(index.refresh_in_background())
+        with override_settings(EMPRESA_SUGGEST_REFRESH_INTERVAL=0):
+            # Un solo hilo a la vez
+            index._refreshing = True
+            self.assertIsNone(index.refresh_in_background())
+            index._refreshing = False
+            thread = index.refresh_in_background()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(index._refreshing)
+
+
+class ReadReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+
+    def test_feed_reads_go_to_the_replica(self):
+        with override_settings(EMPRESA_READ_REPLICA='replica'):
+            self.assertIsNone(self.router.db_for_read(Organization))
+            with replica_reads():
+                self.assertEqual(self.router.db_for_read(Organization), 'replica')
+                self.assertEqual(read_alias(), 'replica')
+                # Usuarios y sesiones se acaban de escribir: siguen en el primario
+                self.assertIsNone(self.router.db_for_read(User))
+                self.assertEqual(self.router.db_for_write(Organization), 'default')
+            self.assertFalse(self.router.allow_migrate('replica', 'Empresa'))
+            self.assertIsNone(self.router.allow_migrate('default', 'Empresa'))
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Organization))
+            self.assertEqual(read_alias(), 'default')
+
+    def test_use_replica_marks_sync_and_async_views(self):
+        seen = []
+
+        @use_replica
+        def view(request):
+            seen.append(self.router.db_for_read(Organization))
+
+        @use_replica
+        async def async_view(request):
+            seen.append(await sync_to_async(self.router.db_for_read)(Organization))
+
+        with override_settings(EMPRESA_READ_REPLICA='replica'):
+            view(None)
+            asyncio.run(async_view(None))
+            seen.append(self.router.db_for_read(Organization))
+        self.assertEqual(seen, ['replica', 'replica', None])
+
+
+@override_settings(EMPRESA_IMAGE_WORKERS=0)
+class UploadTests(TestCase):
+    def setUp(self):
+        media_root, temp_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for path in (media_root, temp_dir):
+            self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, EMPRESA_UPLOAD_TEMP_DIR=temp_dir,
+                                              EMPRESA_UPLOAD_CHUNK_SIZE=4096)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = create_profile()
+        self.client.force_login(self.owner.user)
+
+    def edit_profile(self, **data):
+        data = dict({'first_name': 'Ana', 'last_name': 'Pérez', 'email': 'ana@example.com'}, **data)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('edit_profile'), data)
+
+    def test_size_and_dimension_limits(self):
+        with override_settings(EMPRESA_UPLOAD_MAX_SIZE=1024):
+            response = self.edit_profile(image=image_upload(exif=False))
+        self.assertContains(response, 'el máximo es 1 KB')
+        with override_settings(EMPRESA_UPLOAD_MAX_DIMENSION=600):
+            response = self.edit_profile(image=image_upload(size=(640, 480), exif=False))
+        self.assertContains(response, 'La imagen mide 640x480 px')
+        response = self.edit_profile(image=SimpleUploadedFile('foto.jpg', b'no es una imagen'))
+        self.assertContains(response, 'Cargue una imagen válida')
+        self.owner.refresh_from_db()
+        self.assertFalse(self.owner.image)
+
+    def test_image_views_keep_csrf_protection(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.owner.user)
+        self.assertEqual(client.post(reverse('edit_profile'), {'image': image_upload(exif=False)}).status_code, 403)
+        self.assertEqual(client.post(reverse('upload_start'), {'filename': 'a.jpg', 'size': 10}).status_code, 403)
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(reverse('upload_chunk', args=[upload_id]), data,
+                               content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resumable_chunked_upload(self):
+        # Ruido: el JPEG no se comprime tanto y ocupa varias partes
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (200, 150), os.urandom(200 * 150 * 3)).save(buffer, format='JPEG')
+        content = buffer.getvalue()
+        response = self.client.post(reverse('upload_start'), {'filename': 'C:\\fotos\\yo.jpg', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['id']
+        self.assertEqual(response.json()['filename'], 'yo.jpg')
+
+        self.assertEqual(self.put_chunk(upload_id, 0, content[:4096]).json()['offset'], 4096)
+        # Una parte repetida o fuera de orden responde con el offset esperado
+        response = self.put_chunk(upload_id, 0, content[:4096])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 4096))
+        self.assertEqual(self.put_chunk(upload_id, 4096, b'x' * 5000).status_code, 413)
+        # Reanudar: se consulta el offset y se envía el resto
+        offset = self.client.get(reverse('upload_chunk', args=[upload_id])).json()['offset']
+        while offset < len(content):
+            status = self.put_chunk(upload_id, offset, content[offset:offset + 4096]).json()
+            offset = status['offset']
+        self.assertTrue(status['complete'])
+
+        other = create_profile('otro')
+        self.client.force_login(other.user)
+        self.assertEqual(self.client.get(reverse('upload_chunk', args=[upload_id])).status_code, 404)
+        self.client.force_login(self.owner.user)
+
+        self.edit_profile(image_upload=upload_id)
+        self.owner.refresh_from_db()
+        self.assertTrue(self.owner.image.name.endswith('yo.jpg'))
+        with Image.open(self.owner.image.path) as image:
+            self.assertEqual(image.size, (200, 150))
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.EMPRESA_UPLOAD_TEMP_DIR), [])
+        # El id ya se usó
+        self.assertContains(self.edit_profile(image_upload=upload_id), 'vuelva a subirlo')
+
+    def test_invalid_chunked_upload_is_discarded(self):
+        response = self.client.post(reverse('upload_start'), {'filename': 'logo.exe', 'size': 10})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('upload_start'), {'filename': 'logo.png', 'size': 10 ** 9})
+        self.assertEqual(response.status_code, 413)
+        upload_id = self.client.post(reverse('upload_start'), {'filename': 'logo.png', 'size': 10}).json()['id']
+        self.assertEqual(self.put_chunk(upload_id, 0, b'0123456789').status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_replaced_and_deleted_files_are_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            organization = create_organization(self.owner, logo=image_upload('logo.jpg', exif=False))
+        first = organization.logo.path
+        thumbnails = list(Organization.objects.get(pk=organization.pk).logo_variants['webp'].values())
+        with self.captureOnCommitCallbacks(execute=True):
+            organization.logo = image_upload('nuevo.jpg', exif=False)
+            organization.save()
+        self.assertFalse(os.path.exists(first))
+        organization.refresh_from_db()
+        files = [organization.logo.path] + [organization.logo.storage.path(name)
+                                            for name in organization.logo_variants['webp'].values()]
+        self.assertFalse(any(organization.logo.storage.exists(name) for name in thumbnails))
+        with self.captureOnCommitCallbacks(execute=True):
+            organization.delete()
+        self.assertFalse(any(os.path.exists(path) for path in files))
+
+    def test_cleanup_command(self):
+        expired = ChunkedUpload.objects.create(owner=self.owner.user, filename='a.jpg', size=10)
+        ChunkedUpload.objects.filter(pk=expired.pk).update(created_at=expired.created_at - timedelta(days=2))
+        os.makedirs(settings.EMPRESA_UPLOAD_TEMP_DIR, exist_ok=True)
+        open(expired.path, 'wb').close()
+        pending = ChunkedUpload.objects.create(owner=self.owner.user, filename='b.jpg', size=10)
+        orphan = default_storage.save('uploaded/img/organization_logos/huerfano.jpg', image_upload(exif=False))
+        call_command('cleanup_uploads', orphans=True, min_age=0, stdout=io.StringIO())
+        self.assertEqual(list(ChunkedUpload.objects.all()), [pending])
+        self.assertFalse(os.path.exists(expired.path))
+        self.assertFalse(default_storage.exists(orphan))
+
+
+class FeedEntryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+
+    def test_entry_follows_saves_and_deletes(self):
+        organization = create_organization(self.owner, name='Acme', type=' Software  Libre',
+                                           services='Cloud,  Soporte ,')
+        entry = OrganizationFeedEntry.objects.get(pk=organization.pk)
+        self.assertEqual(entry.services, ['Cloud', 'Soporte'])
+        self.assertEqual(entry.type_key, 'software libre')
+        self.assertEqual(entry.search_key, organization.build_search_text())
+
+        organization.name = 'Acmé'
+        organization.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.name, 'Acmé')
+        self.assertIn('acme', entry.search_key)
+
+        organization.delete()
+        self.assertFalse(OrganizationFeedEntry.objects.exists())
+
+    def test_bulk_insert_and_rebuild_feed(self):
+        Organization.bulk_insert([
+            Organization(owner=self.owner, name='Org %d' % index, type='Salud', website='https://org.co',
+                         phone='1', nit='%d' % index, services='Nube')
+            for index in range(3)
+        ])
+        self.assertEqual(OrganizationFeedEntry.objects.count(), 3)
+
+        OrganizationFeedEntry.objects.all().delete()
+        call_command('rebuild_feed', stdout=io.StringIO())
+        self.assertEqual(OrganizationFeedEntry.objects.count(), 3)
+        response = self.client.get(reverse('public_feed'), {'type': 'salud', 'service': 'nube'})
+        self.assertEqual(response.context['total_count'], 3)
+        self.assertContains(response, 'Org 2')
+
+
+LOGIN_LIMITS = {
+    'login': [
+        {'key': 'ip', 'rate': '5/m', 'methods': ['POST']},
+        {'key': 'username', 'rate': '2/m', 'methods': ['POST']},
+    ],
+    'public_feed_page': [{'key': 'ip', 'rate': '2/h'}],
+}
+
+
+@override_settings(EMPRESA_RATE_LIMITS=LOGIN_LIMITS)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        reset_stores()
+        self.addCleanup(reset_stores)
+        self.owner = create_profile()
+
+    def login(self, username, address='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': 'incorrecta'},
+                                REMOTE_ADDR=address)
+
+    def test_token_bucket(self):
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        with self.assertRaises(ValueError):
+            parse_rate('5/semana')
+        state, wait = take_token(None, 2, 60, 100.0)
+        state, wait = take_token(state, 2, 60, 100.0)
+        self.assertEqual(wait, 0)
+        state, wait = take_token(state, 2, 60, 100.0)
+        self.assertAlmostEqual(wait, 30.0)
+        # Se rellena un token cada 30 segundos
+        state, wait = take_token(state, 2, 60, 130.0)
+        self.assertEqual(wait, 0)
+
+    def test_login_is_throttled_per_username_before_hashing(self):
+        self.assertEqual(self.login('owner').status_code, 200)
+        self.assertEqual(self.login('OWNER', address='10.0.0.2').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.login('owner', address='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+        # Otra cuenta desde la misma IP sigue pasando hasta el límite por IP
+        self.assertEqual(self.login('otra', address='10.0.0.3').status_code, 200)
+        # El GET del formulario no cuenta
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    def test_login_is_throttled_per_ip(self):
+        statuses = [self.login('usuario%d' % index).status_code for index in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+        self.assertEqual(self.login('usuario9', address='10.0.0.2').status_code, 200)
+
+    @override_settings(EMPRESA_RATE_LIMIT_PROXIES=1)
+    def test_client_ip_behind_a_proxy(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2')
+        self.assertEqual(client_ip(request), '2.2.2.2')
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='2001:db8::1')
+        self.assertEqual(client_ip(request), '2001:db8::')
+
+    @override_settings(EMPRESA_RATE_LIMIT_STORE='Apps.Empresa.ratelimit.CacheStore')
+    def test_cache_store(self):
+        cache.clear()
+        url = reverse('public_feed_page')
+        statuses = [self.client.get(url, REMOTE_ADDR=address).status_code
+                    for address in ('10.0.0.1', '10.0.0.1', '10.0.0.1', '10.0.0.2')]
+        self.assertEqual(statuses, [200, 200, 429, 200])
+
+
+class StartupTests(TestCase):
+    def test_parse_importtime_splits_phases(self):
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        300 | django.conf',
+            'import time:       180 |        180 |   django.utils',
+            'profile_startup: boot',
+            'import time:      1460 |       1460 | Apps.Empresa.export',
+            'profile_startup: first-request',
+        ])
+        self.assertEqual(parse_importtime(stderr), [
+            ('boot', 'django.conf', 120, 300, 0),
+            ('boot', 'django.utils', 180, 180, 1),
+            ('first-request', 'Apps.Empresa.export', 1460, 1460, 0),
+        ])
+
+    def test_boot_does_not_load_rare_paths(self):
+        # Proceso nuevo: en este ya se importaron todos los módulos
+        script = ('import json, sys; from ProjectOpp.wsgi import application; '
+                  'print(json.dumps([name for name in %r if name in sys.modules]))'
+                  % ['Apps.Empresa.images', 'Apps.Empresa.uploads', 'Apps.Empresa.forms', 'PIL.Image'])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(settings.BASE_DIR)] + [path for path in sys.path if path]))
+        process = subprocess.run([sys.executable, '-c', script], env=env, cwd=str(settings.BASE_DIR),
+                                 capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(process.stdout.strip().splitlines()[-1]), [])
+
+    def test_suggest_preload_modes(self):
+        reset_suggest_index()
+        self.addCleanup(reset_suggest_index)
+        with override_settings(EMPRESA_SUGGEST_PRELOAD=False):
+            self.assertIsNone(suggest.preload())
+        self.assertFalse(get_suggest_index().stats()['loaded'])
+
+        get_suggest_index().ensure_loaded()
+        with override_settings(EMPRESA_SUGGEST_PRELOAD='background'):
+            thread = suggest.preload()
+        # El arranque no espera al índice: lo construye un hilo
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(suggest._preloading)
+
+        # Un fork durante la precarga descarta el índice a medio construir
+        index = get_suggest_index()
+        suggest._preloading = True
+        suggest._discard_partial_index()
+        self.assertIsNot(get_suggest_index(), index)
+        self.assertFalse(suggest._preloading)
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.owner = create_profile()
+        self.client.force_login(self.owner.user)
+
+    def actions(self):
+        return list(OrganizationChange.objects.order_by('pk').values_list('organization_id', 'action'))
+
+    def test_views_record_changes_and_timestamps(self):
+        data = {'name': 'Acme', 'type': 'Tecnología', 'website': 'https://acme.example.com',
+                'phone': '3000000000', 'nit': '900123456-1', 'services': 'Cloud'}
+        self.client.post(reverse('create_organization'), data)
+        organization = Organization.objects.get()
+        created_at, updated_at = organization.created_at, organization.updated_at
+        self.assertIsNotNone(created_at)
+
+        self.client.post(reverse('edit_organization', args=[organization.pk]), dict(data, name='Acme SAS'))
+        organization.refresh_from_db()
+        self.assertEqual(organization.created_at, created_at)
+        self.assertGreater(organization.updated_at, updated_at)
+
+        self.client.post(reverse('delete_organization', args=[organization.pk]))
+        self.assertEqual(self.actions(), [(organization.pk, 'created'), (organization.pk, 'updated'),
+                                          (organization.pk, 'deleted')])
+        # La secuencia la asigna la base (en SQLite, el id)
+        self.assertEqual(list(OrganizationChange.objects.values_list('sequence', flat=True).order_by('pk')),
+                         list(OrganizationChange.objects.values_list('pk', flat=True).order_by('pk')))
+
+    def test_change_is_rolled_back_with_the_row(self):
+        organization = create_organization(self.owner)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            organization.name = 'Revertida'
+            organization.save(update_fields=['name'])
+            raise RuntimeError
+        self.assertEqual(self.actions(), [(organization.pk, 'created')])
+        # Borrado en cascada (con el perfil del dueño)
+        self.owner.delete()
+        self.assertEqual(self.actions(), [(organization.pk, 'created'), (organization.pk, 'deleted')])
+
+    def test_read_changes_in_batches(self):
+        acme = create_organization(self.owner, name='Acme', services='Cloud')
+        norte = create_organization(self.owner, name='Norte')
+        Organization.bulk_insert([Organization(owner=self.owner, name='Sur', type='Salud', website='',
+                                               phone='', nit='1')])
+        acme_pk = acme.pk
+        acme.delete()
+
+        with self.assertNumQueries(2):
+            batch = read_changes(0, limit=2)
+        self.assertTrue(batch.has_more)
+        # El alta de Acme trae null: la organización ya no existe
+        self.assertEqual([(change['id'], change['action'], change['organization'] and change['organization']['name'])
+                          for change in batch.changes], [(acme_pk, 'created', None), (norte.pk, 'created', 'Norte')])
+        batch = read_changes(batch.next, limit=2)
+        self.assertFalse(batch.has_more)
+        self.assertEqual([change['action'] for change in batch.changes], ['created', 'deleted'])
+        self.assertEqual(read_changes(batch.next).changes, [])
+
+        response = self.client.get(reverse('organization_changes'), {'since': batch.next - 1, 'limit': 10})
+        data = response.json()
+        self.assertEqual([change['action'] for change in data['changes']], ['deleted'])
+        self.assertEqual((data['next'], data['latest'], data['has_more']), (batch.next, batch.next, False))
+        self.assertEqual(self.client.get(reverse('organization_changes'), {'limit': '0'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('organization_changes'), {'since': 'x'}).status_code, 400)
+
+    def test_command_outputs_ndjson_and_prunes(self):
+        organization = create_organization(self.owner)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('organization_changes', since=0, stdout=out, stderr=err)
+        change = json.loads(out.getvalue())
+        self.assertEqual((change['id'], change['action'], change['organization']['nit']),
+                         (organization.pk, 'created', '900000000-1'))
+        self.assertEqual(err.getvalue().strip(), 'next=%d' % change['sequence'])
+
+        OrganizationChange.objects.update(changed_at=F('changed_at') - timedelta(days=40))
+        create_organization(self.owner, nit='2')
+        self.assertEqual(prune_changes(timedelta(days=30)), 1)
+        self.assertEqual(OrganizationChange.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'requiere Postgres (trigger diferido de la migración 0016)')
+class ChangeSequenceConcurrencyTests(TransactionTestCase):
+    def test_sequence_is_assigned_at_commit_without_blocking_other_writers(self):
+        owner = create_profile()
+        first = create_organization(owner, name='Primera')
+        started, release = threading.Event(), threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    OrganizationChange.record([first], OrganizationChange.UPDATED)
+                    started.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=slow_writer)
+        thread.start()
+        self.assertTrue(started.wait(5))
+        # Con el lock tomado al insertar, esta escritura esperaría a la transacción abierta
+        second = create_organization(owner, name='Segunda')
+        release.set()
+        thread.join(5)
+        # La secuencia sigue el orden de los commits, no el de los inserts
+        changes = list(OrganizationChange.objects.after(0).values_list('organization_id', 'action'))
+        self.assertEqual(changes[-2:], [(second.pk, 'created'), (first.pk, 'updated')])
+        self.assertFalse(OrganizationChange.objects.filter(sequence__isnull=True).exists())
+
+class CardComponentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization = create_organization(self.owner, name='Acme', services='Cloud, Soporte')
+
+    def test_feed_and_owner_list_share_the_card(self):
+        response = self.client.get(reverse('public_feed'))
+        self.assertContains(response, '<span class="badge bg-primary me-1 mb-1">Soporte</span>', html=True)
+        self.assertNotContains(response, reverse('edit_organization', args=[self.organization.pk]))
+
+        self.client.force_login(self.owner.user)
+        response = self.client.get(reverse('organization_list'))
+        self.assertContains(response, '900000000-1')
+        self.assertContains(response, reverse('edit_organization', args=[self.organization.pk]))
+        self.assertContains(response, reverse('delete_organization', args=[self.organization.pk]))
+
+    def test_card_html_is_cached_by_version(self):
+        organizations = [self.organization]
+        card_context(organizations)
+        self.assertIn('Acme', render_cards(organizations))
+        # Sin cambio de versión se usa el HTML guardado
+        self.organization.name = 'Sin guardar'
+        self.assertIn('Acme', render_cards(organizations))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.organization.save()
+        card_context(organizations)
+        self.assertIn('Sin guardar', render_cards(organizations))
+
+
+def image_upload(name='foto.jpg', size=(640, 480), exif=True):
+    image = Image.new('RGB', size, 'red')
+    options = {}
+    if exif:
+        metadata = Image.Exif()
+        metadata[0x010F] = 'Camara de prueba'  # Make
+        options['exif'] = metadata.tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', **options)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(EMPRESA_IMAGE_WORKERS=0)
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = create_profile()
+
+    def test_profile_photo_gets_thumbnails_without_exif(self):
+        self.client.force_login(self.owner.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_profile'), {
+                'first_name': 'Ana', 'last_name': 'Pérez', 'email': 'ana@example.com',
+                'image': image_upload(),
+            })
+        self.owner.refresh_from_db()
+        variants = self.owner.image_variants
+        self.assertEqual(variants['source'], self.owner.image.name)
+        self.assertEqual(sorted(variants['webp'], key=int), ['64', '150', '300'])
+        with Image.open(self.owner.image.path) as original:
+            self.assertFalse(original.getexif())
+        with Image.open(self.owner.image.storage.path(variants['webp']['150'])) as thumbnail:
+            self.assertEqual(thumbnail.format, 'WEBP')
+            self.assertEqual(thumbnail.width, 150)
+
+        image_set = self.owner.get_image_variants
+        self.assertIn('150w', image_set.webp_srcset)
+        self.assertTrue(image_set.src.endswith('-64.jpg'))
+        self.assertContains(self.client.get(reverse('dashboard')), 'image/webp')
+
+    def test_profile_variants_invalidate_the_cached_user(self):
+        self.client.force_login(self.owner.user)
+        name = default_storage.save('profile_photos/foto.jpg', image_upload())
+        UserProfile.objects.filter(pk=self.owner.pk).update(image=name)
+        self.client.get(reverse('dashboard'))
+        self.assertIsNotNone(cache.get(USER_KEY % self.owner.user_id))
+        process_image('Empresa.UserProfile', self.owner.pk)
+        self.assertIsNone(cache.get(USER_KEY % self.owner.user_id))
+        self.assertContains(self.client.get(reverse('dashboard')), 'image/webp')
+
+    def test_variants_of_a_replaced_logo_are_not_used(self):
+        organization = create_organization(self.owner, logo=image_upload('logo.jpg', exif=False))
+        saved_at = Organization.objects.get(pk=organization.pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            organization.save()
+        organization.refresh_from_db()
+        self.assertIn('100w', organization.get_logo_variants.srcset)
+        self.assertEqual(OrganizationFeedEntry.objects.get(pk=organization.pk).logo_srcset,
+                         organization.get_logo_variants.srcset)
+        # Las miniaturas cuentan como un cambio para los consumidores incrementales
+        self.assertGreater(organization.updated_at, saved_at)
+        self.assertEqual(list(OrganizationChange.objects.order_by('pk').values_list('action', flat=True)),
+                         ['created', 'updated', 'updated'])
+        organization.logo = image_upload('otro.jpg', exif=False)
+        self.assertEqual(organization.get_logo_variants.srcset, '')
+        self.assertEqual(organization.get_logo_variants.src, organization.logo.url)
+
+    def test_exif_is_removed_without_recompressing(self):
+        upload = image_upload()
+        name = default_storage.save('profile_photos/foto.jpg', upload)
+        UserProfile.objects.filter(pk=self.owner.pk).update(image=name)
+        with Image.open(default_storage.path(name)) as original:
+            pixels = original.tobytes()
+        process_image('Empresa.UserProfile', self.owner.pk)
+        self.owner.refresh_from_db()
+        # El original se borra solo cuando la fila ya apunta al archivo limpio
+        self.assertNotEqual(self.owner.image.name, name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(self.owner.image_variants['source'], self.owner.image.name)
+        with Image.open(self.owner.image.path) as cleaned:
+            self.assertEqual((cleaned.format, cleaned.tobytes()), ('JPEG', pixels))
+            self.assertFalse(cleaned.getexif())
+
+    def test_rotated_png_is_rewritten_without_loss(self):
+        image = Image.frombytes('RGB', (40, 20), os.urandom(40 * 20 * 3))
+        metadata = Image.Exif()
+        metadata[0x0112] = 6  # Girar 90 grados
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', exif=metadata.tobytes())
+        name = default_storage.save('profile_photos/foto.png', SimpleUploadedFile('foto.png', buffer.getvalue()))
+        UserProfile.objects.filter(pk=self.owner.pk).update(image=name)
+        process_image('Empresa.UserProfile', self.owner.pk)
+        self.owner.refresh_from_db()
+        with Image.open(self.owner.image.path) as cleaned:
+            self.assertEqual(cleaned.format, 'PNG')
+            self.assertFalse(cleaned.getexif())
+            self.assertEqual(cleaned.tobytes(), image.transpose(Image.Transpose.ROTATE_270).tobytes())
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_profile()
+        self.client.force_login(self.owner.user)
+
+    def test_report_headers_and_budget_violation(self):
+        response = self.client.get(reverse('dashboard_feed'))
+        self.assertLessEqual(int(response['X-Query-Count']), settings.EMPRESA_QUERY_BUDGETS['dashboard_feed'])
+        with override_settings(EMPRESA_QUERY_BUDGETS={'dashboard_feed': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('dashboard_feed'))
+
+    def test_report_rotates_at_its_size_cap(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'query_report.jsonl')
+        with override_settings(EMPRESA_QUERY_REPORT_PATH=path, EMPRESA_QUERY_REPORT_MAX_BYTES=100):
+            for index in range(4):
+                append_report({'url_name': 'dashboard', 'queries': index, 'padding': 'x' * 40})
+        # Cada línea ocupa unos 75 bytes: el archivo se rota al pasar de 100
+        for name, expected in ((path + '.1', [0, 1]), (path, [2, 3])):
+            with open(name, encoding='utf-8') as handle:
+                self.assertEqual([json.loads(line)['queries'] for line in handle], expected)
+
+    def test_duplicates_and_n_plus_one_are_detected(self):
+        stats = RequestStats()
+        stats.queries = [('SELECT 1 WHERE id = %s', repr((pk,))) for pk in range(5)]
+        stats.queries.append(stats.queries[0])
+        self.assertEqual(stats.duplicates(), 1)
+        self.assertEqual(stats.n_plus_one(), ['SELECT 1 WHERE id = %s'])
@@ -0,0 +1,322 @@
+"""
+Carga de logos y fotos de perfil.
+
+* ``LimitedUploadHandler`` cuenta los bytes de cada archivo mientras llega:
+  si supera ``EMPRESA_UPLOAD_MAX_SIZE`` descarta el resto sin escribirlo en
+  memoria ni en archivos temporales. Solo lo usan las vistas con imágenes
+  (``_limit_upload_size`` en views.py), no ``FILE_UPLOAD_HANDLERS``.
+* ``LimitedImageField`` rechaza archivos grandes por su tamaño y luego lee
+  solo la cabecera de la imagen (formato y dimensiones) sin decodificarla
+  completa; el decodificado lo hace después ``images.process_image``.
+* Cargas por partes reanudables (``api/uploads/``): el cliente crea la carga
+  con el nombre y el tamaño, envía las partes con ``PUT`` y la cabecera
+  ``Upload-Offset`` y, si se corta la conexión, consulta con ``GET`` desde
+  dónde seguir. Cada parte se escribe directo al archivo de la carga en
+  ``EMPRESA_UPLOAD_TEMP_DIR``; al guardar el formulario (campo oculto
+  ``<campo>_upload``) el archivo se mueve al almacenamiento sin copiarlo.
+* Los archivos reemplazados o de organizaciones y perfiles borrados se
+  eliminan al confirmar la transacción (ver ``signals.py``). El comando
+  ``cleanup_uploads`` borra cargas vencidas y archivos huérfanos.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+
+from .images import delete_variants
+
+logger = logging.getLogger(__name__)
+
+# Cargas por partes sin terminar que puede tener un usuario a la vez
+MAX_PENDING_UPLOADS = 5
+# Bytes que se leen de la petición en cada escritura de una parte
+READ_SIZE = 64 * 1024
+
+# Formatos aceptados (los que images.process_image sabe convertir)
+IMAGE_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'GIF': 'image/gif'}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+
+def get_max_size():
+    return getattr(settings, 'EMPRESA_UPLOAD_MAX_SIZE', 5 * 1024 * 1024)
+
+
+def get_max_dimension():
+    return getattr(settings, 'EMPRESA_UPLOAD_MAX_DIMENSION', 4096)
+
+
+def get_chunk_size():
+    return getattr(settings, 'EMPRESA_UPLOAD_CHUNK_SIZE', 512 * 1024)
+
+
+def get_expiry():
+    return getattr(settings, 'EMPRESA_UPLOAD_EXPIRY', 60 * 60 * 24)
+
+
+def get_temp_dir():
+    return str(getattr(settings, 'EMPRESA_UPLOAD_TEMP_DIR', settings.BASE_DIR / 'upload_chunks'))
+
+
+def size_error(size):
+    return ValidationError(
+        'El archivo pesa %(size)d KB; el máximo es %(max)d KB.',
+        code='file_too_large', params={'size': size // 1024, 'max': get_max_size() // 1024},
+    )
+
+
+class OversizedUpload(UploadedFile):
+    """Archivo descartado por ``LimitedUploadHandler``: solo conserva su tamaño"""
+
+    def __init__(self, name, content_type, size, charset=None):
+        super().__init__(None, name, content_type, size, charset)
+
+    def open(self, mode=None):
+        raise ValidationError('El archivo fue descartado por su tamaño.', code='file_too_large')
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Se agrega primero en ``request.upload_handlers``: corta los archivos demasiado grandes"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > get_max_size():
+            # None: los handlers siguientes no reciben (ni guardan) el resto
+            self.exceeded = True
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.exceeded:
+            return OversizedUpload(self.file_name, self.content_type, self.received, self.charset)
+        return None
+
+
+def read_image_header(file):
+    """Retorna ``(formato, ancho, alto)`` leyendo solo la cabecera de la imagen"""
+    from PIL import Image, UnidentifiedImageError
+
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        with Image.open(file) as image:
+            # open() no decodifica los píxeles; load() no se llama
+            return image.format, image.width, image.height
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError('Cargue una imagen válida (JPEG, PNG, WebP o GIF).', code='invalid_image')
+    finally:
+        if position is not None:
+            file.seek(position)
+
+
+def validate_image(file):
+    """Límites de tamaño, formato y dimensiones antes de cualquier decodificado"""
+    if file.size is not None and file.size > get_max_size():
+        raise size_error(file.size)
+    image_format, width, height = read_image_header(file)
+    if image_format not in IMAGE_FORMATS:
+        raise ValidationError('Cargue una imagen válida (JPEG, PNG, WebP o GIF).', code='invalid_image')
+    limit = get_max_dimension()
+    if width > limit or height > limit:
+        raise ValidationError(
+            'La imagen mide %(width)dx%(height)d px; el máximo es %(limit)d px por lado.',
+            code='image_too_large', params={'width': width, 'height': height, 'limit': limit},
+        )
+    return image_format
+
+
+class LimitedImageField(forms.ImageField):
+    """``ImageField`` que valida con ``validate_image`` en vez de ``Image.verify()``"""
+
+    def to_python(self, data):
+        file = forms.FileField.to_python(self, data)
+        if file is None:
+            return None
+        if isinstance(file, OversizedUpload):
+            raise size_error(file.size)
+        file.content_type = IMAGE_FORMATS[validate_image(file)]
+        return file
+
+
+class AssembledUpload(UploadedFile):
+    """Archivo de una carga por partes ya completa. ``temporary_file_path``
+    permite a ``FileSystemStorage`` moverlo en vez de copiarlo"""
+
+    def __init__(self, path, name, size):
+        super().__init__(open(path, 'rb'), name, None, size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class UploadConflict(Exception):
+    """La parte no empieza donde termina lo recibido (o la carga ya terminó)"""
+
+    def __init__(self, upload):
+        super().__init__('La carga %s espera el byte %d' % (upload.pk, upload.offset))
+        self.upload = upload
+
+
+def upload_status(upload):
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'complete': upload.is_complete,
+        'chunk_size': get_chunk_size(),
+    }
+
+
+def start_upload(owner, filename, size):
+    """Crea una carga por partes; valida nombre y tamaño antes de recibir datos"""
+    from .models import ChunkedUpload
+
+    filename = os.path.basename(filename.replace('\\', '/')).strip()[-255:]
+    if not filename.lower().endswith(IMAGE_EXTENSIONS):
+        raise ValidationError('Solo se aceptan imágenes JPEG, PNG, WebP o GIF.', code='invalid_extension')
+    if size <= 0:
+        raise ValidationError('El tamaño del archivo debe ser positivo.', code='invalid_size')
+    if size > get_max_size():
+        raise size_error(size)
+    if ChunkedUpload.objects.filter(owner=owner, completed_at__isnull=True).count() >= MAX_PENDING_UPLOADS:
+        raise ValidationError('Hay demasiadas cargas sin terminar; espere a que venzan.', code='too_many_uploads')
+    return ChunkedUpload.objects.create(owner=owner, filename=filename, size=size)
+
+
+def write_chunk(upload, offset, stream, length):
+    """Escribe en el archivo de la carga ``length`` bytes de ``stream`` desde
+    ``offset`` sin guardarlos en memoria. Al recibir el último byte se valida
+    la cabecera de la imagen; si no es válida la carga se descarta"""
+    if length <= 0:
+        raise ValidationError('La parte está vacía.', code='empty_chunk')
+    if length > get_chunk_size():
+        raise ValidationError('Las partes no pueden superar %(max)d KB.', code='chunk_too_large',
+                              params={'max': get_chunk_size() // 1024})
+    if offset + length > upload.size:
+        raise ValidationError('La parte supera el tamaño declarado del archivo.', code='chunk_too_large')
+    if upload.is_complete or offset != upload.offset:
+        # Sin leer el cuerpo; se vuelve a verificar con el lock
+        raise UploadConflict(upload)
+    os.makedirs(get_temp_dir(), exist_ok=True)
+    # La parte se recibe antes de la transacción: un cliente lento no retiene
+    # una conexión a la base ni el lock de la carga mientras envía
+    with tempfile.TemporaryFile(dir=get_temp_dir()) as chunk:
+        received = 0
+        while received < length:
+            data = stream.read(min(READ_SIZE, length - received))
+            if not data:
+                break
+            chunk.write(data)
+            received += len(data)
+        chunk.seek(0)
+        with transaction.atomic():
+            # Dos partes de la misma carga no se escriben a la vez
+            upload = type(upload).objects.select_for_update().get(pk=upload.pk)
+            if upload.is_complete or offset != upload.offset:
+                raise UploadConflict(upload)
+            with open(upload.path, 'r+b' if os.path.exists(upload.path) else 'wb') as part:
+                # Descarta restos de una parte anterior que no llegó completa
+                part.seek(offset)
+                part.truncate()
+                shutil.copyfileobj(chunk, part, READ_SIZE)
+            # Si la conexión se cortó se conserva lo recibido y el cliente sigue desde ahí
+            upload.offset = offset + received
+            if upload.offset == upload.size:
+                upload.completed_at = timezone.now()
+            upload.save(update_fields=['offset', 'completed_at'])
+
+    if upload.is_complete:
+        try:
+            with upload.as_file() as file:
+                validate_image(file)
+        except ValidationError:
+            upload.delete_file()
+            upload.delete()
+            raise
+    return upload
+
+
+class ChunkedUploadFormMixin:
+    """Agrega ``<campo>_upload`` (id de una carga por partes completa) a los
+    formularios con imagen. El dueño de las cargas se pasa con ``uploader``"""
+    upload_attribute = None
+
+    def __init__(self, *args, uploader=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploader = uploader
+        self._used_uploads = []
+        if self.upload_attribute:
+            self.fields['%s_upload' % self.upload_attribute] = forms.UUIDField(
+                required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        from .models import ChunkedUpload
+
+        cleaned_data = super().clean()
+        upload_id = cleaned_data.get('%s_upload' % self.upload_attribute) if self.upload_attribute else None
+        if not upload_id:
+            return cleaned_data
+        upload = None
+        if self.uploader is not None:
+            upload = ChunkedUpload.objects.complete().filter(pk=upload_id, owner=self.uploader).first()
+        if upload is None or not os.path.isfile(upload.path):
+            self.add_error(self.upload_attribute, 'La carga del archivo no existe o no terminó; vuelva a subirlo.')
+            return cleaned_data
+        cleaned_data[self.upload_attribute] = upload.as_file()
+        self._used_uploads.append(upload.pk)
+        return cleaned_data
+
+    def forget_uploads(self):
+        """Borra las cargas que el formulario ya guardó"""
+        if self._used_uploads:
+            from .models import ChunkedUpload
+            ChunkedUpload.objects.filter(pk__in=self._used_uploads).delete()
+            self._used_uploads = []
+
+
+def delete_files(storage, names, variants=None):
+    """Borra archivos de un almacenamiento y las miniaturas de ``variants``"""
+    for name in names:
+        if name:
+            storage.delete(name)
+    delete_variants(storage, variants)
+
+
+def remember_file(instance, previous):
+    """Guarda la imagen y las miniaturas de la fila (``{campo: ..., campo_variants: ...}``)
+    antes de guardar la instancia"""
+    attribute = instance.getCropAttribute()
+    instance._previous_file = (previous.get(attribute) or '', previous.get('%s_variants' % attribute))
+
+
+def delete_replaced_file(instance):
+    """Al confirmar, borra la imagen anterior y sus miniaturas si la imagen cambió"""
+    previous, variants = getattr(instance, '_previous_file', ('', None))
+    instance._previous_file = ('', None)
+    field_file = getattr(instance, instance.getCropAttribute())
+    if previous and previous != field_file.name:
+        storage = field_file.storage
+        transaction.on_commit(lambda: delete_files(storage, [previous], variants))
+
+
+def delete_instance_files(instance):
+    """Al confirmar, borra la imagen y las miniaturas de una instancia borrada"""
+    attribute = instance.getCropAttribute()
+    field_file = getattr(instance, attribute)
+    variants = getattr(instance, '%s_variants' % attribute)
+    if field_file or variants:
+        storage, name = field_file.storage, field_file.name
+        transaction.on_commit(lambda: delete_files(storage, [name], variants))
@@ -1,14 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Con EMPRESA_ASYNC_VIEWS (bajo ASGI) las vistas de lectura de los feeds usan
+# las versiones asíncronas de async_views.py
+feed_views = async_views if getattr(settings, 'EMPRESA_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('', views.login_view, name='login'),
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('login/', views.login_view, name='login'),
+    path('dashboard/', feed_views.dashboard, name='dashboard'),
     path('organizations/', views.organization_list, name='organization_list'),
     path('organizations/create/', views.create_organization, name='create_organization'),
     path('organizations/<int:pk>/edit/', views.edit_organization, name='edit_organization'),
     path('organizations/<int:pk>/delete/', views.delete_organization, name='delete_organization'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
-    path('feed/', views.public_feed, name='public_feed'),
-    path('dashboard/feed/', views.dashboard_feed, name='dashboard_feed'),
-] 
\ No newline at end of file
+    path('feed/', feed_views.public_feed, name='public_feed'),
+    path('dashboard/feed/', feed_views.dashboard_feed, name='dashboard_feed'),
+    path('feed/page/', feed_views.public_feed_page, name='public_feed_page'),
+    path('dashboard/feed/page/', feed_views.dashboard_feed_page, name='dashboard_feed_page'),
+    path('api/organizations/export/', views.organization_export, name='organization_export'),
+    path('api/organizations/changes/', views.organization_changes, name='organization_changes'),
+    path('api/suggest/', views.organization_suggest, name='organization_suggest'),
+    path('api/suggest/stats/', views.organization_suggest_stats, name='organization_suggest_stats'),
+    path('api/uploads/', views.upload_start, name='upload_start'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+]
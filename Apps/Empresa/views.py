@@ -1,27 +1,58 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate
+from functools import wraps
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
-from django.db.models import Q
-from .models import UserProfile, Organization
-from .forms import OrganizationForm, UserProfileForm
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
+from .models import ChunkedUpload, UserProfile, Organization
+from .caching import cached_feed_page, card_context, get_recent_organizations
+from .facets import facet_context, parse_facets
+from .page_cache import anonymous_page_cache, feed_key
+from .routers import use_replica
+from .pagination import paginate_organizations, paginate_search
+from .search import parse_query
+from .suggest import MAX_LIMIT, get_max_age, get_suggest_index
+
+# El login, los formularios con imagen, las cargas por partes, la exportación y los
+# cambios se importan dentro de sus vistas: son rutas poco usadas y así no se
+# cargan al arrancar un worker
 
 # Create your views here.
 
+def _limit_upload_size(view):
+    """Corta con ``LimitedUploadHandler`` los archivos de más de
+    ``EMPRESA_UPLOAD_MAX_SIZE`` solo en las vistas de logos y fotos (la
+    importación del admin acepta archivos más grandes). El handler se agrega
+    antes de leer ``request.POST``: por eso CSRF se verifica aquí y no en el
+    middleware, que leería el formulario primero"""
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        from .uploads import LimitedUploadHandler
+        request.upload_handlers.insert(0, LimitedUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
 def login_view(request):
+    from django.contrib.auth.forms import AuthenticationForm
     if request.method == 'POST':
+        # Los intentos por IP y por usuario están limitados (Apps/Empresa/ratelimit.py)
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                return redirect('dashboard')
-            else:
-                messages.error(request, "Usuario o contraseña inválidos.")
+            # is_valid() ya autenticó: no se vuelve a hashear la contraseña
+            login(request, form.get_user())
+            return redirect('dashboard')
         else:
             messages.error(request, "Usuario o contraseña inválidos.")
     form = AuthenticationForm()
@@ -31,16 +62,17 @@ def login_view(request):
 def dashboard(request):
     try:
         user_profile = request.user.profile
-        organization = user_profile.organizations.first()  # Obtiene la primera organización
+        organization = user_profile.feed_entries.first()  # Obtiene la primera organización
         
-        # Obtener las 6 organizaciones más recientes
-        recent_organizations = Organization.objects.all().order_by('-id')[:6]
+        # Obtener las 6 organizaciones más recientes (cacheadas)
+        recent_organizations = get_recent_organizations()
         
         context = {
             'user_profile': user_profile,
             'organization': organization,
             'recent_organizations': recent_organizations,
         }
+        context.update(card_context(recent_organizations))
         return render(request, 'dashboard.html', context)
     except UserProfile.DoesNotExist:
         # Si el usuario no tiene perfil, crear uno
@@ -50,29 +82,34 @@ def dashboard(request):
             first_name=request.user.first_name,
             last_name=request.user.last_name
         )
-        # Obtener las 6 organizaciones más recientes
-        recent_organizations = Organization.objects.all().order_by('-id')[:6]
+        # Obtener las 6 organizaciones más recientes (cacheadas)
+        recent_organizations = get_recent_organizations()
         
         context = {
             'user_profile': user_profile,
             'organization': None,
             'recent_organizations': recent_organizations,
         }
+        context.update(card_context(recent_organizations))
         return render(request, 'dashboard.html', context)
 
 @login_required
 def organization_list(request):
-    organizations = request.user.profile.organizations.all()
+    organizations = request.user.profile.organizations.for_owner_list()
     return render(request, 'organization/list.html', {'organizations': organizations})
 
+@_limit_upload_size
 @login_required
 def create_organization(request):
+    from .forms import OrganizationForm
+
     if request.method == 'POST':
-        form = OrganizationForm(request.POST, request.FILES)
+        form = OrganizationForm(request.POST, request.FILES, uploader=request.user)
         if form.is_valid():
             organization = form.save(commit=False)
             organization.owner = request.user.profile
             organization.save()
+            form.save_m2m()
             messages.success(request, "Organización creada exitosamente.")
             return redirect('organization_list')
     else:
@@ -80,12 +117,15 @@ def create_organization(request):
     
     return render(request, 'organization/create.html', {'form': form})
 
+@_limit_upload_size
 @login_required
 def edit_organization(request, pk):
+    from .forms import OrganizationForm
+
     organization = get_object_or_404(Organization, pk=pk, owner=request.user.profile)
     
     if request.method == 'POST':
-        form = OrganizationForm(request.POST, request.FILES, instance=organization)
+        form = OrganizationForm(request.POST, request.FILES, instance=organization, uploader=request.user)
         if form.is_valid():
             form.save()
             messages.success(request, "Organización actualizada exitosamente.")
@@ -109,8 +149,11 @@ def delete_organization(request, pk):
     
     return render(request, 'organization/delete.html', {'organization': organization})
 
+@_limit_upload_size
 @login_required
 def edit_profile(request):
+    from .forms import UserProfileForm
+
     try:
         profile = request.user.profile
     except UserProfile.DoesNotExist:
@@ -122,7 +165,7 @@ def edit_profile(request):
         )
 
     if request.method == 'POST':
-        form = UserProfileForm(request.POST, request.FILES, instance=profile)
+        form = UserProfileForm(request.POST, request.FILES, instance=profile, uploader=request.user)
         if form.is_valid():
             form.save()
             messages.success(request, "Perfil actualizado exitosamente.")
@@ -135,36 +178,54 @@ def edit_profile(request):
         'profile': profile
     })
 
-def public_feed(request):
+def _feed_page(request, fragment_url_name):
+    """Página de organizaciones del feed según ``search``, ``cursor`` y las facetas"""
     search_query = request.GET.get('search', '')
-    organizations = Organization.objects.all()
-    
-    if search_query:
-        # Dividir la búsqueda en términos individuales
-        search_terms = [term.strip() for term in search_query.split(',')]
-        # Inicializar query vacío
-        query = Q()
-        
-        # Agregar cada término a la búsqueda
-        for term in search_terms:
-            query |= (
-                Q(name__icontains=term) |
-                Q(services__icontains=term) |
-                Q(type__icontains=term)
-            )
-        
-        organizations = organizations.filter(query).distinct()
+    cursor = request.GET.get('cursor')
+    facets = parse_facets(request.GET)
+
+    def build_page():
+        if parse_query(search_query):
+            # Los términos separados por comas se resuelven en el motor de búsqueda,
+            # que retorna los ids ordenados por relevancia
+            return paginate_search(search_query, cursor, facets=facets)
+        return paginate_organizations(cursor, facets=facets)
+
+    if request.user.is_authenticated:
+        page = build_page()
+    else:
+        # Los visitantes anónimos comparten las páginas cacheadas por búsqueda y facetas
+        page = cached_feed_page(search_query, cursor, build_page, facets)
+
+    context = _feed_context(page, search_query, fragment_url_name, facets)
+    context.update(card_context(page.organizations))
+    return context
 
-    context = {
-        'organizations': organizations,
+def _feed_context(page, search_query, fragment_url_name, facets):
+    next_url = None
+    if page.next_cursor:
+        params = [('cursor', page.next_cursor)]
+        if search_query:
+            params.append(('search', search_query))
+        next_url = '%s?%s' % (reverse(fragment_url_name), urlencode(params + facets.params()))
+    return {
+        'organizations': page.organizations,
+        'total_count': page.total_count,
+        'next_url': next_url,
         'search_query': search_query,
     }
 
+@use_replica
+@anonymous_page_cache(feed_key)
+def public_feed(request):
+    context = _feed_page(request, 'public_feed_page')
+    context.update(facet_context(parse_facets(request.GET), context['search_query'], reverse('public_feed')))
+
     # Si el usuario está autenticado, usar el template con sidebar
     if request.user.is_authenticated:
         try:
             user_profile = request.user.profile
-            organization = user_profile.organizations.first()
+            organization = user_profile.feed_entries.first()
             context.update({
                 'user_profile': user_profile,
                 'organization': organization,
@@ -174,18 +235,131 @@ def public_feed(request):
 
     return render(request, 'organization/public_feed.html', context)
 
+@use_replica
+def public_feed_page(request):
+    # Fragmento con la siguiente tanda de tarjetas para el scroll infinito
+    return render(request, 'organization/feed_cards.html', _feed_page(request, 'public_feed_page'))
+
 @login_required
 def dashboard_feed(request):
     try:
         user_profile = request.user.profile
-        organization = user_profile.organizations.first()
-        organizations = Organization.objects.all().order_by('-id')
+        organization = user_profile.feed_entries.first()
         
-        context = {
+        context = _feed_page(request, 'dashboard_feed_page')
+        context.update({
             'user_profile': user_profile,
             'organization': organization,
-            'organizations': organizations,
-        }
+        })
         return render(request, 'organization/dashboard_feed.html', context)
     except UserProfile.DoesNotExist:
         return redirect('dashboard')
+
+@login_required
+def dashboard_feed_page(request):
+    return render(request, 'organization/feed_cards.html', _feed_page(request, 'dashboard_feed_page'))
+
+def _export_etag(request):
+    from .export import export_etag
+    return export_etag(request.GET)
+
+@require_GET
+@condition(etag_func=_export_etag)
+def organization_export(request):
+    # Exportación del directorio en streaming (ver Apps/Empresa/export.py)
+    from .export import FORMATS, export_queryset, parse_export_params, stream_json, stream_ndjson
+
+    try:
+        export_format, since_id = parse_export_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest("Parámetros inválidos: use format=ndjson|json y since_id=<id>.")
+    stream = stream_ndjson if export_format == 'ndjson' else stream_json
+    return StreamingHttpResponse(
+        stream(export_queryset(since_id)),
+        content_type='%s; charset=utf-8' % FORMATS[export_format],
+    )
+
+@require_GET
+def organization_changes(request):
+    # Cambios posteriores a ?since=<secuencia> en lotes (ver Apps/Empresa/changes.py).
+    # Sin use_replica: con una réplica atrasada el consumidor se saltaría cambios
+    from .changes import MAX_LIMIT as MAX_CHANGES, latest_sequence, parse_change_params, read_changes
+
+    try:
+        since, limit = parse_change_params(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest(
+            "Parámetros inválidos: use since=<secuencia> y limit entre 1 y %d." % MAX_CHANGES)
+    batch = read_changes(since, limit)
+    return JsonResponse({
+        'changes': batch.changes,
+        'next': batch.next,
+        'has_more': batch.has_more,
+        'latest': latest_sequence(),
+    })
+
+@require_GET
+def organization_suggest(request):
+    # Autocompletado del buscador desde el índice en memoria (ver Apps/Empresa/suggest.py)
+    try:
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    except ValueError:
+        limit = 0
+    if limit is not None and not 1 <= limit <= MAX_LIMIT:
+        return HttpResponseBadRequest("Parámetro inválido: limit debe estar entre 1 y %d." % MAX_LIMIT)
+    query = request.GET.get('q', '')
+    names, services = get_suggest_index().suggest(query, limit=limit)
+    response = JsonResponse({
+        'query': query,
+        'names': [{'id': pk, 'name': name} for pk, name in names],
+        'services': [{'name': name, 'count': count} for name, count in services],
+    })
+    patch_cache_control(response, public=True, max_age=get_max_age())
+    return response
+
+@staff_member_required
+@require_GET
+def organization_suggest_stats(request):
+    # Entradas y memoria del índice de sugerencias de este proceso (diagnóstico)
+    return JsonResponse(get_suggest_index().stats())
+
+def _upload_error(error):
+    status = 413 if error.code in ('file_too_large', 'chunk_too_large') else 400
+    return JsonResponse({'error': ' '.join(error.messages)}, status=status)
+
+@_limit_upload_size
+@login_required
+@require_POST
+def upload_start(request):
+    # Carga por partes reanudable de logos y fotos (ver Apps/Empresa/uploads.py)
+    from .uploads import start_upload, upload_status
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro inválido: size debe ser un número.'}, status=400)
+    try:
+        upload = start_upload(request.user, request.POST.get('filename', ''), size)
+    except ValidationError as error:
+        return _upload_error(error)
+    return JsonResponse(upload_status(upload), status=201)
+
+@_limit_upload_size
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def upload_chunk(request, upload_id):
+    # GET: desde qué byte seguir; PUT: la siguiente parte con la cabecera Upload-Offset
+    from .uploads import UploadConflict, upload_status, write_chunk
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id, owner=request.user)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Falta la cabecera Upload-Offset.'}, status=400)
+        try:
+            upload = write_chunk(upload, offset, request, length)
+        except UploadConflict as conflict:
+            return JsonResponse(upload_status(conflict.upload), status=409)
+        except ValidationError as error:
+            return _upload_error(error)
+    return JsonResponse(upload_status(upload))
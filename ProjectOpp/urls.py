@@ -13,12 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth.views import LogoutView
 from home.views import about_us
 from django.conf import settings
 from django.conf.urls.static import static
+from Apps.Empresa import assets
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,3 +29,7 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(next_page='login'), name='logout'),
     path('', include('Apps.Empresa.urls')),  # Incluye todas las URLs de la aplicación Empresa
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if settings.EMPRESA_SERVE_STATIC:
+    urlpatterns.insert(0, re_path(r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+                                  assets.serve, name='static'))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ProjectOpp.settings')
 
 application = get_wsgi_application()
+
+# Índice en memoria de las sugerencias del buscador (Apps/Empresa/suggest.py)
+from Apps.Empresa.suggest import preload  # noqa: E402
+
+preload()
@@ -1,4 +1,8 @@
 from django.shortcuts import render
 
+from Apps.Empresa.page_cache import anonymous_page_cache
+
+
+@anonymous_page_cache()
 def about_us(request):
-    return render(request, 'home/about_us.html') 
\ No newline at end of file
+    return render(request, 'home/about_us.html')